@@ -16,6 +16,7 @@ a = Analysis(
         'PySide6.QtGui',
         'PySide6.QtWidgets',
         'websockets',
+        'msgpack',
         'pyotp',
         'qrcode',
         'cryptography',
@@ -23,7 +24,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # NumPy is only for load-test simulations (requirements-dev.txt); the app
+    # falls back to plain Python without it, so keep it out of the bundle
+    excludes=['numpy'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     noarchive=False,
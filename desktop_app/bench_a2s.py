@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark A2S server queries against local mock servers
+
+Starts `--servers` mock A2S responders on loopback, each with `--players`
+players and an optional reply delay, then queries all of them from one
+A2SClient socket for `--rounds` rounds (A2S_INFO, or A2S_INFO plus
+A2S_PLAYER). Reports queries per second and per-round latency; needs no
+network access.
+
+Usage:
+  python bench_a2s.py [--servers 50] [--players 64] [--delay-ms 0] [--rounds 20] [--players-query]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.a2s import A2SClient
+from core.a2s_mock import MockA2SServer
+
+
+async def run(servers, players, delay, rounds, players_query):
+    """Returns (per-round seconds, queries, client stats)"""
+    mocks = [MockA2SServer(name=f"Mock server {i}", players=[f"Player {p}" for p in range(players)],
+                           delay=delay)
+             for i in range(servers)]
+    addresses = [await mock.start() for mock in mocks]
+    client = await A2SClient().open()
+    round_times = []
+    queries = 0
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            results = await client.query_many(addresses)
+            if players_query:
+                results += await client.query_many(addresses, 'players')
+            round_times.append(time.perf_counter() - start)
+            failed = [result for result in results if isinstance(result, Exception)]
+            if failed:
+                raise RuntimeError(f"{len(failed)} queries failed: {failed[0]!r}")
+            queries += len(results)
+    finally:
+        client.close()
+        for mock in mocks:
+            mock.close()
+    return round_times, queries, client.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark A2S queries against local mock servers')
+    parser.add_argument('--servers', type=int, default=50, help='Mock servers (default: 50)')
+    parser.add_argument('--players', type=int, default=64, help='Players per server (default: 64)')
+    parser.add_argument('--delay-ms', type=float, default=0.0, help='Reply delay of every server (default: 0)')
+    parser.add_argument('--rounds', type=int, default=20, help='Times every server is queried (default: 20)')
+    parser.add_argument('--players-query', action='store_true', help='Also send A2S_PLAYER every round')
+    args = parser.parse_args()
+    
+    round_times, queries, stats = asyncio.run(run(args.servers, args.players, args.delay_ms / 1000,
+                                                  args.rounds, args.players_query))
+    total = sum(round_times)
+    ordered = sorted(round_times)
+    
+    print("=" * 70)
+    print(f"{args.servers} mock servers x {args.players} players, {args.delay_ms:g} ms reply delay, "
+          f"{args.rounds} rounds")
+    print("-" * 70)
+    print(f"{'Queries':<24} {queries:>12,}  ({stats['challenges']:,} challenges, "
+          f"{stats['split_replies']:,} split replies)")
+    print(f"{'Throughput':<24} {queries / total:>12,.0f} queries/s")
+    print(f"{'Round p50':<24} {ordered[len(ordered) // 2] * 1000:>12,.1f} ms")
+    print(f"{'Round max':<24} {ordered[-1] * 1000:>12,.1f} ms")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark session checks against the SQLite database
+
+Compares the old access pattern (a new sqlite3 connection per call, rollback
+journal) with Database's pooled per-thread connections in WAL mode, with and
+without the in-memory session cache in front of them. It measures session checks per second on one thread, and again while a second
+thread keeps creating sessions.
+
+Runs against a throwaway database in a temporary directory.
+
+Usage:
+  python bench_database.py [--seconds 2.0] [--sessions 1000]
+"""
+
+import sys
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import Database
+
+
+def verify_session_per_call(db_path, token, device_id):
+    """verify_session as it was before pooling: connect, query, close"""
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=10.0)
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT user_id, expires_at FROM sessions
+            WHERE token = ? AND device_id = ?
+        ''', (token, device_id))
+        result = cursor.fetchone()
+        if result and datetime.fromisoformat(result[1]) > datetime.now():
+            return result[0]
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+
+def create_session_per_call(db_path, user_id, device_id):
+    """create_session as it was before pooling"""
+    conn = None
+    try:
+        conn = sqlite3.connect(db_path, timeout=10.0)
+        conn.execute('INSERT INTO sessions (user_id, device_id, token, expires_at) VALUES (?, ?, ?, ?)',
+                     (user_id, device_id, os.urandom(16).hex(), datetime.now().isoformat()))
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+
+def rate(func, seconds):
+    """Calls per second of func over roughly `seconds`"""
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        func()
+        calls += 1
+        if calls % 50 == 0 and time.perf_counter() >= deadline:
+            break
+    return calls / (time.perf_counter() - start)
+
+
+def with_writer(check, write, seconds):
+    """Check rate while another thread writes continuously; returns (checks/s, writes, errors)"""
+    stop = threading.Event()
+    counts = {'writes': 0, 'errors': 0}
+    
+    def writer():
+        while not stop.is_set():
+            try:
+                write()
+                counts['writes'] += 1
+            except sqlite3.OperationalError:
+                counts['errors'] += 1
+    
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        checks = rate(check, seconds)
+    finally:
+        stop.set()
+        thread.join()
+    return checks, counts['writes'], counts['errors']
+
+
+def setup(app_path, sessions, journal_mode):
+    """Database with `sessions` sessions; returns (db, user_id, token to look up)"""
+    db = Database(app_path)
+    db.close()
+    conn = sqlite3.connect(db.db_path)
+    conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    conn.close()
+    user_id = db.create_user('bench', 'bench', 'q1', 'a1', 'q2', 'a2')
+    for i in range(sessions - 1):
+        db.create_session(user_id, f'device-{i}')
+    token = db.create_session(user_id, 'bench-device', keep_logged_in=True)
+    return db, user_id, token
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark database session checks')
+    parser.add_argument('--seconds', type=float, default=2.0, help='Time per measurement (default: 2.0)')
+    parser.add_argument('--sessions', type=int, default=1000, help='Rows in the sessions table (default: 1000)')
+    args = parser.parse_args()
+    
+    with tempfile.TemporaryDirectory() as before_dir, tempfile.TemporaryDirectory() as after_dir:
+        before_db, before_user, before_token = setup(before_dir, args.sessions, 'DELETE')
+        before_db.close()
+        after_db, after_user, after_token = setup(after_dir, args.sessions, 'WAL')
+        
+        def check_before():
+            assert verify_session_per_call(before_db.db_path, before_token, 'bench-device') == before_user
+        
+        def check_after():
+            assert after_db.verify_session(after_token, 'bench-device') == after_user
+        
+        def check_uncached():
+            after_db.session_cache.clear()
+            check_after()
+        
+        print("=" * 78)
+        print(f"Session checks per second ({args.sessions} sessions in the table)")
+        print("-" * 78)
+        before = rate(check_before, args.seconds)
+        uncached = rate(check_uncached, args.seconds)
+        after = rate(check_after, args.seconds)
+        print(f"{'per-call connect, rollback journal':<40} {before:>12,.0f} checks/s")
+        print(f"{'pooled connection, WAL':<40} {uncached:>12,.0f} checks/s  ({uncached / before:.1f}x)")
+        print(f"{'pooled connection, WAL, session cache':<40} {after:>12,.0f} checks/s  ({after / before:.1f}x)")
+        
+        print("-" * 78)
+        print("With a concurrent writer thread creating sessions")
+        before_checks, before_writes, before_errors = with_writer(
+            check_before, lambda: create_session_per_call(before_db.db_path, before_user, 'writer'), args.seconds)
+        after_checks, after_writes, after_errors = with_writer(
+            check_after, lambda: after_db.create_session(after_user, 'writer'), args.seconds)
+        print(f"{'per-call connect, rollback journal':<40} {before_checks:>12,.0f} checks/s "
+              f"{before_writes:>7,} writes {before_errors:>4} locked")
+        print(f"{'pooled, WAL, session cache':<40} {after_checks:>12,.0f} checks/s "
+              f"{after_writes:>7,} writes {after_errors:>4} locked")
+        print("=" * 78)
+        after_db.close()
+
+
+if __name__ == '__main__':
+    main()
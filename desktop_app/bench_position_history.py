@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark position history ingestion
+
+Feeds PositionHistory the load of a full install: every configured server
+with 64 players reporting at 10 Hz. Simulated time runs as fast as the
+store can take it, flushing once per simulated flush interval, so the
+result is how many times faster than real time ingestion keeps up.
+
+Runs against a throwaway database in a temporary directory.
+
+Usage:
+  python bench_position_history.py [--servers 6] [--players 64] [--rate 10] [--minutes 10]
+"""
+
+import sys
+import os
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import Database
+from core.position_history import PositionHistory, DEFAULT_HISTORY_FLUSH_INTERVAL
+
+
+async def ingest(db, servers, players, rate, seconds):
+    """Record `seconds` of simulated traffic; returns (wall seconds, rows, flushes)"""
+    history = PositionHistory(db)
+    ticks_per_flush = max(1, int(rate * DEFAULT_HISTORY_FLUSH_INTERVAL))
+    world = {server_id: [{'user_id': user_id, 'x': random.uniform(0, 4000), 'y': random.uniform(0, 4000)}
+                         for user_id in range(1, players + 1)]
+             for server_id in range(1, servers + 1)}
+    t0 = time.time()
+    start = time.perf_counter()
+    for tick in range(int(seconds * rate)):
+        t = t0 + tick / rate
+        for server_id, server_players in world.items():
+            for player in server_players:
+                player['x'] += random.uniform(-2, 2)
+                player['y'] += random.uniform(-2, 2)
+            history.record(server_id, server_players, t=t)
+        if (tick + 1) % ticks_per_flush == 0:
+            await history.flush()
+    await history.stop()
+    return time.perf_counter() - start, history.rows_written, history.flushes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark position history ingestion')
+    parser.add_argument('--servers', type=int, default=6, help='Servers recorded (default: 6)')
+    parser.add_argument('--players', type=int, default=64, help='Players per server (default: 64)')
+    parser.add_argument('--rate', type=float, default=10.0, help='Position updates per second (default: 10)')
+    parser.add_argument('--minutes', type=float, default=10.0, help='Simulated minutes (default: 10)')
+    args = parser.parse_args()
+    
+    seconds = args.minutes * 60
+    needed = args.servers * args.players * args.rate
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(tmp)
+        wall, rows, flushes = asyncio.run(ingest(db, args.servers, args.players, args.rate, seconds))
+        size = os.path.getsize(db.db_path) + os.path.getsize(db.db_path + '-wal')
+        db.close()
+    
+    print("=" * 70)
+    print(f"{args.servers} servers x {args.players} players at {args.rate:g} Hz "
+          f"= {needed:,.0f} rows/s needed")
+    print("-" * 70)
+    print(f"{'Simulated':<24} {seconds:>12,.0f} s")
+    print(f"{'Ingested':<24} {rows:>12,} rows in {flushes:,} flushes")
+    print(f"{'Wall time':<24} {wall:>12,.2f} s")
+    print(f"{'Throughput':<24} {rows / wall:>12,.0f} rows/s  ({rows / wall / needed:.1f}x real time)")
+    print(f"{'On disk':<24} {size / rows:>12,.1f} bytes/row (including WAL)")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
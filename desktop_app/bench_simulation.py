@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark simulated players, alone and pushed through the hub
+
+First compares the cost of one poll (move everyone, build the positions
+batch) for the legacy per-player simulation of ArmaServerConnector and the
+NumPy PlayerSimulation, and the cost of turning one poll into a MessagePack
+frame: per-player dicts in a positions_batch, or the columnar PositionBatch
+in a positions_columns frame. Then runs a hub on loopback with a
+ServerPoller polling `--servers` simulated servers, one WebSocket client
+watching each (`--positions full` or `columns`), and reports how many player
+positions per second reach the clients.
+
+Needs NumPy and msgpack (pip install -r requirements-dev.txt).
+
+Usage:
+  python bench_simulation.py [--players 10000] [--servers 4] [--rate 10] [--seconds 5] [--mode random_walk]
+                             [--positions full]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import wire_format
+from core.arma_server_connector import ArmaServerConnector
+from core import player_simulation
+from core.player_simulation import PlayerSimulation, MODES, RANDOM_WALK
+from core.server_poller import ServerPoller
+from core.websocket_server import WebSocketServer
+
+
+class SimulatedServers:
+    """Stands in for ServerManager: `count` enabled servers, no poll budget limit"""
+    
+    poll_budget = 10000
+    
+    def __init__(self, count, rate):
+        self.servers = [{'id': server_id, 'name': f"Simulated {server_id}", 'ip': '127.0.0.1',
+                         'port': 17000 + server_id, 'query_port': 17000 + server_id, 'enabled': True,
+                         'poll_interval': 1 / rate}
+                        for server_id in range(1, count + 1)]
+    
+    def get_enabled_servers(self):
+        return self.servers
+
+
+async def poll_cost(connector, polls):
+    """Seconds per get_player_positions() call"""
+    await connector.connect()
+    start = time.perf_counter()
+    for _ in range(polls):
+        await connector.get_player_positions()
+    return (time.perf_counter() - start) / polls
+
+
+def encode_cost(simulation, columns, rounds):
+    """Seconds from a simulation step to the encoded frame of its positions"""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        simulation.step()
+        if columns:
+            message = simulation.batch().columns_message(1)
+        else:
+            message = {'type': 'positions_batch', 'server_id': 1, 'positions': simulation.positions()}
+        wire_format.encode(message, wire_format.MSGPACK)
+    return (time.perf_counter() - start) / rounds
+
+
+async def through_hub(players, servers, rate, seconds, mode, positions='full'):
+    """Positions delivered to clients per second, and the poller's counters"""
+    import websockets
+    
+    def simulated_connector(ip, port):
+        # Ids unique across servers
+        simulation = PlayerSimulation(players // servers, mode=mode, first_id=port * 100000)
+        return ArmaServerConnector(ip, port, simulation=simulation)
+    
+    poller = ServerPoller(SimulatedServers(servers, rate), connector_factory=simulated_connector,
+                          refresh_interval=3600)
+    hub = WebSocketServer('localhost', 0, tick_rate=rate, server_poller=poller)
+    server = await hub.listen()
+    port = server.sockets[0].getsockname()[1]
+    received = 0
+    
+    async def watch(server_id):
+        nonlocal received
+        async with websockets.connect(f"ws://localhost:{port}/?server_id={server_id}&positions={positions}",
+                                      max_size=None, subprotocols=wire_format.SUBPROTOCOLS) as ws:
+            async for frame in ws:
+                message = wire_format.decode(frame)
+                if message['type'] in ('positions_batch', 'positions_sync'):
+                    received += len(message['positions'])
+                elif message['type'] == 'positions_columns':
+                    received += message['count']
+    
+    watchers = [asyncio.create_task(watch(server_id)) for server_id in range(1, servers + 1)]
+    # Let every server connect (simulated connects take 0.5 s) before measuring
+    await asyncio.sleep(1.0)
+    start_received, start = received, time.perf_counter()
+    await asyncio.sleep(seconds)
+    delivered = (received - start_received) / (time.perf_counter() - start)
+    stats = poller.stats()
+    for task in watchers:
+        task.cancel()
+    await asyncio.gather(*watchers, return_exceptions=True)
+    await hub.stop()
+    return delivered, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark simulated players and the hub under their load')
+    parser.add_argument('--players', type=int, default=10000, help='Simulated players in total (default: 10000)')
+    parser.add_argument('--servers', type=int, default=4, help='Servers the players are spread over (default: 4)')
+    parser.add_argument('--rate', type=float, default=10.0, help='Polls and hub ticks per second (default: 10)')
+    parser.add_argument('--seconds', type=float, default=5.0, help='Measured seconds through the hub (default: 5)')
+    parser.add_argument('--mode', choices=MODES, default=RANDOM_WALK, help='Movement model (default: random_walk)')
+    parser.add_argument('--positions', choices=('full', 'columns'), default='full',
+                        help='Position stream the watching clients ask for (default: full)')
+    args = parser.parse_args()
+    if player_simulation.np is None:
+        sys.exit("bench_simulation.py needs NumPy: pip install -r requirements-dev.txt")
+    logging.basicConfig(level=logging.WARNING)
+    
+    legacy = ArmaServerConnector('127.0.0.1', 0, simulated=True)
+    for user_id in range(args.players):
+        legacy.players[user_id] = {'name': f"Sim {user_id}", 'x': 500.0, 'y': 500.0, 'team': 'blue'}
+    vectorized = ArmaServerConnector('127.0.0.1', 0, simulation=PlayerSimulation(args.players, mode=args.mode))
+    legacy_cost = asyncio.run(poll_cost(legacy, 5))
+    vectorized_cost = asyncio.run(poll_cost(vectorized, 20))
+    
+    print("=" * 70)
+    print(f"One poll of {args.players:,} simulated players ({args.mode})")
+    print("-" * 70)
+    print(f"{'Per-player loop':<24} {legacy_cost * 1000:>10,.1f} ms")
+    print(f"{'NumPy PositionBatch':<24} {vectorized_cost * 1000:>10,.1f} ms  ({legacy_cost / vectorized_cost:.1f}x faster)")
+    print("=" * 70)
+    
+    simulation = PlayerSimulation(args.players, mode=args.mode)
+    dicts_cost = encode_cost(simulation, False, 10)
+    columns_cost = encode_cost(simulation, True, 10)
+    print(f"One poll of {args.players:,} players to a MessagePack frame")
+    print("-" * 70)
+    print(f"{'positions_batch (dicts)':<24} {dicts_cost * 1000:>10,.1f} ms")
+    print(f"{'positions_columns':<24} {columns_cost * 1000:>10,.1f} ms  ({dicts_cost / columns_cost:.1f}x faster)")
+    print("=" * 70)
+    
+    delivered, stats = asyncio.run(through_hub(args.players, args.servers, args.rate, args.seconds, args.mode,
+                                               args.positions))
+    offered = args.players * args.rate
+    print(f"{args.players:,} players on {args.servers} servers at {args.rate:g} Hz through the hub "
+          f"({args.positions})")
+    print("-" * 70)
+    print(f"{'Offered':<24} {offered:>12,.0f} positions/s")
+    print(f"{'Delivered':<24} {delivered:>12,.0f} positions/s  ({delivered / offered:.0%})")
+    print(f"{'Poll rate':<24} {stats['rate_hz']:>12,.1f} polls/s")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark wire encodings for positions_sync payloads
+
+Compares encode/decode throughput and frame size of JSON text frames and
+MessagePack binary frames for 64, 256 and 1024 players.
+
+Usage:
+  python bench_wire_format.py [--seconds 1.0]
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core import wire_format
+
+
+PLAYER_COUNTS = [64, 256, 1024]
+
+
+def make_positions_sync(player_count):
+    """positions_sync message shaped like the hub sends it"""
+    teams = ['blue', 'red', 'neutral']
+    timestamp = datetime.now().isoformat()
+    return {
+        'type': 'positions_sync',
+        'server_id': 1,
+        'positions': [
+            {
+                'user_id': i,
+                'username': f'Player{i:04d}',
+                'x': random.uniform(0, 4000),
+                'y': random.uniform(0, 4000),
+                'team': teams[i % len(teams)],
+                'timestamp': timestamp
+            }
+            for i in range(player_count)
+        ]
+    }
+
+
+def rate(func, seconds):
+    """Calls per second of func over roughly `seconds`"""
+    calls = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        func()
+        calls += 1
+        if calls % 10 == 0 and time.perf_counter() >= deadline:
+            break
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hub wire encodings')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time per measurement (default: 1.0)')
+    args = parser.parse_args()
+    
+    if wire_format.msgpack is None:
+        print("msgpack is not installed; only JSON will be measured (pip install msgpack)")
+    
+    print("=" * 78)
+    print(f"{'players':>8} {'encoding':>9} {'frame bytes':>12} {'encode/s':>11} {'decode/s':>11} {'MB/s enc':>10}")
+    print("-" * 78)
+    for player_count in PLAYER_COUNTS:
+        message = make_positions_sync(player_count)
+        for encoding in wire_format.ENCODINGS[::-1]:
+            frame = wire_format.encode(message, encoding)
+            assert wire_format.decode(frame) == message
+            size = len(frame.encode() if isinstance(frame, str) else frame)
+            encode_rate = rate(lambda: wire_format.encode(message, encoding), args.seconds)
+            decode_rate = rate(lambda: wire_format.decode(frame), args.seconds)
+            print(f"{player_count:>8} {encoding:>9} {size:>12,} {encode_rate:>11,.0f} {decode_rate:>11,.0f} "
+                  f"{encode_rate * size / 1e6:>10.1f}")
+    print("=" * 78)
+
+
+if __name__ == '__main__':
+    main()
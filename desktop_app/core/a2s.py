@@ -0,0 +1,370 @@
+"""Steam server queries (A2S_INFO / A2S_PLAYER) over UDP
+
+Arma Reforger servers answer the Steam A2S protocol on their query port
+(17777 unless the server config says otherwise). A2SClient sends every
+query from one non-blocking UDP socket on the running event loop, so one
+client can query dozens of servers at once; replies are matched to queries
+by the address they come from.
+
+Handled parts of the protocol:
+    
+    challenges      a server may answer with S2C_CHALLENGE; the query is
+                    resent carrying the challenge number, which is kept
+                    for later queries to the same server
+    split replies   replies larger than one datagram arrive as numbered
+                    fragments and are reassembled before parsing
+                    (bzip2-compressed fragments, a GoldSource feature, are
+                    rejected)
+
+Reference: https://developer.valvesoftware.com/wiki/Server_queries
+"""
+
+import asyncio
+import logging
+import socket
+import struct
+import weakref
+
+logger = logging.getLogger(__name__)
+
+
+# Every unsplit packet starts with -1 as a little-endian long
+SIMPLE_HEADER = b'\xff\xff\xff\xff'
+
+# Every fragment of a split reply starts with -2
+SPLIT_HEADER = b'\xfe\xff\xff\xff'
+
+# Request and reply types
+A2S_INFO = 0x54
+A2S_PLAYER = 0x55
+S2A_INFO = 0x49
+S2A_PLAYER = 0x44
+S2C_CHALLENGE = 0x41
+
+A2S_INFO_PAYLOAD = b'Source Engine Query\x00'
+
+# Challenge number sent before the server has handed one out
+NO_CHALLENGE = b'\xff\xff\xff\xff'
+
+# Default port Reforger servers answer queries on
+DEFAULT_QUERY_PORT = 17777
+
+# Seconds to wait for a reply (per attempt, fragments included)
+DEFAULT_QUERY_TIMEOUT = 2.0
+
+# Challenge round trips before a query is given up on
+MAX_CHALLENGES = 3
+
+# Largest datagram a server sends before splitting (Source engine default)
+MAX_PACKET_SIZE = 1400
+
+
+class A2SError(Exception):
+    """The server answered with something that is not a valid reply"""
+
+
+class PacketReader:
+    """Reads the little-endian fields of an A2S reply"""
+    
+    def __init__(self, data, offset=0):
+        self.data = data
+        self.offset = offset
+    
+    def unpack(self, fmt):
+        try:
+            values = struct.unpack_from(fmt, self.data, self.offset)
+        except struct.error:
+            raise A2SError("Reply ended early")
+        self.offset += struct.calcsize(fmt)
+        return values[0]
+    
+    def byte(self):
+        return self.unpack('<B')
+    
+    def short(self):
+        return self.unpack('<h')
+    
+    def long(self):
+        return self.unpack('<l')
+    
+    def longlong(self):
+        return self.unpack('<Q')
+    
+    def float(self):
+        return self.unpack('<f')
+    
+    def string(self):
+        end = self.data.find(b'\x00', self.offset)
+        if end < 0:
+            raise A2SError("Unterminated string in reply")
+        value = self.data[self.offset:end].decode('utf-8', errors='replace')
+        self.offset = end + 1
+        return value
+    
+    def remaining(self):
+        return len(self.data) - self.offset
+
+
+def info_request(challenge=None):
+    """A2S_INFO packet, with the challenge number once the server asked for one"""
+    return SIMPLE_HEADER + bytes([A2S_INFO]) + A2S_INFO_PAYLOAD + (challenge or b'')
+
+
+def player_request(challenge=None):
+    """A2S_PLAYER packet; the first one carries NO_CHALLENGE to ask for a challenge"""
+    return SIMPLE_HEADER + bytes([A2S_PLAYER]) + (challenge or NO_CHALLENGE)
+
+
+def parse_info(payload):
+    """S2A_INFO body (after the type byte) as a dict"""
+    reader = PacketReader(payload)
+    info = {
+        'protocol': reader.byte(),
+        'name': reader.string(),
+        'map': reader.string(),
+        'folder': reader.string(),
+        'game': reader.string(),
+        'app_id': reader.short() & 0xffff,
+        'player_count': reader.byte(),
+        'max_players': reader.byte(),
+        'bots': reader.byte(),
+        'server_type': chr(reader.byte()),
+        'environment': chr(reader.byte()),
+        'password': bool(reader.byte()),
+        'vac': bool(reader.byte()),
+        'version': reader.string()
+    }
+    if reader.remaining():
+        # Extra data flag, followed by the fields it announces
+        edf = reader.byte()
+        if edf & 0x80:
+            info['port'] = reader.short() & 0xffff
+        if edf & 0x10:
+            info['steam_id'] = reader.longlong()
+        if edf & 0x40:
+            info['spectator_port'] = reader.short() & 0xffff
+            info['spectator_name'] = reader.string()
+        if edf & 0x20:
+            info['keywords'] = reader.string()
+        if edf & 0x01:
+            info['game_id'] = reader.longlong()
+    return info
+
+
+def parse_players(payload):
+    """S2A_PLAYER body (after the type byte) as a list of dicts"""
+    reader = PacketReader(payload)
+    players = []
+    for _ in range(reader.byte()):
+        players.append({
+            'index': reader.byte(),
+            'name': reader.string(),
+            'score': reader.long(),
+            'duration': reader.float()
+        })
+    return players
+
+
+class PendingQuery:
+    """One query waiting for its reply, and any fragments of it received so far"""
+    
+    def __init__(self, future):
+        self.future = future
+        self.split_id = None
+        self.fragments = {}
+    
+    def complete(self, message):
+        if self.future.done():
+            return
+        if len(message) < 5 or message[:4] != SIMPLE_HEADER:
+            self.future.set_exception(A2SError("Malformed reply"))
+        else:
+            self.future.set_result((message[4], message[5:]))
+    
+    def add_fragment(self, data):
+        """Store one fragment of a split reply; completes once all have arrived"""
+        reader = PacketReader(data, 4)
+        split_id, total, number = reader.long() & 0xffffffff, reader.byte(), reader.byte()
+        reader.short()  # Largest fragment size the server uses
+        if number >= total:
+            raise A2SError("Fragment number out of range")
+        if split_id & 0x80000000:
+            if not self.future.done():
+                self.future.set_exception(A2SError("Compressed split replies are not supported"))
+            return
+        if split_id != self.split_id:
+            # A new reply (e.g. to a resent query) replaces any partial one
+            self.split_id = split_id
+            self.fragments = {}
+        self.fragments[number] = data[reader.offset:]
+        if len(self.fragments) == total:
+            self.complete(b''.join(self.fragments[i] for i in range(total)))
+
+
+class A2SProtocol(asyncio.DatagramProtocol):
+    """Hands every datagram on the client's socket to the client"""
+    
+    def __init__(self, client):
+        self.client = client
+    
+    def datagram_received(self, data, addr):
+        self.client.datagram_received(data, addr)
+    
+    def error_received(self, exc):
+        # ICMP errors (e.g. port unreachable) do not say which query they
+        # belong to; the query times out instead
+        logger.debug(f"A2S socket error: {exc}")
+
+
+class A2SClient:
+    """Queries any number of servers from one UDP socket
+    
+    Queries to one server run one at a time, because a challenge reply does
+    not say which query it answers; queries to different servers all run
+    concurrently.
+    """
+    
+    def __init__(self, timeout=DEFAULT_QUERY_TIMEOUT):
+        self.timeout = timeout
+        self.transport = None
+        # (ip, port) -> PendingQuery
+        self.pending = {}
+        # (ip, port) -> asyncio.Lock
+        self.locks = {}
+        # (host, port) -> (ip, port)
+        self.addresses = {}
+        # (ip, port) -> last challenge number the server handed out, reused
+        # so later queries skip the challenge round trip
+        self.challenge_numbers = {}
+        self.queries = 0
+        self.timeouts = 0
+        self.challenges = 0
+        self.split_replies = 0
+        self.stray_packets = 0
+    
+    async def open(self):
+        """Bind the socket on the running event loop"""
+        if self.transport is None:
+            loop = asyncio.get_running_loop()
+            self.transport, _ = await loop.create_datagram_endpoint(lambda: A2SProtocol(self),
+                                                                    local_addr=('0.0.0.0', 0))
+        return self
+    
+    @property
+    def closed(self):
+        return self.transport is None or self.transport.is_closing()
+    
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+        for query in self.pending.values():
+            if not query.future.done():
+                query.future.cancel()
+        self.pending.clear()
+    
+    async def resolve(self, host, port):
+        """Address replies will come from (hostnames are looked up once)"""
+        key = (host, port)
+        address = self.addresses.get(key)
+        if address is None:
+            loop = asyncio.get_running_loop()
+            infos = await loop.getaddrinfo(host, port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            if not infos:
+                raise A2SError(f"Cannot resolve {host}")
+            address = self.addresses[key] = infos[0][4][:2]
+        return address
+    
+    def datagram_received(self, data, addr):
+        query = self.pending.get(addr[:2])
+        if query is None:
+            # Late reply to a query that already timed out
+            self.stray_packets += 1
+            return
+        if data[:4] == SIMPLE_HEADER:
+            query.complete(data)
+        elif data[:4] == SPLIT_HEADER:
+            try:
+                query.add_fragment(data)
+            except A2SError as e:
+                if not query.future.done():
+                    query.future.set_exception(e)
+        else:
+            self.stray_packets += 1
+    
+    async def request(self, host, port, build, expected):
+        """Send a query, answering challenges; returns the reply body"""
+        await self.open()
+        address = await self.resolve(host, port)
+        lock = self.locks.setdefault(address, asyncio.Lock())
+        loop = asyncio.get_running_loop()
+        async with lock:
+            self.queries += 1
+            challenge = self.challenge_numbers.get(address)
+            for _ in range(MAX_CHALLENGES + 1):
+                query = self.pending[address] = PendingQuery(loop.create_future())
+                self.transport.sendto(build(challenge), address)
+                try:
+                    kind, payload = await asyncio.wait_for(query.future, self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    raise
+                finally:
+                    self.pending.pop(address, None)
+                if query.split_id is not None:
+                    self.split_replies += 1
+                if kind == S2C_CHALLENGE:
+                    self.challenges += 1
+                    challenge = self.challenge_numbers[address] = payload[:4]
+                    continue
+                if kind != expected:
+                    raise A2SError(f"Unexpected reply type 0x{kind:02x}")
+                return payload
+            raise A2SError("Server kept answering with challenges")
+    
+    async def info(self, host, port=DEFAULT_QUERY_PORT):
+        """A2S_INFO: server name, map, player counts, version..."""
+        return parse_info(await self.request(host, port, info_request, S2A_INFO))
+    
+    async def players(self, host, port=DEFAULT_QUERY_PORT):
+        """A2S_PLAYER: name, score and connected seconds of every player"""
+        return parse_players(await self.request(host, port, player_request, S2A_PLAYER))
+    
+    async def query_many(self, servers, query='info'):
+        """Query many (host, port) pairs at once; one result or exception per server"""
+        method = getattr(self, query)
+        return await asyncio.gather(*[method(host, port) for host, port in servers], return_exceptions=True)
+    
+    def stats(self):
+        return {
+            'queries': self.queries,
+            'timeouts': self.timeouts,
+            'challenges': self.challenges,
+            'split_replies': self.split_replies,
+            'stray_packets': self.stray_packets
+        }
+
+
+# Event loop -> the client every connector on that loop shares
+_shared_clients = weakref.WeakKeyDictionary()
+
+
+async def shared_client():
+    """The A2SClient (one socket) shared by every query on the running loop"""
+    loop = asyncio.get_running_loop()
+    client = _shared_clients.get(loop)
+    if client is None or client.closed:
+        client = _shared_clients[loop] = await A2SClient().open()
+    return client
+
+
+async def query_server(host, port=DEFAULT_QUERY_PORT, players=False, timeout=DEFAULT_QUERY_TIMEOUT):
+    """One-off A2S_INFO (and optionally A2S_PLAYER) query on its own socket"""
+    client = await A2SClient(timeout).open()
+    try:
+        info = await client.info(host, port)
+        if players:
+            info['players'] = await client.players(host, port)
+        return info
+    finally:
+        client.close()
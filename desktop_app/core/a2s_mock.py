@@ -0,0 +1,117 @@
+"""Local A2S responder for testing and benchmarking core.a2s offline
+
+MockA2SServer answers A2S_INFO and A2S_PLAYER like a Reforger server: it
+hands out a challenge number first (when `challenge` is on) and splits
+replies larger than `max_packet_size` into numbered fragments. `delay`
+holds every reply back, to stand in for a slow or distant server.
+    
+    server = MockA2SServer(name='Test', players=['Alpha', 'Bravo'])
+    host, port = await server.start()
+    ...
+    server.close()
+"""
+
+import asyncio
+import itertools
+import os
+import struct
+from core.a2s import (SIMPLE_HEADER, SPLIT_HEADER, A2S_INFO, A2S_PLAYER, A2S_INFO_PAYLOAD, S2A_INFO,
+                      S2A_PLAYER, S2C_CHALLENGE, MAX_PACKET_SIZE)
+
+# Steam app id of Arma Reforger
+REFORGER_APP_ID = 1874880
+
+# Bytes of a split fragment's header (-2, id, total, number, size)
+SPLIT_HEADER_SIZE = 12
+
+
+def string(value):
+    return value.encode('utf-8') + b'\x00'
+
+
+class MockA2SServer(asyncio.DatagramProtocol):
+    """Answers A2S queries on a local UDP port"""
+    
+    def __init__(self, name='Mock Reforger Server', map_name='Everon', players=(), max_players=64,
+                 challenge=True, max_packet_size=MAX_PACKET_SIZE, delay=0.0, game_port=2001):
+        self.name = name
+        self.map_name = map_name
+        # Player names; edit freely between queries
+        self.players = list(players)
+        self.max_players = max_players
+        self.challenge = challenge
+        self.max_packet_size = max_packet_size
+        self.delay = delay
+        self.game_port = game_port
+        self.transport = None
+        # client address -> challenge number handed out
+        self.challenges = {}
+        self._split_ids = itertools.count(1)
+        self.requests = 0
+    
+    async def start(self, host='127.0.0.1', port=0):
+        """Bind and return the (host, port) queries should go to"""
+        loop = asyncio.get_running_loop()
+        self.transport, _ = await loop.create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        return self.transport.get_extra_info('sockname')[:2]
+    
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+    
+    def info_reply(self):
+        return (SIMPLE_HEADER + bytes([S2A_INFO, 17]) + string(self.name) + string(self.map_name)
+                + string('reforger') + string('Arma Reforger')
+                + struct.pack('<HBBBccBB', REFORGER_APP_ID & 0xffff, min(len(self.players), 255),
+                              self.max_players, 0, b'd', b'l', 0, 0)
+                + string('1.2.0.0')
+                # Extra data: game port, keywords, full 64-bit game id
+                + bytes([0x80 | 0x20 | 0x01]) + struct.pack('<H', self.game_port) + string('reforger')
+                + struct.pack('<Q', REFORGER_APP_ID))
+    
+    def player_reply(self):
+        players = self.players[:255]
+        body = b''.join(struct.pack('<B', index) + string(name) + struct.pack('<lf', index * 10, 60.0 * index)
+                        for index, name in enumerate(players))
+        return SIMPLE_HEADER + bytes([S2A_PLAYER, len(players)]) + body
+    
+    def packets(self, reply):
+        """The reply as sent: one packet, or fragments of at most max_packet_size"""
+        if len(reply) <= self.max_packet_size:
+            return [reply]
+        chunk = self.max_packet_size - SPLIT_HEADER_SIZE
+        chunks = [reply[i:i + chunk] for i in range(0, len(reply), chunk)]
+        split_id = next(self._split_ids) & 0x7fffffff
+        return [SPLIT_HEADER + struct.pack('<lBBh', split_id, len(chunks), number, self.max_packet_size) + data
+                for number, data in enumerate(chunks)]
+    
+    def datagram_received(self, data, addr):
+        if data[:4] != SIMPLE_HEADER or len(data) < 5:
+            return
+        self.requests += 1
+        kind = data[4]
+        if kind == A2S_INFO and data[5:5 + len(A2S_INFO_PAYLOAD)] == A2S_INFO_PAYLOAD:
+            challenge, build = data[5 + len(A2S_INFO_PAYLOAD):], self.info_reply
+        elif kind == A2S_PLAYER:
+            challenge, build = data[5:9], self.player_reply
+        else:
+            return
+        expected = self.challenges.get(addr)
+        if self.challenge and (expected is None or challenge != expected):
+            if expected is None:
+                expected = self.challenges[addr] = os.urandom(4)
+            self.send([SIMPLE_HEADER + bytes([S2C_CHALLENGE]) + expected], addr)
+        else:
+            self.send(self.packets(build()), addr)
+    
+    def send(self, packets, addr):
+        if self.delay:
+            asyncio.get_running_loop().call_later(self.delay, self.sendto, packets, addr)
+        else:
+            self.sendto(packets, addr)
+    
+    def sendto(self, packets, addr):
+        if self.transport is not None:
+            for packet in packets:
+                self.transport.sendto(packet, addr)
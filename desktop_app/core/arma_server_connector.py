@@ -1,36 +1,56 @@
 """Connector for Arma Reforger game servers
-This module handles connecting to actual Arma Reforger servers and retrieving player positions.
+This module handles connecting to actual Arma Reforger servers and retrieving server status.
 
-Note: This is a simulated implementation since Arma Reforger's server API details are not publicly
-available. In a real implementation, you would use the actual server query protocol.
+Server status (name, map, player counts and names) comes from the Steam A2S
+query protocol (core.a2s) on the server's query port. A2S carries no player
+positions, so against a real server get_player_positions() returns nothing;
+with simulated=True the connector invents players and movement for testing.
+For load tests, pass a core.player_simulation.PlayerSimulation to simulate
+thousands of players with NumPy; positions then come back as one columnar
+core.position_batch.PositionBatch per poll instead of a list of dicts.
 """
 
 import asyncio
 import random
 import logging
+import time
 from datetime import datetime
+from core.a2s import shared_client
 
 logger = logging.getLogger(__name__)
 
 
 class ArmaServerConnector:
-    """Simulated connector for Arma Reforger game servers"""
+    """Connector for Arma Reforger game servers (A2S queries, or simulated)"""
     
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, simulated=False, client=None, simulation=None):
         self.ip = ip
+        # A2S query port of the server
         self.port = port
+        # Vectorized players (core.player_simulation) instead of self.players
+        self.simulation = simulation
+        self.last_step = None
+        self.simulated = simulated or simulation is not None
+        # core.a2s.A2SClient; None shares one socket per event loop
+        self.client = client
         self.connected = False
         self.players = {}
         self.map_name = "Everon"
-        
+    
     async def connect(self):
-        """Connect to Arma server"""
+        """Connect to Arma server (check that it answers queries)"""
         try:
-            # Simulated connection
-            await asyncio.sleep(0.5)
+            if self.simulated:
+                await asyncio.sleep(0.5)
+            else:
+                client = self.client or await shared_client()
+                await client.info(self.ip, self.port)
             self.connected = True
             logger.info(f"Connected to Arma server {self.ip}:{self.port}")
             return True
+        except asyncio.TimeoutError:
+            logger.error(f"Arma server {self.ip}:{self.port} did not answer")
+            return False
         except Exception as e:
             logger.error(f"Failed to connect to Arma server: {e}")
             return False
@@ -45,22 +65,44 @@ class ArmaServerConnector:
         if not self.connected:
             return None
         
+        if not self.simulated:
+            client = self.client or await shared_client()
+            info = await client.info(self.ip, self.port)
+            players = await client.players(self.ip, self.port) if info['player_count'] else []
+            return {
+                'name': info['name'],
+                'map': info['map'],
+                'player_count': info['player_count'],
+                'max_players': info['max_players'],
+                'version': info['version'],
+                'players': [player['name'] for player in players],
+                'status': 'online'
+            }
+        
         return {
             'name': f"Server at {self.ip}",
             'map': self.map_name,
-            'player_count': len(self.players),
-            'max_players': 64,
+            'player_count': self.simulation.count if self.simulation is not None else len(self.players),
+            'max_players': max(64, self.simulation.count) if self.simulation is not None else 64,
             'status': 'online'
         }
     
     async def get_player_positions(self):
         """Get current player positions
         
-        Note: This is simulated data. Real implementation would query the actual game server.
+        Note: This is simulated data. A2S has no positions, so real servers report none.
+        A PlayerSimulation's players come back as one PositionBatch, not dicts.
         """
-        if not self.connected:
+        if not self.connected or not self.simulated:
             return []
         
+        if self.simulation is not None:
+            # Every player moves in one vectorized step per poll, handed over column-wise
+            now = time.monotonic()
+            self.simulation.step(now - self.last_step if self.last_step is not None else 0.0)
+            self.last_step = now
+            return self.simulation.batch()
+        
         # Simulate player positions for testing
         positions = []
         for player_id, player_data in self.players.items():
@@ -0,0 +1,182 @@
+"""Asyncio front end for Database, backed by one dedicated thread
+
+Database is synchronous; calling it from the hub's event loop would stall
+fan-out for the duration of every query. AsyncDatabase queues each call to
+a single database thread and hands the result back through an asyncio
+future.
+
+Writes that are queued together run in one transaction (each in its own
+savepoint, so a failing write does not undo the others), which turns a
+burst of small commits into a single fsync. Reads run on the same thread,
+in queue order, so a read issued after a write sees it.
+"""
+
+import asyncio
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Most queued writes committed in one transaction
+DEFAULT_MAX_WRITE_BATCH = 256
+
+
+class DatabaseRequest:
+    """One queued call: func(*args) to run on the database thread"""
+    
+    __slots__ = ('func', 'args', 'write', 'loop', 'future')
+    
+    def __init__(self, func, args, write, loop, future):
+        self.func = func
+        self.args = args
+        self.write = write
+        self.loop = loop
+        self.future = future
+
+
+class AsyncDatabase:
+    """Awaitable Database calls served by a dedicated thread"""
+    
+    def __init__(self, db, max_write_batch=DEFAULT_MAX_WRITE_BATCH):
+        self.db = db
+        self.max_write_batch = max_write_batch
+        self.requests = queue.Queue()
+        self.requests_served = 0
+        self.write_batches = 0
+        self.writes = 0
+        self.largest_batch = 0
+        self.thread = threading.Thread(target=self._run, name='database', daemon=True)
+        self.thread.start()
+    
+    async def run(self, func, *args, write=False):
+        """Run func(*args) on the database thread; writes may be grouped"""
+        if self.thread is None:
+            raise RuntimeError("AsyncDatabase is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests.put(DatabaseRequest(func, args, write, loop, future))
+        return await future
+    
+    # Hub-facing calls
+    
+    async def verify_session(self, token, device_id):
+        """Verify session token; cache hits are answered without leaving the loop"""
+        user_id = self.db.session_cache.get(token, device_id)
+        if user_id is not None:
+            return user_id
+        return await self.run(self.db.lookup_session, token, device_id)
+    
+    async def create_session(self, user_id, device_id, keep_logged_in=False):
+        """Create new session token"""
+        return await self.run(self.db.create_session, user_id, device_id, keep_logged_in, write=True)
+    
+    async def revoke_session(self, token):
+        """Delete a session token"""
+        return await self.run(self.db.revoke_session, token, write=True)
+    
+    async def get_username(self, user_id):
+        """Get a user's name by id"""
+        return await self.run(self.db.get_username, user_id)
+    
+    async def load_markers(self, server_id=None):
+        """Hub markers as dicts grouped by server_id"""
+        return await self.run(self.db.load_markers, server_id)
+    
+    async def save_marker_changes(self, upserts, deletes):
+        """Write a batch of hub marker changes"""
+        return await self.run(self.db.save_marker_changes, upserts, deletes, write=True)
+    
+    async def save_position_history(self, rows_by_segment):
+        """Append a batch of quantized position history rows"""
+        return await self.run(self.db.save_position_history, rows_by_segment, write=True)
+    
+    # Database thread
+    
+    def _run(self):
+        carry = None
+        while True:
+            request = carry if carry is not None else self.requests.get()
+            carry = None
+            if request is None:
+                return
+            if not request.write:
+                self._serve(request)
+                continue
+            # Take every write already waiting, stopping at the first read
+            batch = [request]
+            while len(batch) < self.max_write_batch:
+                try:
+                    request = self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None or not request.write:
+                    carry = request
+                    break
+                batch.append(request)
+            self._serve_writes(batch)
+    
+    def _serve(self, request):
+        try:
+            result, error = request.func(*request.args), None
+        except Exception as e:
+            result, error = None, e
+        self.requests_served += 1
+        self._resolve(request, result, error)
+    
+    def _serve_writes(self, batch):
+        outcomes = []
+        try:
+            with self.db.write_batch():
+                for request in batch:
+                    try:
+                        outcomes.append((request.func(*request.args), None))
+                    except Exception as e:
+                        outcomes.append((None, e))
+        except Exception as e:
+            # The commit itself failed; none of the writes landed
+            logger.error(f"Database write batch of {len(batch)} failed: {e}")
+            outcomes = [(None, e)] * len(batch)
+        self.requests_served += len(batch)
+        self.writes += len(batch)
+        self.write_batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch))
+        for request, (result, error) in zip(batch, outcomes):
+            self._resolve(request, result, error)
+    
+    def _resolve(self, request, result, error):
+        def deliver():
+            if request.future.done():
+                # Caller gave up (cancelled); nothing to deliver
+                return
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                request.future.set_result(result)
+        try:
+            request.loop.call_soon_threadsafe(deliver)
+        except RuntimeError:
+            # The caller's loop has already closed
+            pass
+    
+    def close(self):
+        """Serve what is queued, then stop the database thread"""
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+    
+    async def aclose(self):
+        """close() without blocking the event loop"""
+        await asyncio.to_thread(self.close)
+    
+    def stats(self):
+        """Executor counters for metrics"""
+        return {
+            'queued': self.requests.qsize(),
+            'requests': self.requests_served,
+            'writes': self.writes,
+            'write_batches': self.write_batches,
+            'largest_batch': self.largest_batch
+        }
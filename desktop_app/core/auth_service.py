@@ -0,0 +1,147 @@
+"""Account operations on a worker pool, with results delivered as Qt signals
+
+Logging in hashes the password, reads SQLite and writes a session; creating
+an account or resetting a password also runs Fernet over the security
+answers. Run on the GUI thread, each of these freezes the window for as
+long as the hashing takes. AuthService runs them on its own QThreadPool
+instead and calls back on the GUI thread when they finish.
+
+Every operation's time waiting for a worker and time running is recorded;
+stats() summarises them per operation, and the login window logs each
+one through latency_measured.
+"""
+
+import time
+from collections import deque
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+
+
+# Worker threads: one for a login in flight plus a spare so registering or
+# resetting a password never queues behind it. hashlib and SQLite release
+# the GIL, so these run in parallel with the GUI thread.
+DEFAULT_AUTH_WORKERS = 2
+
+# Latency samples kept per operation
+LATENCY_SAMPLES = 256
+
+
+class AuthTask(QRunnable):
+    """Runs one operation on a pool thread and reports back through the service"""
+    
+    def __init__(self, service, name, func, args, callback, error_callback):
+        super().__init__()
+        self.service = service
+        self.name = name
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.error_callback = error_callback
+        self.submitted = time.perf_counter()
+    
+    def run(self):
+        started = time.perf_counter()
+        try:
+            result, error = self.func(*self.args), None
+        except Exception as e:
+            result, error = None, e
+        timing = (started - self.submitted, time.perf_counter() - started)
+        # Queued to the service's (GUI) thread. The runnable itself is deleted
+        # once run() returns, so only plain values go through the signal.
+        try:
+            self.service.task_finished.emit((self.name, self.callback, self.error_callback), result, error, timing)
+        except RuntimeError:
+            # The service was destroyed while this ran (application exit)
+            pass
+
+
+class AuthService(QObject):
+    """Runs Database account operations off the GUI thread
+    
+    Callbacks are invoked on the thread that owns the service (the GUI
+    thread): `callback(result)` on success, `error_callback(exception)` if the
+    operation raised.
+    """
+    
+    task_finished = Signal(object, object, object, object)
+    
+    # Operation name, seconds waiting for a worker, seconds running
+    latency_measured = Signal(str, float, float)
+    
+    def __init__(self, db, workers=DEFAULT_AUTH_WORKERS, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(workers)
+        # Keep worker threads for good: each opens its own thread-local Database
+        # connection, which a recycled (expired) thread would leave open
+        self.pool.setExpiryTimeout(-1)
+        self.latencies = {}
+        self.failures = 0
+        self.task_finished.connect(self.on_task_finished)
+    
+    def submit(self, name, func, *args, callback=None, error_callback=None):
+        """Run func(*args) on the pool; callbacks run on the GUI thread"""
+        self.pool.start(AuthTask(self, name, func, args, callback, error_callback))
+    
+    def on_task_finished(self, task, result, error, timing):
+        name, callback, error_callback = task
+        queued, running = timing
+        self.latencies.setdefault(name, deque(maxlen=LATENCY_SAMPLES)).append(queued + running)
+        self.latency_measured.emit(name, queued, running)
+        if error is not None:
+            self.failures += 1
+            if error_callback is not None:
+                error_callback(error)
+            else:
+                print(f"Auth operation {name} failed: {error}")
+        elif callback is not None:
+            callback(result)
+    
+    def login(self, username, password, device_id, keep_logged_in, callback, error_callback=None):
+        """Check credentials and open a session; callback((user_id, token)) or callback(None)"""
+        def work():
+            user_id = self.db.verify_login(username, password)
+            if not user_id:
+                return None
+            return user_id, self.db.create_session(user_id, device_id, keep_logged_in)
+        self.submit('login', work, callback=callback, error_callback=error_callback)
+    
+    def create_user(self, username, password, security_q1, security_a1, security_q2, security_a2,
+                    callback, error_callback=None):
+        """Create an account; callback(user_id) or callback(None) if the name is taken"""
+        self.submit('create_user', self.db.create_user, username, password, security_q1, security_a1,
+                    security_q2, security_a2, callback=callback, error_callback=error_callback)
+    
+    def get_security_questions(self, username, callback, error_callback=None):
+        """callback((question1, question2)) or callback(None) if there is no such user"""
+        def work():
+            user = self.db.get_user_by_username(username)
+            return (user[3], user[5]) if user else None
+        self.submit('get_security_questions', work, callback=callback, error_callback=error_callback)
+    
+    def reset_password(self, username, answer1, answer2, new_password, callback, error_callback=None):
+        """Reset the password if the answers match; callback(True/False)"""
+        def work():
+            if not self.db.verify_security_answers(username, answer1, answer2):
+                return False
+            self.db.reset_password(username, new_password)
+            return True
+        self.submit('reset_password', work, callback=callback, error_callback=error_callback)
+    
+    def wait(self, msecs=-1):
+        """Block until every submitted operation has run (for shutdown and tests)"""
+        return self.pool.waitForDone(msecs)
+    
+    def stats(self):
+        """Latency per operation in milliseconds: count, p50, p95, max"""
+        summary = {}
+        for name, samples in self.latencies.items():
+            ordered = sorted(samples)
+            summary[name] = {
+                'count': len(ordered),
+                'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+                'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+                'max_ms': round(ordered[-1] * 1000, 2)
+            }
+        summary['failures'] = self.failures
+        return summary
@@ -0,0 +1,204 @@
+"""Per-client outbound queue for the WebSocket hub
+
+Every connected client gets its own bounded outbound queue drained by a
+dedicated writer task, so a stalled client only ever delays itself. The hub
+never awaits a client's socket directly; it only enqueues frames.
+
+Two kinds of frames are queued:
+
+- events (markers, chat, pongs, ...): always delivered in order, never dropped
+- position frames: at most one may wait in the queue. If the next tick's
+  frame arrives while one is still queued, the client is lagging: the stale
+  frame is dropped and the client is flagged for a resync snapshot, which
+  replaces whatever position frame is still pending.
+
+A client whose queue stays above the high-water mark for longer than
+`lag_timeout` seconds, or exceeds `max_queue` frames, is disconnected.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+from core import wire_format
+
+logger = logging.getLogger(__name__)
+
+
+# Queue limits in frames
+DEFAULT_HIGH_WATER = 256
+DEFAULT_MAX_QUEUE = 1024
+
+# Seconds a client may stay above the high-water mark
+DEFAULT_LAG_TIMEOUT = 5.0
+
+# Close code used when dropping a slow client (1013 = try again later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+
+class ClientConnection:
+    """A connected client, its negotiated options and its outbound queue"""
+    
+    def __init__(self, websocket, encoding=wire_format.JSON, high_water=DEFAULT_HIGH_WATER,
+                 max_queue=DEFAULT_MAX_QUEUE, lag_timeout=DEFAULT_LAG_TIMEOUT):
+        self.websocket = websocket
+        self.encoding = encoding
+        # Assigned by the hub; identifies the sender of bus events
+        self.client_id = None
+        self.delta = False
+        # Columnar positions_columns frames (binary encodings only)
+        self.columns = False
+        # Cells of the client's viewport (frozenset), None for the whole map
+        self.aoi = None
+        self.room = None
+        self.high_water = high_water
+        self.max_queue = max_queue
+        self.lag_timeout = lag_timeout
+        
+        # Entries are one-item lists so a dropped frame can be blanked in place
+        self.queue = deque()
+        self.queue_depth = 0
+        self.pending_positions = None
+        self.needs_resync = False
+        self.over_high_water_since = None
+        
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self.close_reason = None
+        self._wakeup = asyncio.Event()
+        self.writer_task = None
+        self.close_task = None
+    
+    @property
+    def address(self):
+        """Remote address as host:port, for logs and metrics"""
+        remote = getattr(self.websocket, 'remote_address', None)
+        if remote:
+            return f"{remote[0]}:{remote[1]}"
+        return f"client-{id(self):x}"
+    
+    def start(self):
+        """Start the writer task on the running event loop"""
+        if self.writer_task is None:
+            self.writer_task = asyncio.create_task(self.run_writer())
+        return self.writer_task
+    
+    def enqueue(self, frame):
+        """Queue an event frame; events are never dropped"""
+        if self.closed:
+            return
+        self.queue.append([frame])
+        self.queue_depth += 1
+        self._wakeup.set()
+        self.check_backlog()
+    
+    def enqueue_positions(self, frame, snapshot=False):
+        """Queue a position frame, replacing or dropping a stale one
+        
+        `snapshot` frames (positions_sync / keyframes) carry the full state and
+        clear a pending resync.
+        """
+        if self.closed:
+            return
+        if self.needs_resync and not snapshot:
+            # Incremental frames are useless until the client has resynced
+            self.frames_dropped += 1
+            return
+        
+        pending = self.pending_positions
+        if pending is not None:
+            # The previous tick's frame has not left the queue yet
+            self.frames_dropped += 1
+            if snapshot:
+                pending[0] = frame
+                self.needs_resync = False
+            else:
+                pending[0] = None
+                self.pending_positions = None
+                self.queue_depth -= 1
+                self.needs_resync = True
+            return
+        
+        entry = [frame]
+        self.queue.append(entry)
+        self.queue_depth += 1
+        self.pending_positions = entry
+        if snapshot:
+            self.needs_resync = False
+        self._wakeup.set()
+        self.check_backlog()
+    
+    def check_backlog(self, now=None):
+        """Disconnect the client if its queue has been too deep for too long"""
+        if self.closed:
+            return
+        if self.queue_depth > self.max_queue:
+            self.close_slow(f"outbound queue exceeded {self.max_queue} frames")
+            return
+        if self.queue_depth <= self.high_water:
+            self.over_high_water_since = None
+            return
+        now = time.monotonic() if now is None else now
+        if self.over_high_water_since is None:
+            self.over_high_water_since = now
+        elif now - self.over_high_water_since > self.lag_timeout:
+            self.close_slow(f"outbound queue above {self.high_water} frames for {self.lag_timeout:g}s")
+    
+    def close_slow(self, reason):
+        """Drop a client that cannot keep up"""
+        self.closed = True
+        self.close_reason = reason
+        self.queue.clear()
+        self.queue_depth = 0
+        self.pending_positions = None
+        logger.warning(f"Disconnecting slow client {self.address}: {reason}")
+        if self.writer_task is not None and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        self.close_task = asyncio.create_task(self.websocket.close(SLOW_CLIENT_CLOSE_CODE, 'client too slow'))
+    
+    async def run_writer(self):
+        """Drain the outbound queue into the socket"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                entry = self.queue.popleft()
+                if entry is self.pending_positions:
+                    self.pending_positions = None
+                frame = entry[0]
+                if frame is None:
+                    continue
+                self.queue_depth -= 1
+                if self.queue_depth <= self.high_water:
+                    self.over_high_water_since = None
+                await self.websocket.send(frame)
+                self.frames_sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # Connection closed or broken; the read loop will unregister us
+            logger.debug(f"Writer for {self.address} stopped: {e}")
+            self.closed = True
+    
+    def stop(self):
+        """Stop the writer task when the client goes away"""
+        self.closed = True
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+    
+    def metrics(self):
+        """Queue statistics for this client"""
+        return {
+            'address': self.address,
+            'server_id': self.room.server_id if self.room is not None else None,
+            'encoding': self.encoding,
+            'delta': self.delta,
+            'queue_depth': self.queue_depth,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'needs_resync': self.needs_resync
+        }
@@ -1,8 +1,80 @@
 import sqlite3
 import os
 import json
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from core.encryption import EncryptionManager
+from core.encryption import EncryptionManager, upgrade_ciphertext
+from core.session_cache import SessionCache
+
+
+# Applied to every pooled connection. WAL itself is persistent and is set once
+# in _init_database; with it readers never block the writer and vice versa.
+CONNECTION_PRAGMAS = [
+    'PRAGMA busy_timeout = 10000',
+    # Durable at checkpoints, no fsync per commit (safe with WAL)
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA temp_store = MEMORY',
+    # Page cache per connection in KiB (negative = KiB)
+    'PRAGMA cache_size = -8000'
+]
+
+# Prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 128
+
+
+def _add_marker_uid(cursor):
+    # Databases from before migrations existed may already have the column
+    cursor.execute('PRAGMA table_info(markers)')
+    if 'marker_uid' not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE markers ADD COLUMN marker_uid TEXT')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_markers_uid ON markers(marker_uid)')
+
+
+def _compact_ciphertexts(cursor):
+    # Re-encoding only; the key is not needed
+    cursor.execute('SELECT id, security_a1, security_a2, totp_secret FROM users')
+    for user_id, a1, a2, totp_secret in cursor.fetchall():
+        cursor.execute('UPDATE users SET security_a1 = ?, security_a2 = ?, totp_secret = ? WHERE id = ?',
+                       (upgrade_ciphertext(a1), upgrade_ciphertext(a2), upgrade_ciphertext(totp_secret), user_id))
+
+
+# Schema migrations on top of the base tables, tracked with PRAGMA user_version.
+# Each entry is (version, description, list of SQL statements or callable(cursor)).
+# Append only; never edit a migration that has shipped.
+MIGRATIONS = [
+    (1, 'markers.marker_uid for hub marker ids', _add_marker_uid),
+    # verify_session is answered from the index alone, no table lookups
+    (2, 'covering index for session lookups', [
+        'CREATE INDEX IF NOT EXISTS idx_sessions_token_device ON sessions(token, device_id, user_id, expires_at)'
+    ]),
+    (3, 'index markers by server', [
+        'CREATE INDEX IF NOT EXISTS idx_markers_server ON markers(server_id)'
+    ]),
+    # purge_expired_sessions finds expired rows without a table scan
+    (4, 'index sessions by expiry', [
+        'CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions(expires_at)'
+    ]),
+    (5, 'compact ciphertext format for encrypted user fields', _compact_ciphertexts)
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Position history is split into one table per time segment (named by the
+# segment's start, in unix seconds) so old history is dropped, not deleted
+HISTORY_TABLE_PREFIX = 'position_history_'
+
+# Stored coordinates are integers in units of 1/HISTORY_QUANTUM map units
+HISTORY_QUANTUM = 10
+
+# Downsampled history, one table per rollup interval in seconds
+# (see core.history_retention)
+ROLLUP_TABLE_PREFIX = 'position_rollup_'
+
+
+def _history_tables(conn, prefix):
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (prefix + '%',))
+    return sorted(int(name[len(prefix):]) for (name,) in cursor.fetchall())
 
 
 class Database:
@@ -10,225 +82,519 @@ class Database:
         self.app_path = app_path
         self.db_path = os.path.join(app_path, 'data', 'arma_map.db')
         self.encryption = EncryptionManager(app_path)
+        # One connection per thread (GUI, WebSocket hub, workers), reused across calls
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Validated sessions, so repeat checks skip SQLite
+        self.session_cache = SessionCache()
         self._init_database()
     
+    def _connection(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # check_same_thread=False only so close() can run from any thread;
+            # each connection is still used by the thread that opened it
+            conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """Cursor on this thread's connection; commits on success, rolls back on error"""
+        conn = self._connection()
+        if getattr(self._local, 'in_batch', False):
+            # Inside write_batch(): a savepoint, so one failed write leaves the others
+            conn.execute('SAVEPOINT write')
+            try:
+                yield conn.cursor()
+            except BaseException:
+                conn.execute('ROLLBACK TO write')
+                conn.execute('RELEASE write')
+                raise
+            conn.execute('RELEASE write')
+            return
+        try:
+            yield conn.cursor()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    
+    @contextmanager
+    def write_batch(self):
+        """Commit every write made on this thread inside the block as one transaction"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.in_batch = True
+        try:
+            yield
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._local.in_batch = False
+    
+    def close(self):
+        """Close every pooled connection (threads reopen on next use)"""
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+    
     def _init_database(self):
         """Initialize database with required tables"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        conn = sqlite3.connect(self.db_path, timeout=10.0)
-        cursor = conn.cursor()
+        conn = self._connection()
+        # Only takes effect on a new, empty file; older files are converted
+        # below, before the app starts using the database
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        # Persistent; lets the GUI and hub threads read while another writes
+        conn.execute('PRAGMA journal_mode = WAL')
         
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                security_q1 TEXT NOT NULL,
-                security_a1 TEXT NOT NULL,
-                security_q2 TEXT NOT NULL,
-                security_a2 TEXT NOT NULL,
-                totp_secret TEXT,
-                totp_enabled INTEGER DEFAULT 0,
-                created_at TEXT NOT NULL
-            )
-        ''')
-        
-        # Sessions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                device_id TEXT NOT NULL,
-                token TEXT NOT NULL,
-                expires_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
-        
-        # Markers table (for persistent markers)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS markers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                server_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                marker_type TEXT NOT NULL,
-                x REAL NOT NULL,
-                y REAL NOT NULL,
-                description TEXT,
-                created_at TEXT NOT NULL,
-                FOREIGN KEY (user_id) REFERENCES users(id)
-            )
-        ''')
+        with self._transaction() as cursor:
+            # Users table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    username TEXT UNIQUE NOT NULL,
+                    password_hash TEXT NOT NULL,
+                    security_q1 TEXT NOT NULL,
+                    security_a1 TEXT NOT NULL,
+                    security_q2 TEXT NOT NULL,
+                    security_a2 TEXT NOT NULL,
+                    totp_secret TEXT,
+                    totp_enabled INTEGER DEFAULT 0,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            
+            # Sessions table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    device_id TEXT NOT NULL,
+                    token TEXT NOT NULL,
+                    expires_at TEXT NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            ''')
+            
+            # Markers table (for persistent markers)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS markers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    server_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    marker_type TEXT NOT NULL,
+                    x REAL NOT NULL,
+                    y REAL NOT NULL,
+                    description TEXT,
+                    created_at TEXT NOT NULL,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            ''')
         
-        conn.commit()
-        conn.close()
+        self._migrate()
+        # A one-time full rewrite; doing it here keeps it out of the background
+        # maintenance runs, which only ever vacuum incrementally
+        if self.enable_incremental_vacuum():
+            print("Database converted to incremental auto_vacuum")
+    
+    def schema_version(self):
+        """Schema version of the database file (PRAGMA user_version)"""
+        return self._connection().execute('PRAGMA user_version').fetchone()[0]
+    
+    def _migrate(self):
+        """Bring the database file up to SCHEMA_VERSION, one migration per transaction"""
+        conn = self._connection()
+        for version, description, migration in MIGRATIONS:
+            if self.schema_version() >= version:
+                continue
+            # IMMEDIATE takes the write lock first, so two processes opening the
+            # same file cannot both apply a migration
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self.schema_version() < version:
+                    cursor = conn.cursor()
+                    if callable(migration):
+                        migration(cursor)
+                    else:
+                        for statement in migration:
+                            cursor.execute(statement)
+                    cursor.execute(f'PRAGMA user_version = {int(version)}')
+                    print(f"Database migrated to schema version {version}: {description}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
     
     def create_user(self, username, password, security_q1, security_a1, security_q2, security_a2):
         """Create new user account"""
-        conn = None
+        password_hash = self.encryption.hash_password(password)
+        encrypted_a1 = self.encryption.encrypt(security_a1.lower())
+        encrypted_a2 = self.encryption.encrypt(security_a2.lower())
+        
         try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            password_hash = self.encryption.hash_password(password)
-            encrypted_a1 = self.encryption.encrypt(security_a1.lower())
-            encrypted_a2 = self.encryption.encrypt(security_a2.lower())
-            
-            cursor.execute('''
-                INSERT INTO users (username, password_hash, security_q1, security_a1, security_q2, security_a2, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (username, password_hash, security_q1, encrypted_a1, security_q2, encrypted_a2, datetime.now().isoformat()))
-            
-            conn.commit()
-            user_id = cursor.lastrowid
-            return user_id
+            with self._transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO users (username, password_hash, security_q1, security_a1, security_q2, security_a2, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (username, password_hash, security_q1, encrypted_a1, security_q2, encrypted_a2, datetime.now().isoformat()))
+                return cursor.lastrowid
         except sqlite3.IntegrityError:
             return None
-        finally:
-            if conn:
-                conn.close()
     
     def verify_login(self, username, password):
         """Verify user login credentials"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT id, password_hash FROM users WHERE username = ?', (username,))
-            result = cursor.fetchone()
-            
-            if result and self.encryption.verify_password(password, result[1]):
-                return result[0]
-            return None
-        finally:
-            if conn:
-                conn.close()
+        cursor = self._connection().execute('SELECT id, password_hash FROM users WHERE username = ?', (username,))
+        result = cursor.fetchone()
+        
+        if result and self.encryption.verify_password(password, result[1]):
+            return result[0]
+        return None
     
     def get_user_by_username(self, username):
         """Get user details by username"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT * FROM users WHERE username = ?', (username,))
-            result = cursor.fetchone()
-            return result
-        finally:
-            if conn:
-                conn.close()
+        cursor = self._connection().execute('SELECT * FROM users WHERE username = ?', (username,))
+        return cursor.fetchone()
+    
+    def get_username(self, user_id):
+        """Get a user's name by id"""
+        cursor = self._connection().execute('SELECT username FROM users WHERE id = ?', (user_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
     
     def verify_security_answers(self, username, answer1, answer2):
         """Verify security question answers"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT security_a1, security_a2 FROM users WHERE username = ?', (username,))
-            result = cursor.fetchone()
-            
-            if result:
-                decrypted_a1 = self.encryption.decrypt(result[0])
-                decrypted_a2 = self.encryption.decrypt(result[1])
-                return (decrypted_a1 == answer1.lower() and decrypted_a2 == answer2.lower())
-            return False
-        finally:
-            if conn:
-                conn.close()
+        cursor = self._connection().execute('SELECT security_a1, security_a2 FROM users WHERE username = ?',
+                                            (username,))
+        result = cursor.fetchone()
+        
+        if result:
+            decrypted_a1 = self.encryption.decrypt(result[0])
+            decrypted_a2 = self.encryption.decrypt(result[1])
+            return (decrypted_a1 == answer1.lower() and decrypted_a2 == answer2.lower())
+        return False
     
     def reset_password(self, username, new_password):
         """Reset user password"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            password_hash = self.encryption.hash_password(new_password)
+        password_hash = self.encryption.hash_password(new_password)
+        with self._transaction() as cursor:
             cursor.execute('UPDATE users SET password_hash = ? WHERE username = ?', (password_hash, username))
-            
-            conn.commit()
-        finally:
-            if conn:
-                conn.close()
     
     def create_session(self, user_id, device_id, keep_logged_in=False):
         """Create new session token"""
         import secrets
         
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            token = secrets.token_urlsafe(32)
-            expires_at = datetime.now() + timedelta(days=60 if keep_logged_in else 1)
-            
+        token = secrets.token_urlsafe(32)
+        expires_at = datetime.now() + timedelta(days=60 if keep_logged_in else 1)
+        
+        with self._transaction() as cursor:
             cursor.execute('''
                 INSERT INTO sessions (user_id, device_id, token, expires_at)
                 VALUES (?, ?, ?, ?)
             ''', (user_id, device_id, token, expires_at.isoformat()))
-            
-            conn.commit()
-            return token
-        finally:
-            if conn:
-                conn.close()
+        self.session_cache.invalidate(token)
+        return token
     
     def verify_session(self, token, device_id):
         """Verify session token"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                SELECT user_id, expires_at FROM sessions 
-                WHERE token = ? AND device_id = ?
-            ''', (token, device_id))
-            result = cursor.fetchone()
-            
-            if result:
-                expires_at = datetime.fromisoformat(result[1])
-                if expires_at > datetime.now():
-                    return result[0]
-            return None
-        finally:
-            if conn:
-                conn.close()
+        user_id = self.session_cache.get(token, device_id)
+        if user_id is not None:
+            return user_id
+        return self.lookup_session(token, device_id)
+    
+    def lookup_session(self, token, device_id):
+        """Verify session token against the table (and cache it if valid)"""
+        cursor = self._connection().execute('''
+            SELECT user_id, expires_at FROM sessions
+            WHERE token = ? AND device_id = ?
+        ''', (token, device_id))
+        result = cursor.fetchone()
+        
+        if result:
+            expires_at = datetime.fromisoformat(result[1])
+            if expires_at > datetime.now():
+                self.session_cache.put(token, device_id, result[0], expires_at)
+                return result[0]
+        return None
+    
+    def revoke_session(self, token):
+        """Delete a session token (log out)"""
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM sessions WHERE token = ?', (token,))
+        self.session_cache.invalidate(token)
+    
+    def revoke_user_sessions(self, user_id):
+        """Delete every session of a user"""
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM sessions WHERE user_id = ?', (user_id,))
+        self.session_cache.invalidate_user(user_id)
+    
+    def purge_expired_sessions(self, batch_size=500):
+        """Delete expired sessions, batch_size rows per transaction; returns rows deleted"""
+        now = datetime.now().isoformat()
+        purged = 0
+        while True:
+            # Short transactions so logins and the hub never wait long on the write lock
+            with self._transaction() as cursor:
+                cursor.execute('''
+                    DELETE FROM sessions WHERE id IN (
+                        SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?
+                    )
+                ''', (now, batch_size))
+                deleted = cursor.rowcount
+            purged += deleted
+            if deleted < batch_size:
+                return purged
+    
+    def auto_vacuum_mode(self):
+        """PRAGMA auto_vacuum of the file: 0 none, 1 full, 2 incremental"""
+        return self._connection().execute('PRAGMA auto_vacuum').fetchone()[0]
+    
+    def enable_incremental_vacuum(self):
+        """Switch a file created without auto_vacuum to incremental (rewrites it once)"""
+        if self.auto_vacuum_mode() == 2:
+            return False
+        conn = self._connection()
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return True
+    
+    def incremental_vacuum(self, pages=1000):
+        """Return up to `pages` free pages to the filesystem; returns pages freed"""
+        conn = self._connection()
+        before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+        return before - conn.execute('PRAGMA freelist_count').fetchone()[0]
+    
+    def optimize(self):
+        """Let SQLite refresh statistics for the indexes it has been using"""
+        self._connection().execute('PRAGMA optimize')
+    
+    def encrypted_user_fields(self, after_id, limit):
+        """Up to `limit` (id, security_a1, security_a2, totp_secret) rows with id > after_id"""
+        cursor = self._connection().execute('''
+            SELECT id, security_a1, security_a2, totp_secret FROM users
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (after_id, limit))
+        return cursor.fetchall()
+    
+    def replace_encrypted_user_fields(self, changes):
+        """Apply (old_row, new_row) pairs from encrypted_user_fields in one transaction
+        
+        A row is only replaced if it still holds the old values, so a concurrent
+        write (TOTP enabled, password reset) is never overwritten. Returns rows replaced.
+        """
+        replaced = 0
+        with self._transaction() as cursor:
+            for (user_id, old_a1, old_a2, old_totp), (_, new_a1, new_a2, new_totp) in changes:
+                cursor.execute('''
+                    UPDATE users SET security_a1 = ?, security_a2 = ?, totp_secret = ?
+                    WHERE id = ? AND security_a1 IS ? AND security_a2 IS ? AND totp_secret IS ?
+                ''', (new_a1, new_a2, new_totp, user_id, old_a1, old_a2, old_totp))
+                replaced += cursor.rowcount
+        return replaced
     
     def enable_totp(self, user_id, totp_secret):
         """Enable TOTP for user"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            encrypted_secret = self.encryption.encrypt(totp_secret)
-            cursor.execute('UPDATE users SET totp_secret = ?, totp_enabled = 1 WHERE id = ?', 
+        encrypted_secret = self.encryption.encrypt(totp_secret)
+        with self._transaction() as cursor:
+            cursor.execute('UPDATE users SET totp_secret = ?, totp_enabled = 1 WHERE id = ?',
                           (encrypted_secret, user_id))
-            
-            conn.commit()
-        finally:
-            if conn:
-                conn.close()
+    
+    def disable_totp(self, user_id):
+        """Disable TOTP for user"""
+        with self._transaction() as cursor:
+            cursor.execute('UPDATE users SET totp_enabled = 0 WHERE id = ?', (user_id,))
     
     def get_totp_secret(self, user_id):
         """Get TOTP secret for user"""
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path, timeout=10.0)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT totp_secret, totp_enabled FROM users WHERE id = ?', (user_id,))
-            result = cursor.fetchone()
-            
-            if result and result[1] == 1:
-                return self.encryption.decrypt(result[0])
-            return None
-        finally:
-            if conn:
-                conn.close()
+        cursor = self._connection().execute('SELECT totp_secret, totp_enabled FROM users WHERE id = ?', (user_id,))
+        result = cursor.fetchone()
+        
+        if result and result[1] == 1:
+            return self.encryption.decrypt(result[0])
+        return None
+    
+    def save_marker_changes(self, upserts, deletes):
+        """Write a batch of hub markers (dicts) and deleted marker ids in one transaction"""
+        with self._transaction() as cursor:
+            cursor.executemany('''
+                INSERT OR REPLACE INTO markers (marker_uid, server_id, user_id, marker_type, x, y, description, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(marker['id'], marker['server_id'], marker['user_id'], marker['type'], marker['x'], marker['y'],
+                   marker.get('description', ''), marker.get('timestamp') or datetime.now().isoformat())
+                  for marker in upserts])
+            cursor.executemany('DELETE FROM markers WHERE marker_uid = ?', [(marker_id,) for marker_id in deletes])
+    
+    def load_markers(self, server_id=None):
+        """Hub markers as dicts grouped by server_id (only one server's if given)"""
+        query = '''
+            SELECT marker_uid, server_id, user_id, marker_type, x, y, description, created_at
+            FROM markers WHERE marker_uid IS NOT NULL
+        '''
+        if server_id is None:
+            cursor = self._connection().execute(query + ' ORDER BY id')
+        else:
+            cursor = self._connection().execute(query + ' AND server_id = ? ORDER BY id', (server_id,))
+        markers = {}
+        for marker_uid, server_id, user_id, marker_type, x, y, description, created_at in cursor.fetchall():
+            markers.setdefault(server_id, []).append({
+                'id': marker_uid,
+                'server_id': server_id,
+                'user_id': user_id,
+                'type': marker_type,
+                'x': x,
+                'y': y,
+                'description': description or '',
+                'timestamp': created_at
+            })
+        return markers
+    
+    def history_segments(self):
+        """Start times of the position history segments present, oldest first"""
+        return _history_tables(self._connection(), HISTORY_TABLE_PREFIX)
+    
+    def rollup_intervals(self):
+        """Intervals (seconds) of the downsampled history tables present"""
+        return _history_tables(self._connection(), ROLLUP_TABLE_PREFIX)
+    
+    def save_position_history(self, rows_by_segment):
+        """Append quantized (server_id, user_id, t_ms, x, y) rows, grouped by segment start"""
+        with self._transaction() as cursor:
+            for segment, rows in rows_by_segment.items():
+                table = f'{HISTORY_TABLE_PREFIX}{int(segment)}'
+                # Rotation: the first rows of a new segment create its table
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        server_id INTEGER NOT NULL,
+                        user_id INTEGER NOT NULL,
+                        t INTEGER NOT NULL,
+                        x INTEGER NOT NULL,
+                        y INTEGER NOT NULL,
+                        PRIMARY KEY (server_id, user_id, t)
+                    ) WITHOUT ROWID
+                ''')
+                cursor.executemany(f'INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?, ?)', rows)
+    
+    def load_position_history(self, server_id, start, end, user_id=None, interval=None):
+        """Positions recorded for a server between two unix times, as dicts ordered by time
+        
+        With `interval`, reads that rollup tier (one averaged position per
+        player per `interval` seconds) instead of the raw segments.
+        """
+        query = 'SELECT user_id, t, x, y FROM {} WHERE server_id = ? AND t >= ? AND t < ?'
+        params = [server_id, int(start * 1000), int(end * 1000)]
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            params.append(user_id)
+        conn = self._connection()
+        if interval is not None:
+            tables = [f'{ROLLUP_TABLE_PREFIX}{int(interval)}'] if int(interval) in self.rollup_intervals() else []
+        else:
+            tables = []
+            segments = self.history_segments()
+            for i, segment in enumerate(segments):
+                segment_end = segments[i + 1] if i + 1 < len(segments) else float('inf')
+                if segment_end > start and segment < end:
+                    tables.append(f'{HISTORY_TABLE_PREFIX}{segment}')
+        positions = []
+        for table in tables:
+            for uid, t, x, y in conn.execute(query.format(table), params):
+                positions.append({
+                    'user_id': uid,
+                    't': t / 1000,
+                    'x': x / HISTORY_QUANTUM,
+                    'y': y / HISTORY_QUANTUM
+                })
+        positions.sort(key=lambda position: position['t'])
+        return positions
+    
+    def drop_history_segment(self, segment):
+        """Delete one position history segment"""
+        with self._transaction() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {HISTORY_TABLE_PREFIX}{int(segment)}')
+    
+    def _create_rollup_table(self, cursor, interval):
+        table = f'{ROLLUP_TABLE_PREFIX}{int(interval)}'
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                server_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                t INTEGER NOT NULL,
+                x INTEGER NOT NULL,
+                y INTEGER NOT NULL,
+                PRIMARY KEY (server_id, user_id, t)
+            ) WITHOUT ROWID
+        ''')
+        # Whole-server time range queries
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table}(server_id, t)')
+        return table
+    
+    def history_servers(self, segment):
+        """Server ids with rows in a raw history segment"""
+        cursor = self._connection().execute(f'SELECT DISTINCT server_id FROM {HISTORY_TABLE_PREFIX}{int(segment)}')
+        return [server_id for (server_id,) in cursor.fetchall()]
+    
+    def rollup_servers(self, interval):
+        """Server ids with rows in a rollup tier"""
+        cursor = self._connection().execute(f'SELECT DISTINCT server_id FROM {ROLLUP_TABLE_PREFIX}{int(interval)}')
+        return [server_id for (server_id,) in cursor.fetchall()]
+    
+    def _rollup(self, cursor, source, server_id, interval, cutoff_ms):
+        """Average a server's rows in `source` older than cutoff_ms into the `interval` tier"""
+        target = self._create_rollup_table(cursor, interval)
+        bucket = int(interval) * 1000
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO {target} (server_id, user_id, t, x, y)
+            SELECT server_id, user_id, (t / {bucket}) * {bucket},
+                   CAST(ROUND(AVG(x)) AS INTEGER), CAST(ROUND(AVG(y)) AS INTEGER)
+            FROM {source} WHERE server_id = ? AND t < ?
+            GROUP BY user_id, t / {bucket}
+        ''', (server_id, cutoff_ms))
+        return cursor.rowcount
+    
+    def compact_history_segment(self, segment, server_id, interval=None):
+        """Move a server's rows out of a raw segment into the `interval` rollup tier
+        (or just delete them if None); drops the segment once it is empty.
+        Returns (raw rows removed, rollup rows written)."""
+        source = f'{HISTORY_TABLE_PREFIX}{int(segment)}'
+        with self._transaction() as cursor:
+            written = 0
+            if interval is not None:
+                written = self._rollup(cursor, source, server_id, interval, 2 ** 62)
+            cursor.execute(f'DELETE FROM {source} WHERE server_id = ?', (server_id,))
+            removed = cursor.rowcount
+            if cursor.execute(f'SELECT 1 FROM {source} LIMIT 1').fetchone() is None:
+                cursor.execute(f'DROP TABLE {source}')
+        return removed, written
+    
+    def compact_rollup(self, server_id, interval, cutoff, next_interval=None):
+        """Move a server's `interval` tier rows older than unix time `cutoff` into the
+        `next_interval` tier (or just delete them if None).
+        Returns (rows removed, next tier rows written)."""
+        source = f'{ROLLUP_TABLE_PREFIX}{int(interval)}'
+        cutoff_ms = int(cutoff * 1000)
+        if self._connection().execute(f'SELECT 1 FROM {source} WHERE server_id = ? AND t < ? LIMIT 1',
+                                      (server_id, cutoff_ms)).fetchone() is None:
+            return 0, 0
+        with self._transaction() as cursor:
+            written = 0
+            if next_interval is not None:
+                written = self._rollup(cursor, source, server_id, next_interval, cutoff_ms)
+            cursor.execute(f'DELETE FROM {source} WHERE server_id = ? AND t < ?', (server_id, cutoff_ms))
+            removed = cursor.rowcount
+        return removed, written
@@ -0,0 +1,119 @@
+"""Periodic database housekeeping on a background thread
+
+Every login inserts a sessions row and nothing else ever deletes one, so a
+long-running install grows without bound. DatabaseMaintenance periodically:
+
+- deletes expired sessions in small batches (short write transactions),
+- rolls position history up into its retention tiers and drops what has
+  aged out (core.history_retention), when given the per-server policies,
+- hands free pages back to the filesystem with an incremental vacuum,
+- runs PRAGMA optimize so the query planner statistics stay current.
+
+Each run's rows purged, pages freed and time taken are logged and kept in
+stats() / last_run.
+"""
+
+import logging
+import threading
+import time
+from core.history_retention import compact_history
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between maintenance runs
+DEFAULT_MAINTENANCE_INTERVAL = 3600.0
+
+# Seconds after start() before the first run, to keep app startup quiet
+DEFAULT_FIRST_RUN_DELAY = 30.0
+
+# Expired sessions deleted per write transaction
+DEFAULT_PURGE_BATCH_SIZE = 500
+
+# Free pages released per run
+DEFAULT_VACUUM_PAGES = 1000
+
+
+class DatabaseMaintenance:
+    """Runs purge / vacuum / optimize on a daemon thread"""
+    
+    def __init__(self, db, interval=DEFAULT_MAINTENANCE_INTERVAL, first_run_delay=DEFAULT_FIRST_RUN_DELAY,
+                 batch_size=DEFAULT_PURGE_BATCH_SIZE, vacuum_pages=DEFAULT_VACUUM_PAGES, history_retention=None):
+        self.db = db
+        # server_id -> RetentionPolicy (e.g. ServerManager.get_history_retention);
+        # None leaves position history alone
+        self.history_retention = history_retention
+        self.interval = interval
+        self.first_run_delay = first_run_delay
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.runs = 0
+        self.failed_runs = 0
+        self.sessions_purged = 0
+        self.pages_freed = 0
+        self.history_rows_removed = 0
+        self.last_run = None
+    
+    def run_once(self):
+        """One maintenance pass; returns what it did"""
+        start = time.perf_counter()
+        purged = self.db.purge_expired_sessions(self.batch_size)
+        history = None
+        if self.history_retention is not None:
+            # Before the vacuum, so dropped segments are released this run
+            history = compact_history(self.db, self.history_retention)
+        freed = self.db.incremental_vacuum(self.vacuum_pages)
+        self.db.optimize()
+        self.last_run = {
+            'sessions_purged': purged,
+            'pages_freed': freed,
+            'history': history,
+            'seconds': round(time.perf_counter() - start, 4)
+        }
+        self.runs += 1
+        self.sessions_purged += purged
+        self.pages_freed += freed
+        if history is not None:
+            self.history_rows_removed += history['raw_rows_removed'] + history['rollup_rows_removed']
+        logger.info(f"Database maintenance: purged {purged} expired sessions, compacted history {history}, "
+                    f"freed {freed} pages in {self.last_run['seconds']:.3f}s")
+        return self.last_run
+    
+    def start(self):
+        """Start the background thread"""
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='db-maintenance', daemon=True)
+            self.thread.start()
+        return self.thread
+    
+    def run(self):
+        """Thread body: run every interval seconds until stop()"""
+        delay = self.first_run_delay
+        while not self.stop_event.wait(delay):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.failed_runs += 1
+                logger.error(f"Database maintenance failed: {e}")
+            delay = self.interval
+    
+    def stop(self):
+        """Stop the background thread (an in-progress run finishes first)"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+    
+    def stats(self):
+        """Maintenance counters for metrics"""
+        return {
+            'runs': self.runs,
+            'failed_runs': self.failed_runs,
+            'sessions_purged': self.sessions_purged,
+            'pages_freed': self.pages_freed,
+            'history_rows_removed': self.history_rows_removed,
+            'last_run': self.last_run
+        }
@@ -0,0 +1,163 @@
+"""Delta-encoded player position stream
+
+Instead of resending every player record each tick, clients that opt into the
+delta protocol get:
+
+- positions_keyframe: the full player table, with compact numeric indices,
+  usernames, teams and quantized coordinates. It is sent on join and every
+  `keyframe_interval` ticks.
+- positions_delta: per tick, a flat list of [index, dx, dy, ...] triples with
+  the quantized movement of each player that moved, plus `add` entries for
+  players that are new or whose name/team changed.
+
+Coordinates are quantized to 1/POSITION_SCALE map units (0.1 m by default).
+"""
+
+
+# Quantization factor for x/y (units per map meter)
+POSITION_SCALE = 10
+
+# Ticks between periodic keyframes
+DEFAULT_KEYFRAME_INTERVAL = 50
+
+
+def quantize(value, scale=POSITION_SCALE):
+    """Quantize a coordinate to an integer in 1/scale units (0 if it is not a finite number)"""
+    try:
+        return int(round(float(value) * scale))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+class DeltaEncoder:
+    """Per-room baseline of what delta clients last received"""
+    
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, scale=POSITION_SCALE):
+        self.keyframe_interval = keyframe_interval
+        self.scale = scale
+        self.tick = 0
+        self.indices = {}
+        self.next_index = 0
+        # index -> [user_id, username, team, qx, qy]
+        self.players = {}
+        # Set when ticks were skipped without encoding (no delta clients)
+        self.stale = False
+    
+    def _index_for(self, user_id):
+        index = self.indices.get(user_id)
+        if index is None:
+            index = self.next_index
+            self.next_index += 1
+            self.indices[user_id] = index
+        return index
+    
+    def _entry(self, index):
+        user_id, username, team, qx, qy = self.players[index]
+        return [index, user_id, username, team, qx, qy]
+    
+    def resync(self, player_positions):
+        """Rebuild the baseline from full room state (only safe with no delta clients)"""
+        self.players = {}
+        for user_id, player in player_positions.items():
+            index = self._index_for(user_id)
+            self.players[index] = [user_id, player.get('username', ''), player.get('team', 'neutral'),
+                                   quantize(player.get('x'), self.scale), quantize(player.get('y'), self.scale)]
+        self.stale = False
+    
+    def keyframe(self, server_id):
+        """Full player table at the current baseline"""
+        return {
+            'type': 'positions_keyframe',
+            'server_id': server_id,
+            'tick': self.tick,
+            'scale': self.scale,
+            'players': [self._entry(index) for index in self.players]
+        }
+    
+    def encode(self, server_id, positions):
+        """Advance the baseline and return the frame to send
+        
+        Returns a positions_keyframe every keyframe_interval frames, otherwise a
+        positions_delta. Returns None when nothing visible changed; such ticks do
+        not use up a tick number, so decoders see an unbroken sequence.
+        """
+        added = []
+        moved = []
+        for player in positions:
+            index = self._index_for(player['user_id'])
+            qx = quantize(player.get('x'), self.scale)
+            qy = quantize(player.get('y'), self.scale)
+            username = player.get('username', '')
+            team = player.get('team', 'neutral')
+            known = self.players.get(index)
+            if known is None or known[1] != username or known[2] != team:
+                self.players[index] = [player['user_id'], username, team, qx, qy]
+                added.append(self._entry(index))
+            elif known[3] != qx or known[4] != qy:
+                moved.extend((index, qx - known[3], qy - known[4]))
+                known[3] = qx
+                known[4] = qy
+        
+        tick = self.tick + 1
+        keyframe_due = self.keyframe_interval and tick % self.keyframe_interval == 0
+        if not keyframe_due and not added and not moved:
+            return None
+        self.tick = tick
+        if keyframe_due:
+            return self.keyframe(server_id)
+        
+        frame = {
+            'type': 'positions_delta',
+            'server_id': server_id,
+            'tick': self.tick,
+            'd': moved
+        }
+        if added:
+            frame['add'] = added
+        return frame
+
+
+class DeltaDecoder:
+    """Client-side reconstruction of player positions from the delta stream"""
+    
+    def __init__(self):
+        self.scale = POSITION_SCALE
+        self.tick = None
+        # index -> [user_id, username, team, qx, qy]
+        self.players = {}
+    
+    def apply(self, message):
+        """Apply a keyframe or delta; returns False if the delta had to be ignored"""
+        if message['type'] == 'positions_keyframe':
+            self.scale = message.get('scale', POSITION_SCALE)
+            self.players = {entry[0]: list(entry[1:]) for entry in message['players']}
+            self.tick = message['tick']
+            return True
+        
+        # Deltas only make sense on top of the previous tick
+        if self.tick is None or message['tick'] != self.tick + 1:
+            self.tick = None
+            return False
+        for entry in message.get('add', []):
+            self.players[entry[0]] = list(entry[1:])
+        deltas = message['d']
+        for i in range(0, len(deltas), 3):
+            player = self.players.get(deltas[i])
+            if player is not None:
+                player[3] += deltas[i + 1]
+                player[4] += deltas[i + 2]
+        self.tick = message['tick']
+        return True
+    
+    def positions(self):
+        """Current player positions keyed by user_id, in map units"""
+        return {
+            user_id: {
+                'user_id': user_id,
+                'username': username,
+                'team': team,
+                'x': qx / self.scale,
+                'y': qy / self.scale
+            }
+            for user_id, username, team, qx, qy in self.players.values()
+        }
@@ -1,45 +1,164 @@
 import os
 import base64
 import hashlib
-from cryptography.fernet import Fernet
+import threading
+from cryptography.fernet import Fernet, MultiFernet
+
+
+# Stored ciphertext is this prefix followed by the Fernet token as is. The
+# first format base64-encoded the (already base64) token a second time; those
+# values have no prefix and are converted by a schema migration.
+CIPHERTEXT_PREFIX = 'v2:'
+
+# Base64 of a Fernet token's first bytes (version 0x80 + timestamp high bytes)
+_LEGACY_TOKEN_START = b'gAAAAA'
+
+
+def upgrade_ciphertext(value):
+    """Compact form of a first-format ciphertext (no key needed); other values unchanged"""
+    if not value or value.startswith(CIPHERTEXT_PREFIX):
+        return value
+    try:
+        token = base64.b64decode(value.encode(), validate=True)
+    except (ValueError, TypeError):
+        return value
+    if not token.startswith(_LEGACY_TOKEN_START):
+        return value
+    return CIPHERTEXT_PREFIX + token.decode()
+
+
+def _token(encrypted_data):
+    if encrypted_data.startswith(CIPHERTEXT_PREFIX):
+        return encrypted_data[len(CIPHERTEXT_PREFIX):].encode()
+    # First format, for values not migrated yet
+    return base64.b64decode(encrypted_data.encode())
 
 
 class EncryptionManager:
+    """Fernet encryption with a keyring
+    
+    data/.key holds one key per line, newest first. The first key encrypts;
+    every key decrypts, so values written under an older key keep working
+    while core.key_rotation re-encrypts them. A file with a single key (as
+    created by earlier versions) is a keyring of one.
+    
+    The keyring is re-read when the file changes, so every process sharing
+    the data directory picks up a rotation.
+    """
+    
     def __init__(self, app_path):
         self.app_path = app_path
         self.key_file = os.path.join(app_path, 'data', '.key')
-        self.key = self._get_or_create_key()
-        self.cipher = Fernet(self.key)
+        self._keyring_lock = threading.Lock()
+        self._keyring_mtime = None
+        self.keys = self._get_or_create_keys()
+        self._load_cipher()
     
-    def _get_or_create_key(self):
-        """Get existing encryption key or create a new one"""
+    def _get_or_create_keys(self):
+        """Get the existing keyring or create one with a new key"""
         os.makedirs(os.path.dirname(self.key_file), exist_ok=True)
         
         if os.path.exists(self.key_file):
             with open(self.key_file, 'rb') as f:
-                return f.read()
-        else:
-            key = Fernet.generate_key()
-            with open(self.key_file, 'wb') as f:
-                f.write(key)
-            return key
+                keys = [line.strip() for line in f.read().splitlines() if line.strip()]
+            if keys:
+                self._keyring_mtime = os.stat(self.key_file).st_mtime_ns
+                return keys
+        keys = [Fernet.generate_key()]
+        self._write_keys(keys)
+        return keys
+    
+    def _write_keys(self, keys):
+        # Replace atomically so another process never reads half a keyring
+        tmp_file = f'{self.key_file}.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(b'\n'.join(keys))
+        os.replace(tmp_file, self.key_file)
+        self._keyring_mtime = os.stat(self.key_file).st_mtime_ns
+    
+    def _load_cipher(self):
+        self.key = self.keys[0]
+        self.cipher = MultiFernet([Fernet(key) for key in self.keys])
+    
+    def _refresh_keyring(self):
+        """Reload the keyring if another process has rotated it"""
+        try:
+            mtime = os.stat(self.key_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._keyring_mtime:
+            with self._keyring_lock:
+                self.keys = self._get_or_create_keys()
+                self._load_cipher()
+    
+    def add_key(self):
+        """Generate a new primary key; older keys stay for decryption. Returns the new key."""
+        with self._keyring_lock:
+            self.keys = [Fernet.generate_key()] + self.keys
+            self._write_keys(self.keys)
+            self._load_cipher()
+        return self.key
+    
+    def retire_old_keys(self):
+        """Drop every key but the primary (once nothing is encrypted under them)"""
+        with self._keyring_lock:
+            self.keys = self.keys[:1]
+            self._write_keys(self.keys)
+            self._load_cipher()
+    
+    def is_current(self, encrypted_data):
+        """Whether a ciphertext decrypts with the primary key"""
+        try:
+            Fernet(self.key).decrypt(_token(encrypted_data))
+            return True
+        except Exception:
+            return False
     
     def encrypt(self, data: str) -> str:
         """Encrypt string data"""
+        self._refresh_keyring()
         if isinstance(data, str):
             data = data.encode()
-        encrypted = self.cipher.encrypt(data)
-        return base64.b64encode(encrypted).decode()
+        return CIPHERTEXT_PREFIX + self.cipher.encrypt(data).decode()
     
     def decrypt(self, encrypted_data: str) -> str:
         """Decrypt string data"""
+        self._refresh_keyring()
         try:
-            encrypted_bytes = base64.b64decode(encrypted_data.encode())
-            decrypted = self.cipher.decrypt(encrypted_bytes)
-            return decrypted.decode()
+            return self.cipher.decrypt(_token(encrypted_data)).decode()
         except Exception:
             return None
     
+    def rotate(self, encrypted_data):
+        """Re-encrypt a ciphertext under the primary key (None if no key can read it)"""
+        try:
+            return CIPHERTEXT_PREFIX + self.cipher.rotate(_token(encrypted_data)).decode()
+        except Exception:
+            return None
+    
+    def encrypt_many(self, values):
+        """encrypt() over a list of strings"""
+        self._refresh_keyring()
+        encrypt = self.cipher.encrypt
+        return [CIPHERTEXT_PREFIX + encrypt(value.encode() if isinstance(value, str) else value).decode()
+                for value in values]
+    
+    def decrypt_many(self, values):
+        """decrypt() over a list of ciphertexts (None for any that fail)"""
+        self._refresh_keyring()
+        decrypt = self.cipher.decrypt
+        results = []
+        for value in values:
+            try:
+                results.append(decrypt(_token(value)).decode())
+            except Exception:
+                results.append(None)
+        return results
+    
+    def rotate_many(self, values):
+        """rotate() over a list of ciphertexts; None values stay None"""
+        return [self.rotate(value) if value is not None else None for value in values]
+    
     @staticmethod
     def hash_password(password: str) -> str:
         """Hash password using SHA-256"""
@@ -0,0 +1,114 @@
+"""Retention tiers for position history
+
+Each server in config/servers.json may carry a "history_retention" entry:
+    
+    "history_retention": {
+        "raw_hours": 24,
+        "tiers": [
+            {"interval": 1, "hours": 168},
+            {"interval": 10, "hours": 2160}
+        ]
+    }
+
+Raw 10 Hz history is kept for `raw_hours`. After that it is averaged into
+one position per player per `interval` seconds of the first tier, which is
+kept until it is `hours` old and then averaged into the next tier, and so on.
+The last tier's rows are deleted when they age out. With no tiers, raw
+history is simply deleted after `raw_hours`.
+
+compact_history() applies the policies. DatabaseMaintenance runs it in the
+background, so storage stays bounded: at most raw_hours of raw rows plus
+each tier's own window at its own resolution.
+"""
+
+import time
+from collections import namedtuple
+from core.position_history import DEFAULT_SEGMENT_SECONDS
+
+
+RetentionPolicy = namedtuple('RetentionPolicy', ['raw_hours', 'tiers'])
+
+# Used for servers without (or with an invalid) "history_retention" entry
+DEFAULT_HISTORY_RETENTION = {
+    'raw_hours': 24,
+    'tiers': [
+        {'interval': 1, 'hours': 24 * 7},
+        {'interval': 10, 'hours': 24 * 90}
+    ]
+}
+
+
+def parse_retention(config):
+    """RetentionPolicy from a servers.json "history_retention" dict (or None for the default)
+    
+    Raises ValueError if the entry is malformed. Tier intervals must be whole
+    seconds, each a multiple of the one before, and tiers must be kept
+    longer than the data they are built from.
+    """
+    if config is None:
+        config = DEFAULT_HISTORY_RETENTION
+    try:
+        raw_hours = float(config['raw_hours'])
+        tiers = tuple((int(tier['interval']), float(tier['hours'])) for tier in config.get('tiers', []))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise ValueError(f"Invalid history_retention: {e}")
+    if raw_hours < 0:
+        raise ValueError("history_retention.raw_hours must not be negative")
+    previous_interval, previous_hours = None, raw_hours
+    for interval, hours in tiers:
+        if interval < 1:
+            raise ValueError("Rollup intervals must be at least 1 second")
+        if previous_interval is not None and interval % previous_interval:
+            raise ValueError(f"Rollup interval {interval}s is not a multiple of {previous_interval}s")
+        if DEFAULT_SEGMENT_SECONDS % interval and interval % DEFAULT_SEGMENT_SECONDS:
+            raise ValueError(f"Rollup interval {interval}s does not divide into history segments")
+        if hours <= previous_hours:
+            raise ValueError("Each retention tier must be kept longer than the one before")
+        previous_interval, previous_hours = interval, hours
+    return RetentionPolicy(raw_hours, tiers)
+
+
+def compact_history(db, policy_for, now=None, segment_seconds=DEFAULT_SEGMENT_SECONDS):
+    """Apply retention policies to the stored history
+    
+    `policy_for(server_id)` returns that server's RetentionPolicy. Returns
+    counts of raw rows rolled up or deleted, rollup rows written and
+    deleted, and raw segments dropped.
+    """
+    if now is None:
+        now = time.time()
+    stats = {'raw_rows_removed': 0, 'rollup_rows_written': 0, 'rollup_rows_removed': 0, 'segments_dropped': 0}
+    
+    # Raw segments, whole segments at a time once they are past raw_hours
+    for segment in db.history_segments():
+        segment_end = segment + segment_seconds
+        for server_id in db.history_servers(segment):
+            policy = policy_for(server_id)
+            if segment_end > now - policy.raw_hours * 3600:
+                continue
+            interval = policy.tiers[0][0] if policy.tiers else None
+            removed, written = db.compact_history_segment(segment, server_id, interval)
+            stats['raw_rows_removed'] += removed
+            stats['rollup_rows_written'] += written
+        if segment not in db.history_segments():
+            stats['segments_dropped'] += 1
+    
+    # Each rollup tier into the next, coarsest first so rows moved up in this
+    # run are not moved again
+    for interval in reversed(db.rollup_intervals()):
+        for server_id in db.rollup_servers(interval):
+            tiers = policy_for(server_id).tiers
+            intervals = [tier[0] for tier in tiers]
+            if interval not in intervals:
+                # Tier no longer configured for this server; leave it alone
+                continue
+            index = intervals.index(interval)
+            cutoff = now - tiers[index][1] * 3600
+            next_interval = intervals[index + 1] if index + 1 < len(tiers) else None
+            if next_interval is not None:
+                # Never split a bucket of the next tier across two runs
+                cutoff -= cutoff % next_interval
+            removed, written = db.compact_rollup(server_id, interval, cutoff, next_interval)
+            stats['rollup_rows_removed'] += removed
+            stats['rollup_rows_written'] += written
+    return stats
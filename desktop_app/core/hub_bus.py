@@ -0,0 +1,197 @@
+"""Local pub/sub bus shared by WebSocket hub workers
+
+With `--workers N` several hub processes listen on the same port
+(SO_REUSEPORT) and every client lands on one of them. Room state stays
+consistent because no worker mutates a room directly: marker, chat and
+position events are published on the bus, and every worker (including the
+one that published) applies them in the order the bus delivers them.
+
+Two transports, same interface (subscribe / publish / connect / close):
+
+- InProcessBus: delivers synchronously to every hub in this process. Used
+  when several hubs share one event loop, and in tests.
+- UnixSocketBus: connects to a BusBroker over a Unix domain socket. The
+  broker runs in the parent process and relays every frame to all workers
+  in the order it received them, so the broker is the single sequencer.
+
+Frames on the Unix socket are a 4-byte big-endian length followed by the
+event, MessagePack-encoded when available and JSON otherwise. No external
+broker is needed.
+"""
+
+import asyncio
+import logging
+import os
+import struct
+
+from core import wire_format
+
+logger = logging.getLogger(__name__)
+
+
+# Encoding used between workers (never negotiated; all workers share a build)
+BUS_ENCODING = wire_format.MSGPACK if wire_format.msgpack is not None else wire_format.JSON
+
+_LENGTH = struct.Struct('>I')
+
+
+def pack_event(event):
+    """Length-prefixed bus frame for an event dict"""
+    data = wire_format.encode(event, BUS_ENCODING)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return _LENGTH.pack(len(data)) + data
+
+
+def unpack_event(data):
+    """Event dict from a bus frame body"""
+    if BUS_ENCODING == wire_format.JSON:
+        data = data.decode('utf-8')
+    return wire_format.decode(data)
+
+
+async def read_frame(reader):
+    """Read one frame body; raises asyncio.IncompleteReadError at EOF"""
+    header = await reader.readexactly(_LENGTH.size)
+    return await reader.readexactly(_LENGTH.unpack(header)[0])
+
+
+class InProcessBus:
+    """Bus for hubs sharing one process; publish() delivers immediately"""
+    
+    def __init__(self):
+        self.handlers = []
+    
+    def subscribe(self, handler):
+        """Call handler(event) for every published event"""
+        self.handlers.append(handler)
+    
+    async def connect(self):
+        """Nothing to connect; present for interface parity"""
+    
+    def publish(self, event):
+        """Deliver an event to every subscriber, in subscription order"""
+        for handler in list(self.handlers):
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Bus handler failed for {event.get('type')}: {e}")
+    
+    async def close(self):
+        """Drop all subscribers"""
+        self.handlers = []
+
+
+class UnixSocketBus:
+    """Worker-side connection to a BusBroker"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.handlers = []
+        self.reader = None
+        self.writer = None
+        self.reader_task = None
+        # Resolved when the broker connection is lost
+        self.closed = None
+    
+    def subscribe(self, handler):
+        """Call handler(event) for every event relayed by the broker"""
+        self.handlers.append(handler)
+    
+    async def connect(self):
+        """Connect to the broker and start delivering events"""
+        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+        self.closed = asyncio.get_running_loop().create_future()
+        self.reader_task = asyncio.create_task(self.run_reader())
+    
+    def publish(self, event):
+        """Send an event to the broker; it comes back to every worker including this one"""
+        if self.writer is None or self.writer.is_closing():
+            logger.warning(f"Bus not connected, dropping {event.get('type')} event")
+            return
+        self.writer.write(pack_event(event))
+    
+    async def run_reader(self):
+        """Deliver relayed events until the broker goes away"""
+        try:
+            while True:
+                event = unpack_event(await read_frame(self.reader))
+                for handler in list(self.handlers):
+                    try:
+                        handler(event)
+                    except Exception as e:
+                        logger.error(f"Bus handler failed for {event.get('type')}: {e}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning("Lost connection to hub bus broker")
+        except ValueError as e:
+            logger.error(f"Invalid bus frame: {e}")
+        finally:
+            if not self.closed.done():
+                self.closed.set_result(None)
+    
+    async def close(self):
+        """Disconnect from the broker"""
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            self.reader_task = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class BusBroker:
+    """Relays bus frames between workers over a Unix domain socket
+    
+    Frames are forwarded as opaque bytes, in arrival order, to every
+    connected worker, which makes the broker the total order for room events.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.writers = []
+        self.worker_tasks = set()
+        self.server = None
+        self.frames_relayed = 0
+    
+    async def start(self):
+        """Start listening on the socket path (a stale socket file is replaced)"""
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_worker, self.path)
+        return self.server
+    
+    async def handle_worker(self, reader, writer):
+        """Relay everything a worker publishes to all workers"""
+        self.writers.append(writer)
+        task = asyncio.current_task()
+        self.worker_tasks.add(task)
+        logger.info(f"Hub worker connected to bus ({len(self.writers)} connected)")
+        try:
+            while True:
+                body = await read_frame(reader)
+                frame = _LENGTH.pack(len(body)) + body
+                for peer in list(self.writers):
+                    peer.write(frame)
+                self.frames_relayed += 1
+                await asyncio.gather(*(peer.drain() for peer in list(self.writers)),
+                                     return_exceptions=True)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.writers.remove(writer)
+            self.worker_tasks.discard(task)
+            writer.close()
+            logger.info(f"Hub worker left bus ({len(self.writers)} connected)")
+    
+    async def stop(self):
+        """Close the listening socket and all worker connections"""
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for writer in list(self.writers):
+            writer.close()
+        # Closing the transports ends each relay loop with EOF
+        await asyncio.gather(*self.worker_tasks, return_exceptions=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
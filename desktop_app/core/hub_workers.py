@@ -0,0 +1,114 @@
+"""Run the WebSocket hub as several worker processes on one port
+
+Each worker is a normal WebSocketServer on its own event loop, bound with
+SO_REUSEPORT so the kernel spreads incoming connections across them. The
+parent process runs the BusBroker that workers use to share room events
+(see core.hub_bus) and stops everything if a worker dies.
+
+SO_REUSEPORT load balancing needs Linux (or another platform that exposes
+the option); on Windows the hub only runs as a single process.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import uuid
+
+from core.database import Database
+from core.hub_bus import BusBroker, UnixSocketBus
+from core.marker_store import MarkerStore
+from core.position_history import PositionHistory
+from core.async_database import AsyncDatabase
+from core.server_manager import ServerManager
+from core.server_poller import ServerPoller
+from core.websocket_server import WebSocketServer
+
+logger = logging.getLogger(__name__)
+
+
+# Worker mode needs both SO_REUSEPORT and Unix domain sockets
+WORKERS_SUPPORTED = hasattr(socket, 'SO_REUSEPORT') and hasattr(socket, 'AF_UNIX')
+
+
+def run_worker(bus_path, options, app_path=None, persist=False, config_path=None):
+    """Process entry point for one hub worker"""
+    try:
+        asyncio.run(_worker_main(bus_path, options, app_path, persist, config_path))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_main(bus_path, options, app_path, persist, config_path):
+    bus = UnixSocketBus(bus_path)
+    await bus.connect()
+    if app_path:
+        # Every worker warms its rooms from the table; only one writes markers
+        # and records position history
+        hub_db = AsyncDatabase(Database(app_path))
+        options = dict(options, marker_store=MarkerStore(hub_db, read_only=not persist),
+                       position_history=PositionHistory(hub_db, read_only=not persist))
+    if config_path and persist:
+        # One worker polls the game servers; positions reach the others over the bus
+        options = dict(options, server_poller=ServerPoller(ServerManager(config_path)))
+    hub = WebSocketServer(bus=bus, reuse_port=True, **options)
+    await hub.listen()
+    logger.info(f"Hub worker {os.getpid()} listening on ws://{hub.host}:{hub.port}")
+    try:
+        # Without the broker this worker's rooms would silently diverge
+        await bus.closed
+    finally:
+        await hub.stop()
+        await bus.close()
+
+
+def run_workers(workers, app_path=None, config_path=None, **options):
+    """Start `workers` hub processes plus the bus broker and block until stopped
+    
+    `options` are passed to every worker's WebSocketServer. With `app_path`,
+    markers persist to that app's database (written by the first worker).
+    With `config_path`, the first worker also polls the servers.json servers.
+    """
+    if not WORKERS_SUPPORTED:
+        raise RuntimeError("Multiple hub workers need SO_REUSEPORT and Unix sockets (Linux)")
+    try:
+        asyncio.run(_supervise(workers, app_path, config_path, options))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _supervise(workers, app_path, config_path, options):
+    bus_path = os.path.join(tempfile.gettempdir(), f"arma-livemap-bus-{os.getpid()}.sock")
+    # One epoch for all workers so a client can resume on any of them
+    options = dict(options, epoch=options.get('epoch') or uuid.uuid4().hex[:12])
+    if app_path:
+        # Create/upgrade the schema once, before workers open the database
+        Database(app_path)
+    broker = BusBroker(bus_path)
+    await broker.start()
+    
+    # Spawn rather than fork: the parent already has a running event loop
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_worker, args=(bus_path, options, app_path, i == 0, config_path),
+                                name=f"hub-worker-{i}", daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {workers} hub workers sharing bus {bus_path}")
+    
+    try:
+        while all(process.is_alive() for process in processes):
+            await asyncio.sleep(0.5)
+        dead = [process.name for process in processes if not process.is_alive()]
+        logger.error(f"Hub worker exited unexpectedly ({', '.join(dead)}); stopping all workers")
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+        await broker.stop()
@@ -0,0 +1,109 @@
+"""Online rotation of the Fernet key that protects user data
+
+KeyRotation adds a new primary key to the keyring (see EncryptionManager),
+then walks the users table in id order, re-encrypting `batch_size` rows at
+a time. Decryption and re-encryption happen outside any transaction; each
+batch is then written in one short transaction that only replaces rows
+still holding the values it read. Logins and password resets keep working
+throughout, because every key in the keyring can still decrypt.
+
+Once a full pass finds nothing left under an old key, the old keys are
+removed from the keyring.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+# Users re-encrypted per write transaction
+DEFAULT_ROTATION_BATCH_SIZE = 100
+
+# Seconds to pause between batches, leaving the write lock free for logins
+DEFAULT_ROTATION_PAUSE = 0.01
+
+# Full passes over the table before giving up on retiring the old keys
+MAX_ROTATION_PASSES = 3
+
+
+class KeyRotation:
+    """Re-encrypts the users table under a new key, batch by batch"""
+    
+    def __init__(self, db, batch_size=DEFAULT_ROTATION_BATCH_SIZE, pause=DEFAULT_ROTATION_PAUSE):
+        self.db = db
+        self.encryption = db.encryption
+        self.batch_size = batch_size
+        self.pause = pause
+        self.thread = None
+        self.rows_rotated = 0
+        self.batches = 0
+        self.unreadable = 0
+        self.retired = False
+        self.seconds = 0.0
+    
+    def run(self):
+        """Rotate the key and re-encrypt every user; returns stats()"""
+        start = time.perf_counter()
+        self.encryption.add_key()
+        logger.info(f"Encryption key rotated; re-encrypting users in batches of {self.batch_size}")
+        for rotation_pass in range(MAX_ROTATION_PASSES):
+            # The first pass rotates everything; later ones only what a
+            # concurrent writer with a stale keyring may have left behind
+            stale = self.rotation_pass(only_stale=rotation_pass > 0)
+            if not stale:
+                self.encryption.retire_old_keys()
+                self.retired = True
+                break
+        else:
+            logger.warning("Rows under old keys remain after rotation; old keys kept")
+        self.seconds = time.perf_counter() - start
+        logger.info(f"Key rotation finished: {self.rows_rotated} rows in {self.batches} batches, "
+                    f"{self.seconds:.2f}s")
+        return self.stats()
+    
+    def rotation_pass(self, only_stale):
+        """One walk over users; returns how many rows needed rotating"""
+        stale = 0
+        after_id = 0
+        while True:
+            rows = self.db.encrypted_user_fields(after_id, self.batch_size)
+            if not rows:
+                return stale
+            after_id = rows[-1][0]
+            changes = []
+            for row in rows:
+                values = row[1:]
+                if only_stale and all(value is None or self.encryption.is_current(value) for value in values):
+                    continue
+                rotated = self.encryption.rotate_many(values)
+                if any(new is None and old is not None for old, new in zip(values, rotated)):
+                    # Not readable with any key in the keyring; leave it as it is
+                    if not only_stale:
+                        self.unreadable += 1
+                    continue
+                changes.append((row, (row[0],) + tuple(rotated)))
+            if changes:
+                stale += len(changes)
+                self.rows_rotated += self.db.replace_encrypted_user_fields(changes)
+                self.batches += 1
+                if self.pause:
+                    time.sleep(self.pause)
+    
+    def start(self):
+        """Run the rotation on a background thread"""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='key-rotation', daemon=True)
+            self.thread.start()
+        return self.thread
+    
+    def stats(self):
+        """Rotation counters"""
+        return {
+            'rows_rotated': self.rows_rotated,
+            'batches': self.batches,
+            'unreadable': self.unreadable,
+            'retired_old_keys': self.retired,
+            'seconds': round(self.seconds, 3)
+        }
@@ -0,0 +1,130 @@
+"""Write-behind persistence of hub markers into the markers table
+
+The hub keeps markers in memory (Room.markers) and only tells the store what
+changed. Changes are coalesced per marker id and written every
+`flush_interval` seconds in a single SQLite transaction on the database
+thread (core.async_database), so the broadcast path never waits for the
+disk. On startup the hub warms its rooms from the table with load().
+
+A crash can lose at most the last flush interval of changes. If a batch
+fails, its changes are retried one by one so a single bad row is dropped
+instead of blocking every later write.
+"""
+
+import asyncio
+import logging
+import sqlite3
+from core.async_database import AsyncDatabase
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between write-behind flushes
+DEFAULT_FLUSH_INTERVAL = 0.25
+
+# Errors caused by the row itself; retrying it can never succeed
+BAD_ROW_ERRORS = (sqlite3.IntegrityError, KeyError, TypeError, ValueError)
+
+
+class MarkerStore:
+    """Batches marker adds/removes from the hub into periodic transactions"""
+    
+    def __init__(self, db, flush_interval=DEFAULT_FLUSH_INTERVAL, read_only=False):
+        # A Database gets its own AsyncDatabase; pass one in to share its thread
+        self.owns_db = not isinstance(db, AsyncDatabase)
+        self.db = AsyncDatabase(db) if self.owns_db else db
+        self.flush_interval = flush_interval
+        # Hub workers all load markers, but only one of them writes
+        self.read_only = read_only
+        # marker_id -> marker dict (upsert) or None (delete); last change wins
+        self.pending = {}
+        self.flush_task = None
+        self.write_future = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+        self.dropped_changes = 0
+    
+    def load(self):
+        """Persisted markers grouped by server_id"""
+        return self.db.db.load_markers()
+    
+    def marker_added(self, marker):
+        """Queue a marker insert/update"""
+        if not self.read_only:
+            self.pending[marker['id']] = dict(marker)
+    
+    def marker_removed(self, marker_id):
+        """Queue a marker delete"""
+        if not self.read_only:
+            self.pending[marker_id] = None
+    
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        if self.flush_task is None and not self.read_only:
+            self.flush_task = asyncio.create_task(self.run())
+        return self.flush_task
+    
+    async def run(self):
+        """Flush pending changes every flush_interval seconds"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def flush(self):
+        """Write everything pending in one transaction, off the event loop"""
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = {}
+        upserts = [marker for marker in batch.values() if marker is not None]
+        deletes = [marker_id for marker_id, marker in batch.items() if marker is None]
+        # Shielded so stop() can cancel the loop without abandoning a half-done write
+        self.write_future = asyncio.ensure_future(self.db.save_marker_changes(upserts, deletes))
+        try:
+            await asyncio.shield(self.write_future)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Failed to persist {len(batch)} marker changes: {e}")
+            self.write_future = asyncio.ensure_future(self.write_each(batch))
+            await asyncio.shield(self.write_future)
+            return
+        self.flushes += 1
+        self.rows_written += len(batch)
+    
+    async def write_each(self, batch):
+        """Write a failed batch change by change: bad rows are dropped, the rest kept for retry"""
+        for marker_id, marker in batch.items():
+            upserts, deletes = ([marker], []) if marker is not None else ([], [marker_id])
+            try:
+                await self.db.save_marker_changes(upserts, deletes)
+            except BAD_ROW_ERRORS as e:
+                self.dropped_changes += 1
+                logger.error(f"Dropping marker change {marker_id}: {e}")
+            except Exception:
+                # Database trouble; retry next time, without overwriting anything newer
+                self.pending.setdefault(marker_id, marker)
+            else:
+                self.rows_written += 1
+    
+    async def stop(self):
+        """Stop the flush loop and write what is still pending"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.write_future is not None:
+            # Let an in-flight write land before the final one
+            await asyncio.gather(self.write_future, return_exceptions=True)
+        await self.flush()
+        if self.owns_db:
+            await self.db.aclose()
+    
+    def stats(self):
+        """Write-behind counters for metrics"""
+        return {
+            'pending': len(self.pending),
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'failed_flushes': self.failed_flushes,
+            'dropped_changes': self.dropped_changes
+        }
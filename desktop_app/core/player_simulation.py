@@ -0,0 +1,136 @@
+"""Vectorized simulated players for load testing
+
+PlayerSimulation keeps every simulated player of one server in NumPy
+arrays (ids, x, y, team, waypoint) and advances all of them with a few
+array operations per step, so tens of thousands of players cost about as
+much as a handful did with one Python loop iteration per player. Two kinds
+of movement:
+    
+    random_walk   every player moves up to `speed` map units in x and y
+    waypoints     every player walks at `speed` units per second towards its
+                  own random waypoint and picks a new one on arrival
+
+batch() hands the arrays to the hub as a core.position_batch.PositionBatch
+without copying them: step() and add/remove_players replace arrays (and the
+name list) instead of writing into them, so a batch keeps seeing the
+positions of the step it was taken at. positions() gives the per-player
+dicts instead.
+
+NumPy is optional for the application; it is only needed to run simulations.
+"""
+
+import time
+from core.position_batch import PositionBatch, TEAMS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+RANDOM_WALK = 'random_walk'
+WAYPOINTS = 'waypoints'
+MODES = (RANDOM_WALK, WAYPOINTS)
+
+# Map units covered by the simulated area (the legacy simulation's 0-1000)
+DEFAULT_MAP_SIZE = 1000.0
+
+# Random walk: units per step; waypoints: units per second
+DEFAULT_SPEED = 5.0
+
+# Waypoint mode: distance at which a waypoint counts as reached
+WAYPOINT_RADIUS = 1.0
+
+
+class PlayerSimulation:
+    """Simulated players of one server, stored column-wise in NumPy arrays"""
+    
+    def __init__(self, players=0, mode=RANDOM_WALK, map_size=DEFAULT_MAP_SIZE, speed=DEFAULT_SPEED,
+                 seed=None, first_id=1):
+        if np is None:
+            raise RuntimeError("Player simulation needs NumPy (pip install numpy)")
+        if mode not in MODES:
+            raise ValueError(f"Unknown simulation mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.mode = mode
+        self.map_size = float(map_size)
+        self.speed = float(speed)
+        self.rng = np.random.default_rng(seed)
+        self.ids = np.empty(0, dtype=np.int64)
+        self.x = np.empty(0)
+        self.y = np.empty(0)
+        self.teams = np.empty(0, dtype=np.uint8)
+        self.target_x = np.empty(0)
+        self.target_y = np.empty(0)
+        # Display names, in the same order as the arrays; replaced, never edited
+        self.usernames = []
+        self.next_id = first_id
+        if players:
+            self.add_players(players)
+    
+    @property
+    def count(self):
+        return len(self.ids)
+    
+    def add_players(self, count, team=None):
+        """Add `count` players at random spots; returns their ids"""
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+        margin = self.map_size * 0.1
+        self.ids = np.concatenate([self.ids, ids])
+        self.x = np.concatenate([self.x, self.rng.uniform(margin, self.map_size - margin, count)])
+        self.y = np.concatenate([self.y, self.rng.uniform(margin, self.map_size - margin, count)])
+        if team is None:
+            teams = self.rng.integers(0, len(TEAMS), count, dtype=np.uint8)
+        else:
+            teams = np.full(count, TEAMS.index(team), dtype=np.uint8)
+        self.teams = np.concatenate([self.teams, teams])
+        self.target_x = np.concatenate([self.target_x, self.rng.uniform(0, self.map_size, count)])
+        self.target_y = np.concatenate([self.target_y, self.rng.uniform(0, self.map_size, count)])
+        self.usernames = self.usernames + [f"Sim {user_id}" for user_id in ids.tolist()]
+        return ids
+    
+    def add_player(self, name, team='neutral'):
+        """Add one named player; returns its id"""
+        user_id = int(self.add_players(1, team)[0])
+        self.usernames = self.usernames[:-1] + [name]
+        return user_id
+    
+    def remove_players(self, ids):
+        """Remove players by id"""
+        keep = ~np.isin(self.ids, np.asarray(ids, dtype=np.int64))
+        for name in ('ids', 'x', 'y', 'teams', 'target_x', 'target_y'):
+            setattr(self, name, getattr(self, name)[keep])
+        self.usernames = [name for name, kept in zip(self.usernames, keep.tolist()) if kept]
+    
+    def step(self, dt=0.1):
+        """Advance every player by one step (`dt` seconds in waypoint mode)"""
+        n = self.count
+        if not n:
+            return
+        # New arrays rather than in-place updates: batches handed out earlier share the old ones
+        if self.mode == RANDOM_WALK:
+            x = self.x + self.rng.uniform(-self.speed, self.speed, n)
+            y = self.y + self.rng.uniform(-self.speed, self.speed, n)
+        else:
+            dx = self.target_x - self.x
+            dy = self.target_y - self.y
+            distance = np.hypot(dx, dy)
+            # Fraction of the remaining way covered this step, at most all of it
+            fraction = np.minimum(1.0, self.speed * dt / np.maximum(distance, 1e-9))
+            x = self.x + dx * fraction
+            y = self.y + dy * fraction
+            arrived = distance - self.speed * dt <= WAYPOINT_RADIUS
+            arrived_count = int(arrived.sum())
+            if arrived_count:
+                self.target_x[arrived] = self.rng.uniform(0, self.map_size, arrived_count)
+                self.target_y[arrived] = self.rng.uniform(0, self.map_size, arrived_count)
+        self.x = np.clip(x, 0, self.map_size, out=x)
+        self.y = np.clip(y, 0, self.map_size, out=y)
+    
+    def batch(self):
+        """The current positions as a PositionBatch sharing the arrays (no copy)"""
+        return PositionBatch(self.ids, self.x, self.y, self.teams, time.time(), self.usernames)
+    
+    def positions(self):
+        """Every player as the hub's position dicts, sharing one batch timestamp"""
+        return self.batch().players()
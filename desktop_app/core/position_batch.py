@@ -0,0 +1,160 @@
+"""Columnar batches of player positions
+
+A PositionBatch holds one poll's players as parallel columns instead of one
+dict per player:
+    
+    ids       int64    user ids
+    x, y      float64  map units
+    teams     uint8    index into team_names
+
+plus one timestamp (unix seconds) for the whole batch and, optionally, the
+players' names in the same order.
+
+Columns are memoryviews over whatever buffer the producer hands in (NumPy
+arrays, array.array, bytes), so wrapping a poll's arrays copies nothing.
+The hub keeps a batch in this form as long as it can: positions_columns
+frames for binary clients are built straight from the column buffers
+(MessagePack writes them as bin fields), and per-player dicts are only
+created when something that needs them asks via players() (JSON and delta
+clients, viewports, snapshots).
+
+Producers must not modify a buffer after handing it to a batch. On the wire
+every column is little-endian.
+"""
+
+import sys
+import time
+from array import array
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TEAMS = ('blue', 'red', 'green', 'neutral')
+
+# Column name -> memoryview/array format
+COLUMN_FORMATS = {'ids': 'q', 'x': 'd', 'y': 'd', 'teams': 'B'}
+
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def column(data, fmt):
+    """View a contiguous buffer as a flat column of `fmt` items, without copying"""
+    view = memoryview(data)
+    if not view.contiguous:
+        raise ValueError("Position columns must be contiguous buffers")
+    view = view.cast('B')
+    if view.nbytes % array(fmt).itemsize:
+        raise ValueError(f"Buffer of {view.nbytes} bytes does not hold whole {fmt!r} items")
+    return view.cast(fmt)
+
+
+def wire_column(view):
+    """A column as little-endian bytes (a byte-swapped copy only on big-endian hosts)"""
+    if LITTLE_ENDIAN or view.itemsize == 1:
+        return view.cast('B')
+    swapped = array(view.format, view)
+    swapped.byteswap()
+    return memoryview(swapped).cast('B')
+
+
+class PositionBatch:
+    """One poll's player positions, stored column-wise"""
+    
+    __slots__ = ('ids', 'x', 'y', 'teams', 'timestamp', 'usernames', 'team_names', '_players')
+    
+    def __init__(self, ids, x, y, teams, timestamp=None, usernames=None, team_names=TEAMS):
+        self.ids = column(ids, 'q')
+        self.x = column(x, 'd')
+        self.y = column(y, 'd')
+        self.teams = column(teams, 'B')
+        count = len(self.ids)
+        if not len(self.x) == len(self.y) == len(self.teams) == count:
+            raise ValueError("Position columns differ in length")
+        if usernames is not None and len(usernames) != count:
+            raise ValueError("Expected one username per player")
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.usernames = usernames
+        self.team_names = tuple(team_names)
+        # Per-player dicts, built on first use
+        self._players = None
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @classmethod
+    def from_players(cls, players, timestamp=None, team_names=TEAMS):
+        """Batch of per-player dicts (user_id, username, x, y, team); unknown teams are appended"""
+        team_names = list(team_names)
+        codes = {team: code for code, team in enumerate(team_names)}
+        teams = array('B')
+        for player in players:
+            team = player.get('team', 'neutral')
+            code = codes.get(team)
+            if code is None:
+                code = codes[team] = len(team_names)
+                team_names.append(team)
+            teams.append(code)
+        return cls(array('q', [player['user_id'] for player in players]),
+                   array('d', [player['x'] for player in players]),
+                   array('d', [player['y'] for player in players]),
+                   teams, timestamp, [player.get('username', '') for player in players], team_names)
+    
+    @classmethod
+    def from_message(cls, message):
+        """Batch of a received positions_columns message (columns stay views of the frame)"""
+        ids, x, y, teams = (message[name] for name in COLUMN_FORMATS)
+        if not LITTLE_ENDIAN:
+            ids, x, y = (array(COLUMN_FORMATS[name], bytes(message[name])) for name in ('ids', 'x', 'y'))
+            for swapped in (ids, x, y):
+                swapped.byteswap()
+        return cls(ids, x, y, teams, message['t'], message.get('names'), message['team_names'])
+    
+    def players(self):
+        """Every player as the hub's position dicts, sharing the batch timestamp"""
+        if self._players is None:
+            timestamp = datetime.fromtimestamp(self.timestamp).isoformat()
+            team_names = self.team_names
+            usernames = self.usernames if self.usernames is not None else [''] * len(self)
+            self._players = [{
+                'user_id': user_id,
+                'username': username,
+                'x': x,
+                'y': y,
+                'team': team_names[team],
+                'timestamp': timestamp
+            } for user_id, username, x, y, team in zip(self.ids.tolist(), usernames, self.x.tolist(),
+                                                       self.y.tolist(), self.teams.tolist())]
+        return self._players
+    
+    def moved_since(self, previous, threshold):
+        """True if the roster changed or any player moved more than threshold since `previous`"""
+        if previous is None or self.ids != previous.ids:
+            return True
+        for new, old in ((self.x, previous.x), (self.y, previous.y)):
+            if np is not None:
+                # Arrays over the same buffers, compared in one pass
+                delta = np.abs(np.frombuffer(new, np.float64) - np.frombuffer(old, np.float64))
+                if len(delta) and delta.max() > threshold:
+                    return True
+            elif new != old and any(abs(a - b) > threshold for a, b in zip(new.tolist(), old.tolist())):
+                # Without NumPy only columns that differ at all are compared item by item
+                return True
+        return False
+    
+    def columns_message(self, server_id, names=True):
+        """positions_columns message; the columns are buffers, so it needs a binary encoding"""
+        message = {
+            'type': 'positions_columns',
+            'server_id': server_id,
+            't': self.timestamp,
+            'count': len(self),
+            'team_names': list(self.team_names)
+        }
+        for name in COLUMN_FORMATS:
+            message[name] = wire_column(getattr(self, name))
+        if names and self.usernames is not None:
+            message['names'] = self.usernames
+        return message
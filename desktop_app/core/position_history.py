@@ -0,0 +1,138 @@
+"""Time-series store of player positions
+
+Every positions batch the hub broadcasts is also handed to PositionHistory,
+which quantizes it to compact integer rows
+    
+    (server_id, user_id, t in ms, x, y in 1/HISTORY_QUANTUM map units)
+
+and appends them to the database every `flush_interval` seconds with one
+executemany per segment, on the database thread (core.async_database).
+
+History is split into time segments of `segment_seconds`, one table each
+(see Database.save_position_history). A segment's table is created by its
+first rows, so rotation needs no bookkeeping and expiring old history is a
+DROP TABLE.
+"""
+
+import asyncio
+import logging
+import time
+from core.async_database import AsyncDatabase
+from core.database import HISTORY_QUANTUM
+from core.position_batch import PositionBatch
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between flushes to the database
+DEFAULT_HISTORY_FLUSH_INTERVAL = 1.0
+
+# Seconds of history per segment table
+DEFAULT_SEGMENT_SECONDS = 3600
+
+
+class PositionHistory:
+    """Buffers position updates and writes them as history rows in batches"""
+    
+    def __init__(self, db, flush_interval=DEFAULT_HISTORY_FLUSH_INTERVAL,
+                 segment_seconds=DEFAULT_SEGMENT_SECONDS, read_only=False):
+        # A Database gets its own AsyncDatabase; pass one in to share its thread
+        self.owns_db = not isinstance(db, AsyncDatabase)
+        self.db = AsyncDatabase(db) if self.owns_db else db
+        self.flush_interval = flush_interval
+        self.segment_seconds = segment_seconds
+        # Hub workers all see every position, but only one of them records
+        self.read_only = read_only
+        # segment start -> list of row tuples
+        self.pending = {}
+        self.pending_rows = 0
+        self.flush_task = None
+        self.write_future = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.failed_flushes = 0
+    
+    def segment_of(self, t):
+        """Start (unix seconds) of the segment containing time t"""
+        return int(t // self.segment_seconds) * self.segment_seconds
+    
+    def record(self, server_id, positions, t=None):
+        """Queue one batch of player dicts (user_id, x, y), or a PositionBatch, seen at unix time t"""
+        if self.read_only or not positions:
+            return
+        if t is None:
+            t = time.time()
+        t_ms = int(t * 1000)
+        rows = self.pending.setdefault(self.segment_of(t), [])
+        queued = len(rows)
+        if isinstance(positions, PositionBatch):
+            # Typed columns: no per-player dicts and nothing malformed to skip
+            rows.extend((server_id, user_id, t_ms, round(x * HISTORY_QUANTUM), round(y * HISTORY_QUANTUM))
+                        for user_id, x, y in zip(positions.ids.tolist(), positions.x.tolist(),
+                                                 positions.y.tolist()))
+            self.pending_rows += len(rows) - queued
+            return
+        for player in positions:
+            try:
+                rows.append((server_id, player['user_id'], t_ms,
+                             round(float(player['x']) * HISTORY_QUANTUM),
+                             round(float(player['y']) * HISTORY_QUANTUM)))
+            except (KeyError, TypeError, ValueError, OverflowError):
+                # Malformed client data is broadcast as-is but not recorded
+                continue
+        self.pending_rows += len(rows) - queued
+    
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        if self.flush_task is None and not self.read_only:
+            self.flush_task = asyncio.create_task(self.run())
+        return self.flush_task
+    
+    async def run(self):
+        """Flush pending rows every flush_interval seconds"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+    
+    async def flush(self):
+        """Write everything pending in one transaction, off the event loop"""
+        if not self.pending:
+            return
+        batch = self.pending
+        rows = sum(len(segment_rows) for segment_rows in batch.values())
+        self.pending = {}
+        self.pending_rows = 0
+        # Shielded so stop() can cancel the loop without abandoning a half-done write
+        self.write_future = asyncio.ensure_future(self.db.save_position_history(batch))
+        try:
+            await asyncio.shield(self.write_future)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Failed to record {rows} position history rows: {e}")
+            # Keep them for the next flush, ahead of anything newer
+            for segment, segment_rows in batch.items():
+                self.pending[segment] = segment_rows + self.pending.get(segment, [])
+            self.pending_rows += rows
+            return
+        self.flushes += 1
+        self.rows_written += rows
+    
+    async def stop(self):
+        """Stop the flush loop and write what is still pending"""
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        if self.write_future is not None:
+            await asyncio.gather(self.write_future, return_exceptions=True)
+        await self.flush()
+        if self.owns_db:
+            await self.db.aclose()
+    
+    def stats(self):
+        """History counters for metrics"""
+        return {
+            'pending_rows': self.pending_rows,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'failed_flushes': self.failed_flushes
+        }
@@ -0,0 +1,275 @@
+"""Per-game-server rooms for the WebSocket hub
+
+Each Arma server slot from config/servers.json gets its own room, keyed by the
+same server_id used in the markers table. A room owns the marker and player
+position state for that server plus the set of clients watching it, so
+broadcasts only fan out to the clients that care about that server.
+
+Snapshot frames (markers_sync, positions_sync, delta keyframes) are cached
+and only rebuilt after the state they describe changes, so a burst of
+joining clients costs one serialization per encoding.
+
+Marker and chat events carry a per-room sequence number and are kept in a
+bounded ring buffer, so a client that reconnects with the last sequence
+number it saw only gets the events it missed. Positions are never replayed;
+a resuming client gets a fresh position snapshot instead.
+
+Clients that send a viewport only get the markers and players inside their
+area of interest (see core.spatial_grid). Both are indexed in a uniform grid;
+players are re-filed once per tick so enter/leave events can be computed
+from the cell a player was in at the previous tick.
+
+Polled servers may hand in whole columnar batches (core.position_batch).
+The latest batch is kept as it is and only merged into the per-player
+records when something reads player_positions, so a tick whose clients all
+take positions_columns frames never builds a dict per player.
+"""
+
+from collections import deque
+
+from core.delta_codec import DeltaEncoder, DEFAULT_KEYFRAME_INTERVAL
+from core.wire_format import Frame
+from core.spatial_grid import SpatialGrid, DEFAULT_CELL_SIZE
+
+
+# Room used by clients that never subscribe to a specific server
+DEFAULT_SERVER_ID = 0
+
+# Sequenced events kept per room for replay on resume
+DEFAULT_HISTORY_SIZE = 256
+
+
+class Room:
+    """Marker/position state and subscribers for one Arma server"""
+    
+    def __init__(self, server_id, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, epoch='',
+                 history_size=DEFAULT_HISTORY_SIZE, cell_size=DEFAULT_CELL_SIZE):
+        self.server_id = server_id
+        self.clients = set()
+        # Subset of clients that asked for the delta position protocol
+        self.delta_clients = set()
+        # Clients with a viewport; they get filtered positions_batch frames instead
+        self.aoi_clients = set()
+        # Binary clients that take columnar positions_columns frames
+        self.column_clients = set()
+        self.markers = {}
+        # user_id -> player; read through player_positions, which merges any batch
+        self._player_positions = {}
+        # Latest PositionBatch not yet merged into _player_positions
+        self._unmerged_batch = None
+        # Latest game server status from core.server_poller (name, map, player count)
+        self.server_info = None
+        self.pending_positions = {}
+        # Latest PositionBatch not yet sent
+        self.pending_batch = None
+        # Names last sent in a positions_columns frame; later frames omit them until they change
+        self._column_names = None
+        self.delta = DeltaEncoder(keyframe_interval)
+        
+        # Sequence numbers are only comparable within one epoch (hub run)
+        self.epoch = epoch
+        self.seq = 0
+        # (seq, Frame) of the most recent marker/chat events
+        self.history = deque(maxlen=history_size)
+        
+        # Spatial index; player cells are as of the last tick
+        self.marker_grid = SpatialGrid(cell_size)
+        self.player_grid = SpatialGrid(cell_size)
+        # Set when batches skipped the player grid (no viewport clients)
+        self.player_grid_stale = False
+        
+        # Cached snapshot frames; None until requested after a change
+        self._markers_frame = None
+        self._positions_frame = None
+        self._keyframe = None
+    
+    def add_client(self, client):
+        """Subscribe a client to this room"""
+        self.clients.add(client)
+        if client.aoi is not None:
+            self.aoi_clients.add(client)
+        elif client.delta:
+            self.delta_clients.add(client)
+        elif client.columns:
+            self.column_clients.add(client)
+    
+    def remove_client(self, client):
+        """Unsubscribe a client from this room"""
+        self.clients.discard(client)
+        self.delta_clients.discard(client)
+        self.aoi_clients.discard(client)
+        self.column_clients.discard(client)
+    
+    def set_aoi(self, client, cells):
+        """Give a client an area of interest (a set of cells), or None for the whole map"""
+        self.remove_client(client)
+        client.aoi = cells
+        self.add_client(client)
+        if cells is not None and self.player_grid_stale:
+            # File everyone where they are now; the next tick moves them on from there
+            for user_id, player in self.player_positions.items():
+                self.player_grid.move(user_id, player.get('x'), player.get('y'))
+            self.player_grid_stale = False
+    
+    def interested_clients(self, cell):
+        """Clients that should hear about something in `cell`"""
+        if not self.aoi_clients:
+            return self.clients
+        return (self.clients - self.aoi_clients) | {c for c in self.aoi_clients if cell in c.aoi}
+    
+    def aoi_groups(self):
+        """AOI clients grouped by identical cell sets, so each group shares frames"""
+        groups = {}
+        for client in self.aoi_clients:
+            groups.setdefault(client.aoi, []).append(client)
+        return groups
+    
+    def markers_in(self, cells):
+        """Markers inside a set of cells"""
+        return [self.markers[marker_id] for marker_id in self.marker_grid.query(cells)]
+    
+    def players_in(self, cells):
+        """Current records of the players filed inside a set of cells"""
+        return [self.player_positions[user_id] for user_id in self.player_grid.query(cells)]
+    
+    def advance_player_grid(self, positions):
+        """Re-file this tick's players; returns (player, old_cell, new_cell) per player"""
+        return [(player, *self.player_grid.move(player['user_id'], player.get('x'), player.get('y')))
+                for player in positions]
+    
+    def add_marker(self, marker):
+        """Store a marker (keyed by its id)"""
+        self.markers[marker['id']] = marker
+        self.marker_grid.move(marker['id'], marker.get('x'), marker.get('y'))
+        self._markers_frame = None
+    
+    def remove_marker(self, marker_id):
+        """Delete a marker; returns the removed marker, or None if it did not exist"""
+        marker = self.markers.pop(marker_id, None)
+        if marker is None:
+            return None
+        self.marker_grid.remove(marker_id)
+        self._markers_frame = None
+        return marker
+    
+    def markers_sync(self):
+        """Cached snapshot frame of all markers"""
+        if self._markers_frame is None:
+            self._markers_frame = Frame({
+                'type': 'markers_sync',
+                'server_id': self.server_id,
+                'epoch': self.epoch,
+                'seq': self.seq,
+                'markers': list(self.markers.values())
+            })
+        return self._markers_frame
+    
+    def record(self, message):
+        """Stamp a room event with the next sequence number and keep it for replay"""
+        self.seq += 1
+        message['seq'] = self.seq
+        message['epoch'] = self.epoch
+        frame = Frame(message)
+        self.history.append((self.seq, frame))
+        # markers_sync reports the seq it is current up to
+        self._markers_frame = None
+        return frame
+    
+    def events_since(self, last_seq):
+        """Frames after last_seq, or None if the ring buffer no longer covers the gap"""
+        if last_seq > self.seq:
+            return None
+        if last_seq == self.seq:
+            return []
+        if not self.history or self.history[0][0] > last_seq + 1:
+            return None
+        return [frame for seq, frame in self.history if seq > last_seq]
+    
+    @property
+    def player_positions(self):
+        """user_id -> latest record of every player seen in this room"""
+        if self._unmerged_batch is not None:
+            self.merge_batch()
+        return self._player_positions
+    
+    def merge_batch(self):
+        """Fold the latest batch into the per-player records; returns its players"""
+        batch = self._unmerged_batch
+        if batch is None:
+            return []
+        self._unmerged_batch = None
+        players = batch.players()
+        self._player_positions.update(zip(batch.ids.tolist(), players))
+        return players
+    
+    def columns_frame(self, batch):
+        """positions_columns frame of a batch; names are only included when they changed"""
+        names = batch.usernames != self._column_names
+        if names:
+            self._column_names = batch.usernames
+        return Frame(batch.columns_message(self.server_id, names))
+    
+    def positions_sync(self):
+        """Cached snapshot frame of all player positions"""
+        if self._positions_frame is None:
+            self._positions_frame = Frame({
+                'type': 'positions_sync',
+                'server_id': self.server_id,
+                'positions': list(self.player_positions.values())
+            })
+        return self._positions_frame
+    
+    def delta_keyframe(self, client):
+        """Keyframe for a delta client joining the room"""
+        if self.delta.stale and self.delta_clients <= {client}:
+            # Nobody depends on the old baseline, so rebuild it from full state
+            self.delta.resync(self.player_positions)
+            self._keyframe = None
+        if self._keyframe is None:
+            self._keyframe = Frame(self.delta.keyframe(self.server_id))
+        return self._keyframe
+    
+    def encode_delta(self, positions):
+        """Delta/keyframe frame for this tick's positions, or None if not needed"""
+        if not self.delta_clients:
+            # Skip the work; the baseline is rebuilt when a delta client joins
+            self.delta.stale = True
+            return None
+        frame = self.delta.encode(self.server_id, positions)
+        # The baseline moved on even if nothing visible changed
+        self._keyframe = None
+        if frame is not None and frame['type'] == 'positions_keyframe':
+            self._keyframe = Frame(frame)
+            return self._keyframe
+        return frame
+    
+    def update_position(self, user_id, player_data):
+        """Record a position update, coalescing it with others from this tick"""
+        # A batch merged later must not overwrite this newer record
+        self.player_positions[user_id] = player_data
+        self.pending_positions[user_id] = player_data
+        self._positions_frame = None
+    
+    def update_batch(self, batch):
+        """Record a polled PositionBatch; it supersedes any batch not yet sent or merged"""
+        self.pending_batch = batch
+        self._unmerged_batch = batch
+        self._positions_frame = None
+    
+    def take_pending_batch(self):
+        """Return the batch received since the last tick (or None) and reset it"""
+        batch = self.pending_batch
+        self.pending_batch = None
+        return batch
+    
+    def take_pending_positions(self):
+        """Return the positions changed since the last tick and reset the batch"""
+        pending = self.pending_positions
+        self.pending_positions = {}
+        return list(pending.values())
+    
+    def is_idle(self):
+        """True when the room has no subscribers and no state worth keeping"""
+        # Rooms with replay history are kept so sequence numbers never restart
+        return (not self.clients and not self.markers and not self._player_positions
+                and self._unmerged_batch is None and not self.history and self.server_info is None)
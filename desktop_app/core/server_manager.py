@@ -1,7 +1,11 @@
+import asyncio
 import json
 import os
 import requests
 from typing import List, Dict, Optional
+from core.history_retention import parse_retention, RetentionPolicy, DEFAULT_HISTORY_RETENTION
+from core.server_poller import DEFAULT_POLL_BUDGET
+from core.a2s import query_server, DEFAULT_QUERY_PORT
 
 
 class ServerManager:
@@ -9,6 +13,8 @@ class ServerManager:
         self.config_path = config_path
         self.servers = []
         self.websocket_port = 8765
+        # Game server position polls per second, over all servers
+        self.poll_budget = DEFAULT_POLL_BUDGET
         self.load_config()
     
     def load_config(self):
@@ -18,12 +24,14 @@ class ServerManager:
                 config = json.load(f)
                 self.servers = config.get('servers', [])
                 self.websocket_port = config.get('websocket_port', 8765)
+                self.poll_budget = config.get('poll_budget', DEFAULT_POLL_BUDGET)
     
     def save_config(self):
         """Save server configuration to JSON"""
         config = {
             'servers': self.servers,
-            'websocket_port': self.websocket_port
+            'websocket_port': self.websocket_port,
+            'poll_budget': self.poll_budget
         }
         with open(self.config_path, 'w') as f:
             json.dump(config, f, indent=2)
@@ -39,18 +47,35 @@ class ServerManager:
                 return server
         return None
     
-    def update_server(self, server_id: int, name: str, ip: str, port: int, enabled: bool):
-        """Update server configuration"""
+    def get_history_retention(self, server_id: int) -> RetentionPolicy:
+        """Position history retention tiers for a server (the default if unset or invalid)
+        Servers only store history_retention when it is overridden, so changes to
+        the default reach every other server
+        """
+        server = self.get_server_by_id(server_id)
+        config = (server.get('history_retention') if server else None) or DEFAULT_HISTORY_RETENTION
+        try:
+            return parse_retention(config)
+        except ValueError as e:
+            print(f"Server {server_id}: {e}; using the default retention")
+            return parse_retention(None)
+    
+    def update_server(self, server_id: int, name: str, ip: str, port: int, enabled: bool,
+                      query_port: Optional[int] = None):
+        """Update server configuration (query_port None keeps the current one)"""
         for server in self.servers:
             if server['id'] == server_id:
                 server['name'] = name
                 server['ip'] = ip
                 server['port'] = port
                 server['enabled'] = enabled
+                if query_port is not None:
+                    server['query_port'] = query_port
                 break
         self.save_config()
     
-    def add_server(self, name: str, ip: str, port: int, enabled: bool = True) -> int:
+    def add_server(self, name: str, ip: str, port: int, enabled: bool = True,
+                   query_port: int = DEFAULT_QUERY_PORT) -> int:
         """Add a new server to the list"""
         # Find next available ID
         existing_ids = [s['id'] for s in self.servers]
@@ -61,6 +86,7 @@ class ServerManager:
             'name': name,
             'ip': ip,
             'port': port,
+            'query_port': query_port,
             'enabled': enabled
         }
         
@@ -77,21 +103,29 @@ class ServerManager:
                 return True
         return False
     
-    def query_server_info(self, ip: str, port: int) -> Optional[Dict]:
-        """Query server for map and player information
-        Note: This is a placeholder - actual implementation depends on Arma Reforger server API
+    def query_server_info(self, ip: str, port: int = DEFAULT_QUERY_PORT) -> Optional[Dict]:
+        """Blocking query_server_info_async, for worker threads without an event loop
+        Blocks for up to the query timeout; code already running on a loop awaits
+        query_server_info_async instead
+        """
+        return asyncio.run(self.query_server_info_async(ip, port))
+    
+    async def query_server_info_async(self, ip: str, port: int = DEFAULT_QUERY_PORT) -> Optional[Dict]:
+        """Query server for map and player information (A2S_INFO on its query port, not the game port)
+        Returns None if the server does not answer within the query timeout
         """
         try:
-            # Placeholder for actual server query
-            # In real implementation, this would connect to Arma Reforger server
-            # and retrieve current map, player positions, etc.
-            
+            info = await query_server(ip, port)
             return {
                 'status': 'online',
-                'map': 'Everon',
-                'players': 0,
-                'max_players': 64
+                'name': info['name'],
+                'map': info['map'],
+                'players': info['player_count'],
+                'max_players': info['max_players']
             }
+        except asyncio.TimeoutError:
+            print(f"Server {ip}:{port} did not answer the query")
+            return None
         except Exception as e:
             print(f"Error querying server {ip}:{port} - {e}")
             return None
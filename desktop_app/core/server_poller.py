@@ -0,0 +1,361 @@
+"""Polls every enabled game server and feeds the results into the hub
+
+ServerPoller keeps one ArmaServerConnector per enabled entry of
+config/servers.json, each driven by its own asyncio task on the hub's
+loop. Every call to a server is bounded by a timeout, so a slow or dead
+server only ever delays its own task. Intervals get random jitter so many
+servers polled at the same rate do not all fire on the same loop iteration.
+
+Per-server settings (optional, in the server's servers.json entry):
+    
+    "poll_interval": seconds between position polls while active (default 0.1)
+    "idle_poll_interval": seconds between position polls while idle (default 2)
+    "info_interval": seconds between server info polls (default 10)
+    "query_port": port the server answers A2S queries on (default 17777)
+
+The position poll rate adapts to each server:
+    
+    watched and players moving     poll_interval
+    watched, players standing      slows towards idle_poll_interval
+    watched, no players            idle_poll_interval
+    no client watching             unwatched_interval (default 5)
+
+Polling speeds up on the first poll that sees movement, and at once when a
+client subscribes to the server. All servers together stay within
+"poll_budget" position polls per second (top level of servers.json, default
+100): when the rates they want add up to more, every interval is stretched
+by the same factor. stats() reports each server's effective rate.
+
+Positions go into the room like client position updates (batched per
+tick); server info is stored on the room and sent to its clients when it
+changes. The enabled server list is re-read every `refresh_interval`
+seconds, so servers enabled, disabled or edited in Settings are picked up
+without a restart.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from core.a2s import DEFAULT_QUERY_PORT
+from core.arma_server_connector import ArmaServerConnector
+from core.position_batch import PositionBatch
+
+logger = logging.getLogger(__name__)
+
+
+# Seconds between position polls of one active server (10 Hz)
+DEFAULT_POLL_INTERVAL = 0.1
+
+# Shortest interval any server is polled at; smaller (or zero/negative)
+# configured intervals are raised to it
+MIN_POLL_INTERVAL = 0.01
+
+# Seconds between position polls of a watched server nobody is moving on
+DEFAULT_IDLE_POLL_INTERVAL = 2.0
+
+# Seconds between position polls of a server no client is watching (kept
+# up for position history)
+DEFAULT_UNWATCHED_POLL_INTERVAL = 5.0
+
+# Position polls per second across all servers
+DEFAULT_POLL_BUDGET = 100.0
+
+# Factor the interval grows by per poll while nothing moves
+IDLE_SLOWDOWN = 1.5
+
+# Map units a player must move between polls to count as activity
+MOVE_THRESHOLD = 0.5
+
+# Seconds between server info polls of one server
+DEFAULT_INFO_INTERVAL = 10.0
+
+# Seconds any single connect/poll may take before it counts as failed
+DEFAULT_POLL_TIMEOUT = 2.0
+
+# Fraction of the interval added or removed at random on every poll
+DEFAULT_JITTER = 0.1
+
+# Failed polls in a row before the connection is dropped and retried with backoff
+MAX_FAILED_POLLS = 3
+
+# Most seconds to wait before reconnecting to a failing server
+MAX_RECONNECT_DELAY = 30.0
+
+# Seconds between re-reads of the enabled server list
+DEFAULT_REFRESH_INTERVAL = 5.0
+
+
+class ServerPollState:
+    """One server's connector, schedule and counters"""
+    
+    def __init__(self, server, connector):
+        self.server = dict(server)
+        self.connector = connector
+        self.task = None
+        self.stopped = False
+        # Set to cut the current wait short (a client subscribed)
+        self.wake = asyncio.Event()
+        # Interval this server wants before the budget is applied
+        self.desired_interval = None
+        self.watched = False
+        self.active = False
+        self.players = 0
+        # user_id -> (x, y) at the previous poll, for movement detection
+        self.last_positions = {}
+        # Or the previous PositionBatch, for connectors that return batches
+        self.last_batch = None
+        self.polls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.consecutive_failures = 0
+        self.last_latency = None
+        self.last_poll = None
+    
+    @property
+    def server_id(self):
+        return self.server['id']
+    
+    def moved(self, positions):
+        """True if any player moved or appeared since the last poll"""
+        if isinstance(positions, PositionBatch):
+            previous, self.last_batch = self.last_batch, positions
+            return positions.moved_since(previous, MOVE_THRESHOLD)
+        previous = self.last_positions
+        self.last_positions = {player['user_id']: (player['x'], player['y']) for player in positions}
+        for user_id, (x, y) in self.last_positions.items():
+            old = previous.get(user_id)
+            if old is None or abs(x - old[0]) > MOVE_THRESHOLD or abs(y - old[1]) > MOVE_THRESHOLD:
+                return True
+        return False
+    
+    def stats(self, interval):
+        return {
+            'name': self.server.get('name'),
+            'connected': self.connector.connected,
+            'watched': self.watched,
+            'active': self.active,
+            'players': self.players,
+            'interval_ms': round(interval * 1000, 1),
+            'rate_hz': round(1 / interval, 2),
+            'polls': self.polls,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'last_latency_ms': round(self.last_latency * 1000, 2) if self.last_latency is not None else None
+        }
+
+
+class ServerPoller:
+    """Runs one polling task per enabled server on the hub's event loop"""
+    
+    def __init__(self, server_manager, connector_factory=ArmaServerConnector, poll_interval=DEFAULT_POLL_INTERVAL,
+                 idle_interval=DEFAULT_IDLE_POLL_INTERVAL, unwatched_interval=DEFAULT_UNWATCHED_POLL_INTERVAL,
+                 info_interval=DEFAULT_INFO_INTERVAL, timeout=DEFAULT_POLL_TIMEOUT, jitter=DEFAULT_JITTER,
+                 refresh_interval=DEFAULT_REFRESH_INTERVAL, budget=None):
+        self.server_manager = server_manager
+        # (ip, port) -> connector; swapped out in tests and for other protocols
+        self.connector_factory = connector_factory
+        self.poll_interval = poll_interval
+        self.idle_interval = idle_interval
+        self.unwatched_interval = unwatched_interval
+        # Polls per second over all servers; None follows the server manager's poll_budget
+        self.budget = budget
+        self.info_interval = info_interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.refresh_interval = refresh_interval
+        self.hub = None
+        # server_id -> ServerPollState
+        self.servers = {}
+        # Sum of the rates (1 / desired interval) all servers want
+        self.demand = 0.0
+        self.refresh_task = None
+    
+    def start(self, hub):
+        """Start polling into `hub` on the running event loop"""
+        self.hub = hub
+        self.refresh()
+        if self.refresh_task is None:
+            self.refresh_task = asyncio.create_task(self.refresh_loop())
+    
+    async def refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            self.refresh()
+    
+    def refresh(self):
+        """Start/stop/restart server tasks to match the enabled servers in the config"""
+        wanted = {server['id']: server for server in self.server_manager.get_enabled_servers()
+                  if server.get('ip') and server.get('port')}
+        for server_id, state in list(self.servers.items()):
+            server = wanted.get(server_id)
+            if server is None or server != state.server:
+                self.stop_server(server_id)
+        for server_id, server in wanted.items():
+            if server_id not in self.servers:
+                # Reforger answers A2S on its query port, not the game port
+                port = server.get('query_port') or DEFAULT_QUERY_PORT
+                state = ServerPollState(server, self.connector_factory(server['ip'], port))
+                poll_interval = server.get('poll_interval', self.poll_interval)
+                if poll_interval < MIN_POLL_INTERVAL:
+                    logger.warning(f"Server {server_id}: poll_interval {poll_interval} is below the minimum, "
+                                   f"using {MIN_POLL_INTERVAL}s")
+                self.set_desired_interval(state, poll_interval)
+                state.task = asyncio.create_task(self.poll_server(state))
+                self.servers[server_id] = state
+                logger.info(f"Polling server {server_id} ({server['ip']}:{server['port']})")
+    
+    def stop_server(self, server_id):
+        state = self.servers.pop(server_id, None)
+        if state is not None:
+            # wait_for() can turn a cancel that races its timeout into a
+            # TimeoutError, so the loop also checks the flag
+            state.stopped = True
+            state.task.cancel()
+            self.demand -= 1 / state.desired_interval
+            logger.info(f"Stopped polling server {server_id}")
+    
+    def wake(self, server_id):
+        """Poll a server now, e.g. because a client just started watching it"""
+        state = self.servers.get(server_id)
+        if state is not None:
+            state.wake.set()
+    
+    @property
+    def poll_budget(self):
+        return self.budget if self.budget is not None else self.server_manager.poll_budget
+    
+    @property
+    def throttle(self):
+        """Factor every interval is stretched by to stay within the budget"""
+        return max(1.0, self.demand / self.poll_budget)
+    
+    def set_desired_interval(self, state, interval):
+        # Intervals come from the config; never divide by zero or poll in a busy loop
+        interval = max(MIN_POLL_INTERVAL, interval)
+        if state.desired_interval is not None:
+            self.demand -= 1 / state.desired_interval
+        state.desired_interval = interval
+        self.demand += 1 / interval
+    
+    def effective_interval(self, state):
+        return state.desired_interval * self.throttle
+    
+    def adapt(self, state, positions):
+        """Pick the server's next poll interval from its activity and watchers"""
+        fast = state.server.get('poll_interval', self.poll_interval)
+        idle = max(fast, state.server.get('idle_poll_interval', self.idle_interval))
+        state.watched = self.hub.is_watched(state.server_id)
+        state.active = state.moved(positions)
+        state.players = len(positions)
+        if not state.watched:
+            interval = max(fast, self.unwatched_interval)
+        elif not positions:
+            interval = idle
+        elif state.active:
+            interval = fast
+        else:
+            # Players present but standing still: slow down gradually
+            interval = min(idle, state.desired_interval * IDLE_SLOWDOWN)
+        self.set_desired_interval(state, interval)
+    
+    async def sleep(self, state, delay):
+        """Wait `delay` seconds, or less if the server is woken"""
+        if state.wake.is_set():
+            state.wake.clear()
+            return
+        try:
+            await asyncio.wait_for(state.wake.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        state.wake.clear()
+    
+    def next_delay(self, interval):
+        """interval +/- jitter"""
+        return interval * (1 + random.uniform(-self.jitter, self.jitter))
+    
+    async def call(self, state, coroutine):
+        """Await one connector call under the timeout; None if it failed"""
+        try:
+            return await asyncio.wait_for(coroutine, self.timeout)
+        except asyncio.TimeoutError:
+            state.timeouts += 1
+            logger.warning(f"Server {state.server_id} did not answer within {self.timeout}s")
+        except Exception as e:
+            logger.error(f"Polling server {state.server_id} failed: {e}")
+        state.failures += 1
+        state.consecutive_failures += 1
+        return None
+    
+    async def poll_server(self, state):
+        """One server's loop: connect, then poll positions (and info less often)"""
+        poll_interval = max(MIN_POLL_INTERVAL, state.server.get('poll_interval', self.poll_interval))
+        info_interval = state.server.get('info_interval', self.info_interval)
+        state.wake.clear()
+        connector = state.connector
+        # Spread the first polls of all servers over one interval
+        await asyncio.sleep(random.uniform(0, poll_interval))
+        next_info = 0.0
+        try:
+            while not state.stopped:
+                if not connector.connected:
+                    if state.consecutive_failures:
+                        # Back off while the server stays unreachable
+                        delay = min(MAX_RECONNECT_DELAY, poll_interval * 2 ** min(state.consecutive_failures, 16))
+                        await asyncio.sleep(self.next_delay(delay))
+                    connected = await self.call(state, connector.connect())
+                    if connected is False:
+                        state.failures += 1
+                        state.consecutive_failures += 1
+                    if not connected:
+                        continue
+                
+                started = time.monotonic()
+                positions = await self.call(state, connector.get_player_positions())
+                if positions is not None:
+                    state.consecutive_failures = 0
+                    state.polls += 1
+                    state.last_latency = time.monotonic() - started
+                    state.last_poll = time.time()
+                    if positions:
+                        self.hub.update_positions(state.server_id, positions)
+                    self.adapt(state, positions)
+                elif state.consecutive_failures >= MAX_FAILED_POLLS:
+                    # Reconnect (with backoff) instead of hammering a dead server
+                    await connector.disconnect()
+                    continue
+                
+                if started >= next_info:
+                    next_info = started + info_interval
+                    info = await self.call(state, connector.get_server_info())
+                    if info is not None:
+                        self.hub.update_server_info(state.server_id, info)
+                
+                # Fixed rate: the time spent polling counts towards the interval
+                elapsed = time.monotonic() - started
+                await self.sleep(state, max(0.0, self.next_delay(self.effective_interval(state)) - elapsed))
+        finally:
+            if connector.connected:
+                await connector.disconnect()
+    
+    async def stop(self):
+        """Stop every polling task and disconnect"""
+        if self.refresh_task is not None:
+            self.refresh_task.cancel()
+            self.refresh_task = None
+        tasks = [state.task for state in self.servers.values()]
+        for server_id in list(self.servers):
+            self.stop_server(server_id)
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def stats(self):
+        """Poll budget use and per-server effective rates and counters for metrics"""
+        throttle = self.throttle
+        return {
+            'budget_hz': self.poll_budget,
+            'demand_hz': round(self.demand, 2),
+            'rate_hz': round(self.demand / throttle, 2),
+            'throttle': round(throttle, 3),
+            'servers': {server_id: state.stats(state.desired_interval * throttle)
+                        for server_id, state in self.servers.items()}
+        }
@@ -0,0 +1,91 @@
+"""In-memory cache of validated session tokens
+
+Database.verify_session answers from here when it can, so repeated checks of
+the same token (app start, authenticating WebSocket connections) cost no disk
+read and no datetime parsing. Only valid sessions are cached; unknown tokens
+always go to the database.
+
+Entries live for at most `ttl` seconds and never past the session's own
+expires_at. Sessions created or revoked through the same Database are
+invalidated immediately; a revocation made by another process is picked up
+once the entry's TTL runs out.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+# Seconds a validated session is trusted without asking the database again
+DEFAULT_SESSION_TTL = 60.0
+
+# Validated sessions kept, least recently used evicted first
+DEFAULT_SESSION_CACHE_SIZE = 4096
+
+
+class SessionCache:
+    """Thread-safe LRU of (token, device_id) -> (user_id, expires_at)"""
+    
+    def __init__(self, ttl=DEFAULT_SESSION_TTL, max_size=DEFAULT_SESSION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        # (token, device_id) -> (user_id, expires_at datetime, cached-until monotonic time)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, token, device_id):
+        """Cached user_id for a still-valid session, or None on a miss"""
+        key = (token, device_id)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                user_id, expires_at, cached_until = entry
+                if cached_until > time.monotonic() and expires_at > datetime.now():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return user_id
+                # Stale or expired; the caller re-checks the database
+                del self.entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, token, device_id, user_id, expires_at):
+        """Remember a session the database just validated"""
+        key = (token, device_id)
+        with self.lock:
+            self.entries[key] = (user_id, expires_at, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, token):
+        """Forget a token on every device"""
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == token]:
+                del self.entries[key]
+    
+    def invalidate_user(self, user_id):
+        """Forget every session of a user"""
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[0] == user_id]:
+                del self.entries[key]
+    
+    def clear(self):
+        """Forget everything"""
+        with self.lock:
+            self.entries.clear()
+    
+    def stats(self):
+        """Cache counters for metrics"""
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,77 @@
+"""Uniform-grid spatial index for per-client areas of interest
+
+The map is cut into square cells of `cell_size` map units. Every marker and
+player is filed under the cell it is in, and a client's area of interest is
+the set of cells its viewport rectangle touches. Clients whose viewports
+cover the same cells share the same frames.
+"""
+
+
+# Map units per grid cell (the default map is 4000x4000, i.e. 16x16 cells)
+DEFAULT_CELL_SIZE = 250
+
+# Viewports touching more cells than this are treated as "whole map"
+MAX_AOI_CELLS = 4096
+
+
+class SpatialGrid:
+    """Maps entity keys to grid cells and cells to the keys inside them"""
+    
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        # key -> (cx, cy)
+        self.cells = {}
+        # (cx, cy) -> set of keys
+        self.buckets = {}
+    
+    def cell_of(self, x, y):
+        """Cell containing a map position"""
+        try:
+            return (int(float(x) // self.cell_size), int(float(y) // self.cell_size))
+        except (TypeError, ValueError):
+            return (0, 0)
+    
+    def cells_in_rect(self, x, y, width, height):
+        """Cells touched by a rectangle, or None if it is too large to be worth filtering"""
+        x0, y0 = self.cell_of(x, y)
+        x1, y1 = self.cell_of(float(x) + max(float(width), 0.0), float(y) + max(float(height), 0.0))
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_AOI_CELLS:
+            return None
+        return frozenset((cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1))
+    
+    def move(self, key, x, y):
+        """File key under the cell for (x, y); returns (old_cell, new_cell)"""
+        new_cell = self.cell_of(x, y)
+        old_cell = self.cells.get(key)
+        if old_cell != new_cell:
+            if old_cell is not None:
+                self._discard(key, old_cell)
+            self.cells[key] = new_cell
+            self.buckets.setdefault(new_cell, set()).add(key)
+        return old_cell, new_cell
+    
+    def remove(self, key):
+        """Drop key from the index; returns the cell it was in"""
+        cell = self.cells.pop(key, None)
+        if cell is not None:
+            self._discard(key, cell)
+        return cell
+    
+    def _discard(self, key, cell):
+        bucket = self.buckets.get(cell)
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self.buckets[cell]
+    
+    def query(self, cells):
+        """All keys filed under any of the given cells (a set/frozenset)"""
+        if len(cells) > len(self.buckets):
+            # Large area over a sparse map: walk the occupied cells instead
+            return [key for cell, bucket in self.buckets.items() if cell in cells for key in bucket]
+        keys = []
+        for cell in cells:
+            bucket = self.buckets.get(cell)
+            if bucket:
+                keys.extend(bucket)
+        return keys
@@ -1,8 +1,19 @@
 import asyncio
-import json
+import itertools
+import math
+import os
+import uuid
 import websockets
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
 import logging
+from core.room import Room, DEFAULT_SERVER_ID, DEFAULT_HISTORY_SIZE
+from core.delta_codec import DEFAULT_KEYFRAME_INTERVAL
+from core.spatial_grid import DEFAULT_CELL_SIZE
+from core.position_batch import PositionBatch
+from core.client_connection import (ClientConnection, DEFAULT_HIGH_WATER, DEFAULT_MAX_QUEUE,
+                                    DEFAULT_LAG_TIMEOUT)
+from core import wire_format
 
 # Set up logging
 logging.basicConfig(
@@ -12,126 +23,683 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# Default position broadcast rate (batches per second per room)
+DEFAULT_TICK_RATE = 15
+
+# Seconds between queue metric log lines
+METRICS_LOG_INTERVAL = 60
+
+# Position streams a client can ask for with ?positions= or a hello message
+POSITION_FORMATS = ('full', 'delta', 'columns')
+
+
 class WebSocketServer:
-    def __init__(self, host='localhost', port=8765):
+    def __init__(self, host='localhost', port=8765, tick_rate=DEFAULT_TICK_RATE,
+                 keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, high_water=DEFAULT_HIGH_WATER,
+                 max_queue=DEFAULT_MAX_QUEUE, lag_timeout=DEFAULT_LAG_TIMEOUT, compression='deflate',
+                 bus=None, reuse_port=False, history_size=DEFAULT_HISTORY_SIZE, epoch=None,
+                 cell_size=DEFAULT_CELL_SIZE, marker_store=None, position_history=None,
+                 server_poller=None):
         self.host = host
         self.port = port
-        self.clients = set()
-        self.markers = {}
-        self.player_positions = {}
+        self.tick_rate = tick_rate
+        self.keyframe_interval = keyframe_interval
+        self.high_water = high_water
+        self.max_queue = max_queue
+        self.lag_timeout = lag_timeout
+        self.history_size = history_size
+        self.cell_size = cell_size
+        # Optional core.marker_store.MarkerStore for restart durability
+        self.marker_store = marker_store
+        # Optional core.position_history.PositionHistory recording every tick's positions
+        self.position_history = position_history
+        # Optional core.server_poller.ServerPoller feeding game server data into the rooms
+        self.server_poller = server_poller
+        # Identifies this run's sequence numbers; workers sharing a bus share one
+        self.epoch = epoch or uuid.uuid4().hex[:12]
+        # permessage-deflate keeps a compressor per connection, so compressed
+        # bytes can never be shared; None makes fan-out a pure byte copy
+        self.compression = compression
+        # Shared bus when running as one of several workers (see core.hub_bus)
+        self.bus = bus
+        self.reuse_port = reuse_port
+        self.hub_id = f"{os.getpid()}-{id(self):x}"
+        self._client_ids = itertools.count(1)
+        # server_id -> {user_id: player}, published to the bus once per tick
+        self.bus_positions = {}
+        if bus is not None:
+            bus.subscribe(self.apply_event)
+        # websocket -> ClientConnection
+        self.clients = {}
+        self.rooms = {}
+        self.slow_disconnects = 0
+        self.resumed_sessions = 0
         self.server = None
+        self.tick_task = None
     
-    async def register(self, websocket):
+    def get_room(self, server_id):
+        """Get the room for a server, creating it on first use"""
+        room = self.rooms.get(server_id)
+        if room is None:
+            room = Room(server_id, self.keyframe_interval, self.epoch, self.history_size, self.cell_size)
+            self.rooms[server_id] = room
+        return room
+    
+    @staticmethod
+    def parse_server_id(value):
+        """Parse a server_id sent by a client, falling back to the default room"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return DEFAULT_SERVER_ID
+    
+    @staticmethod
+    def parse_marker(data):
+        """A client's marker with id/type/x/y checked and coerced, or None if it cannot be stored"""
+        if not isinstance(data, dict):
+            return None
+        try:
+            x = float(data['x'])
+            y = float(data['y'])
+            user_id = int(data['user_id'])
+            timestamp = data['timestamp']
+        except (KeyError, TypeError, ValueError):
+            return None
+        marker_type = data.get('type')
+        if not isinstance(marker_type, str) or not marker_type or not (math.isfinite(x) and math.isfinite(y)):
+            return None
+        marker = dict(data, type=marker_type, x=x, y=y, user_id=user_id)
+        if not isinstance(marker.get('description', ''), str):
+            marker['description'] = str(marker['description'])
+        marker['id'] = f"{user_id}_{timestamp}"
+        return marker
+    
+    @staticmethod
+    def valid_position(player):
+        """True if a client's position update has a user_id and finite x/y"""
+        if not isinstance(player, dict) or not player.get('user_id'):
+            return False
+        try:
+            return math.isfinite(float(player['x'])) and math.isfinite(float(player['y']))
+        except (KeyError, TypeError, ValueError):
+            return False
+    
+    @staticmethod
+    def parse_seq(value):
+        """Parse a last-seen sequence number sent by a resuming client"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    
+    async def register(self, websocket, server_id=DEFAULT_SERVER_ID, positions='full', last_seq=None, epoch=None):
         """Register new client"""
-        self.clients.add(websocket)
+        # Encoding negotiated through the WebSocket subprotocol (JSON if none)
+        client = ClientConnection(
+            websocket,
+            wire_format.encoding_for_subprotocol(getattr(websocket, 'subprotocol', None)),
+            high_water=self.high_water,
+            max_queue=self.max_queue,
+            lag_timeout=self.lag_timeout
+        )
+        client.delta = positions == 'delta'
+        client.columns = positions == 'columns' and client.encoding != wire_format.JSON
+        client.client_id = next(self._client_ids)
+        client.start()
+        self.clients[websocket] = client
         logger.info(f"Client connected. Total clients: {len(self.clients)}")
+        await self.join_room(client, server_id, last_seq, epoch)
+        return client
+    
+    async def join_room(self, client, server_id, last_seq=None, epoch=None):
+        """Move a client into the room for server_id and send that room's state
         
-        # Send existing markers to new client
-        if self.markers:
-            await websocket.send(json.dumps({
-                'type': 'markers_sync',
-                'markers': list(self.markers.values())
-            }))
-            logger.info(f"Sent {len(self.markers)} markers to new client")
+        A client that passes the last seq/epoch it saw gets only the missed
+        events, unless the room's ring buffer no longer covers the gap.
+        """
+        if client.room is not None:
+            if client.room.server_id == server_id:
+                return client.room
+            self.leave_room(client)
+        
+        room = self.get_room(server_id)
+        client.room = room
+        room.add_client(client)
+        logger.info(f"Client joined room {server_id}. Room clients: {len(room.clients)}")
+        
+        missed = None
+        if last_seq is not None and epoch == room.epoch:
+            missed = room.events_since(last_seq)
+        if missed is not None:
+            self.resumed_sessions += 1
+            self.send(client, {
+                'type': 'resumed',
+                'server_id': server_id,
+                'epoch': room.epoch,
+                'seq': room.seq,
+                'replayed': len(missed)
+            })
+            for frame in missed:
+                self.send(client, frame)
+            logger.info(f"Client resumed room {server_id} at seq {last_seq}, replayed {len(missed)} events")
+        
+        # Full marker snapshot (cached frame, shared by joiners); a client whose
+        # resume could not be served always gets one so it drops stale markers
+        elif room.markers or last_seq is not None:
+            self.send(client, room.markers_sync())
+            logger.info(f"Sent {len(room.markers)} markers to new client")
         
         # Send existing player positions to new client
-        if self.player_positions:
-            await websocket.send(json.dumps({
+        self.send_position_snapshot(client)
+        if room.server_info is not None:
+            self.send(client, {'type': 'server_info', 'server_id': server_id, 'info': room.server_info})
+        if self.server_poller is not None:
+            # Back to the fast poll rate without waiting out an unwatched interval
+            self.server_poller.wake(server_id)
+        return room
+    
+    def leave_room(self, client):
+        """Remove a client from its current room"""
+        room = client.room
+        if room is None:
+            return
+        client.room = None
+        room.remove_client(client)
+        # Viewports are per map; the client sends a new one after switching
+        client.aoi = None
+        if room.is_idle():
+            del self.rooms[room.server_id]
+    
+    def send_position_snapshot(self, client):
+        """Queue a full position snapshot in the client's position format"""
+        room = client.room
+        if client.aoi is not None:
+            client.enqueue_positions(wire_format.encode({
                 'type': 'positions_sync',
-                'positions': list(self.player_positions.values())
-            }))
-            logger.info(f"Sent {len(self.player_positions)} player positions to new client")
+                'server_id': room.server_id,
+                'positions': room.players_in(client.aoi)
+            }, client.encoding), snapshot=True)
+        elif client.delta:
+            client.enqueue_positions(room.delta_keyframe(client).encode(client.encoding), snapshot=True)
+        elif room.player_positions:
+            client.enqueue_positions(room.positions_sync().encode(client.encoding), snapshot=True)
+            logger.info(f"Sent {len(room.player_positions)} player positions to client")
+        else:
+            client.needs_resync = False
+    
+    @staticmethod
+    def position_format(client):
+        """The position stream a client gets: 'full', 'delta' or 'columns'"""
+        if client.delta:
+            return 'delta'
+        return 'columns' if client.columns else 'full'
+    
+    async def set_position_format(self, client, positions):
+        """Switch a client between full positions_batch frames, the delta stream and
+        columnar positions_columns frames (binary encodings only; JSON clients get full)"""
+        delta = positions == 'delta'
+        columns = positions == 'columns' and client.encoding != wire_format.JSON
+        if delta == client.delta and columns == client.columns:
+            return
+        room = client.room
+        room.remove_client(client)
+        client.delta = delta
+        client.columns = columns
+        room.add_client(client)
+        self.send_position_snapshot(client)
+    
+    def set_viewport(self, client, rect):
+        """Limit a client to the markers/players inside rect ([x, y, width, height]), or lift the limit"""
+        room = client.room
+        cells = None
+        if rect:
+            try:
+                cells = room.player_grid.cells_in_rect(*rect[:4])
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid viewport from {client.address}: {rect}")
+                return
+        old_cells = client.aoi
+        if cells == old_cells:
+            return
+        room.set_aoi(client, cells)
+        
+        if cells is None:
+            # Back to the whole map
+            self.send(client, room.markers_sync())
+            self.send_position_snapshot(client)
+        elif old_cells is None:
+            # Client drops everything it had and keeps only what is in view
+            self.send(client, {
+                'type': 'aoi_update',
+                'server_id': room.server_id,
+                'reset': True,
+                'enter': {'markers': room.markers_in(cells), 'players': room.players_in(cells)},
+                'leave': {'markers': [], 'players': []}
+            })
+        else:
+            entered = cells - old_cells
+            left = old_cells - cells
+            self.send(client, {
+                'type': 'aoi_update',
+                'server_id': room.server_id,
+                'reset': False,
+                'enter': {'markers': room.markers_in(entered), 'players': room.players_in(entered)},
+                'leave': {'markers': room.marker_grid.query(left), 'players': room.player_grid.query(left)}
+            })
+    
+    def send_aoi_positions(self, room, cells, clients, moves):
+        """Send one AOI group its share of this tick: in-view moves plus enter/leave"""
+        positions = []
+        entered = []
+        left = []
+        for player, old_cell, new_cell in moves:
+            inside = new_cell in cells
+            if old_cell in cells:
+                if inside:
+                    positions.append(player)
+                else:
+                    left.append(player['user_id'])
+            elif inside:
+                entered.append(player)
+        if positions:
+            self.broadcast(room, {
+                'type': 'positions_batch',
+                'server_id': room.server_id,
+                'positions': positions
+            }, clients=clients, positions=True)
+        if entered or left:
+            # An event, not a position frame: dropping it would desync the client
+            self.broadcast(room, {
+                'type': 'aoi_update',
+                'server_id': room.server_id,
+                'reset': False,
+                'enter': {'markers': [], 'players': entered},
+                'leave': {'markers': [], 'players': left}
+            }, clients=clients)
     
     async def unregister(self, websocket):
         """Unregister client"""
-        self.clients.discard(websocket)
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        client.stop()
+        self.leave_room(client)
+        if client.close_reason:
+            self.slow_disconnects += 1
         logger.info(f"Client disconnected. Total clients: {len(self.clients)}")
     
-    async def broadcast(self, message, exclude=None):
-        """Broadcast message to all clients except sender"""
-        if self.clients:
-            tasks = []
-            for client in self.clients:
-                if client != exclude:
-                    tasks.append(client.send(message))
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+    def send(self, client, message):
+        """Queue a message dict or Frame for one client in its negotiated encoding"""
+        client.enqueue(wire_format.as_frame(message).encode(client.encoding))
+    
+    def broadcast(self, room, message, exclude=None, clients=None, positions=False):
+        """Broadcast message to all clients in a room except sender
+        
+        Frames are only queued here; each client's writer task does the sending,
+        so a stalled client cannot hold up the rest of the room.
+        """
+        if clients is None:
+            clients = room.clients
+        # Encoded at most once per wire encoding, then the same bytes go to everyone
+        message = wire_format.as_frame(message)
+        for client in clients:
+            if client is exclude:
+                continue
+            frame = message.encode(client.encoding)
+            if positions:
+                client.enqueue_positions(frame)
+            else:
+                client.enqueue(frame)
+    
+    def submit(self, event, client=None):
+        """Apply a room event here, or publish it so every worker applies it in bus order"""
+        if client is not None:
+            # Lets the originating worker skip echoing the event to its sender
+            event['origin'] = self.hub_id
+            event['sender'] = client.client_id
+        if self.bus is None:
+            self.apply_event(event)
+        else:
+            self.bus.publish(event)
+    
+    def apply_event(self, event):
+        """Apply a room event (local or delivered by the bus) and fan it out"""
+        event_type = event.get('type')
+        room = self.get_room(event['server_id'])
+        exclude = None
+        if event.get('origin') == self.hub_id:
+            exclude = next((c for c in room.clients if c.client_id == event.get('sender')), None)
+        
+        if event_type == 'marker_add':
+            marker = event['marker']
+            room.add_marker(marker)
+            if self.marker_store is not None:
+                self.marker_store.marker_added(marker)
+            logger.info(f"Marker added: {marker['id']} ({marker['type']})")
+            
+            # Broadcast to all clients watching this part of the map
+            self.broadcast(room, room.record({
+                'type': 'marker_added',
+                'marker': marker
+            }), exclude=exclude, clients=room.interested_clients(room.marker_grid.cell_of(marker['x'], marker['y'])))
+        
+        elif event_type == 'marker_remove':
+            marker_id = event['marker_id']
+            marker = room.remove_marker(marker_id)
+            if marker is not None:
+                if self.marker_store is not None:
+                    self.marker_store.marker_removed(marker_id)
+                logger.info(f"Marker removed: {marker_id}")
+                
+                # Broadcast to all clients watching this part of the map
+                self.broadcast(room, room.record({
+                    'type': 'marker_removed',
+                    'marker_id': marker_id
+                }), exclude=exclude, clients=room.interested_clients(room.marker_grid.cell_of(marker['x'], marker['y'])))
+        
+        elif event_type == 'positions':
+            for player in event['positions']:
+                room.update_position(player['user_id'], player)
+        
+        elif event_type == 'chat_message':
+            self.broadcast(room, room.record(dict(event['message'])), exclude=exclude)
+        
+        elif event_type == 'server_info':
+            if room.server_info != event['info']:
+                room.server_info = event['info']
+                self.broadcast(room, {'type': 'server_info', 'server_id': room.server_id, 'info': room.server_info})
+        
+        if room.is_idle():
+            del self.rooms[room.server_id]
+    
+    def update_positions(self, server_id, players):
+        """Store player positions (dicts or a PositionBatch) for a room; they go out with the next tick"""
+        if self.bus is None:
+            room = self.get_room(server_id)
+            if isinstance(players, PositionBatch):
+                room.update_batch(players)
+                return
+            for player in players:
+                room.update_position(player['user_id'], player)
+        else:
+            if isinstance(players, PositionBatch):
+                # Bus events carry per-player dicts
+                players = players.players()
+            # Coalesced locally, published to the other workers once per tick
+            pending = self.bus_positions.setdefault(server_id, {})
+            for player in players:
+                pending[player['user_id']] = player
+    
+    def is_watched(self, server_id):
+        """True if any client is subscribed to the server's room"""
+        if self.bus is not None:
+            # Subscribers may be on another worker, which this one cannot see
+            return True
+        room = self.rooms.get(server_id)
+        return room is not None and bool(room.clients)
+    
+    def update_server_info(self, server_id, info):
+        """Record a game server's status and tell the room's clients if it changed"""
+        room = self.rooms.get(server_id)
+        if room is None or room.server_info != info:
+            self.submit({'type': 'server_info', 'server_id': server_id, 'info': info})
+    
+    def publish_positions(self):
+        """Publish this worker's coalesced position updates, one bus event per room"""
+        pending = self.bus_positions
+        self.bus_positions = {}
+        for server_id, players in pending.items():
+            self.bus.publish({'type': 'positions', 'server_id': server_id,
+                              'positions': list(players.values())})
+    
+    async def flush_positions(self):
+        """Send this tick's coalesced updates: one positions_batch frame per room,
+        plus one shared delta/keyframe frame for clients on the delta protocol
+        and one positions_columns frame of the polled batch for column clients"""
+        if self.bus_positions:
+            # An in-process bus applies these immediately; a broker relays them
+            # back in time for the next tick
+            self.publish_positions()
+        for room in list(self.rooms.values()):
+            batch = room.take_pending_batch()
+            if room.pending_positions or batch is not None:
+                positions = room.take_pending_positions()
+                if self.position_history is not None:
+                    self.position_history.record(room.server_id, positions)
+                    if batch is not None:
+                        self.position_history.record(room.server_id, batch, batch.timestamp)
+                players = positions
+                if batch is not None:
+                    if room.column_clients:
+                        # Written straight from the batch's buffers, no per-player objects
+                        self.broadcast(room, room.columns_frame(batch), clients=room.column_clients,
+                                       positions=True)
+                    if room.clients - room.column_clients:
+                        room.merge_batch()
+                        players = batch.players() + positions
+                    else:
+                        # Nobody needs the batch as dicts; catch up when someone does
+                        room.player_grid_stale = True
+                        room.delta.stale = True
+                if positions and room.column_clients:
+                    # Client-reported positions are not part of any batch
+                    self.broadcast(room, {
+                        'type': 'positions_batch',
+                        'server_id': room.server_id,
+                        'positions': positions
+                    }, clients=room.column_clients, positions=True)
+                if players:
+                    moves = room.advance_player_grid(players)
+                    full_clients = room.clients - room.delta_clients - room.aoi_clients - room.column_clients
+                    if full_clients:
+                        # Serialized once and shared by every client in the room
+                        self.broadcast(room, {
+                            'type': 'positions_batch',
+                            'server_id': room.server_id,
+                            'positions': players
+                        }, clients=full_clients, positions=True)
+                    frame = room.encode_delta(players)
+                    if frame is not None:
+                        self.broadcast(room, frame, clients=room.delta_clients, positions=True)
+                    # Viewport clients get only what is in view, one frame per distinct view
+                    for cells, clients in room.aoi_groups().items():
+                        self.send_aoi_positions(room, cells, clients, moves)
+            
+            # Lagging clients dropped a position frame; give them a snapshot
+            for client in room.clients:
+                if client.needs_resync:
+                    self.send_position_snapshot(client)
+        
+        # Clients that stopped draining get disconnected even without new traffic
+        for client in list(self.clients.values()):
+            client.check_backlog()
+    
+    async def tick_loop(self):
+        """Flush coalesced position updates at a fixed tick rate"""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        next_tick = loop.time() + interval
+        next_metrics_log = loop.time() + METRICS_LOG_INTERVAL
+        while True:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            try:
+                await self.flush_positions()
+            except Exception as e:
+                logger.error(f"Error flushing positions: {e}")
+            if loop.time() >= next_metrics_log and self.clients:
+                metrics = self.get_metrics()
+                logger.info(f"Clients: {metrics['clients']}, max queue depth: {metrics['max_queue_depth']}, "
+                            f"dropped frames: {metrics['frames_dropped']}, "
+                            f"slow disconnects: {metrics['slow_disconnects']}")
+                next_metrics_log = loop.time() + METRICS_LOG_INTERVAL
+            # Skip missed ticks instead of bursting to catch up
+            next_tick = max(next_tick + interval, loop.time())
+    
+    def start_ticker(self):
+        """Start the position tick loop on the running event loop"""
+        if self.tick_task is None:
+            self.tick_task = asyncio.create_task(self.tick_loop())
+        return self.tick_task
+    
+    def database_stats(self):
+        """Counters of the database thread behind the marker store / position history"""
+        for store in (self.marker_store, self.position_history):
+            if store is not None:
+                return store.db.stats()
+        return None
+    
+    def get_metrics(self):
+        """Per-client outbound queue depth and hub-wide counters"""
+        clients = [client.metrics() for client in self.clients.values()]
+        return {
+            'clients': len(clients),
+            'rooms': {server_id: len(room.clients) for server_id, room in self.rooms.items()},
+            'max_queue_depth': max((c['queue_depth'] for c in clients), default=0),
+            'frames_dropped': sum(c['frames_dropped'] for c in clients),
+            'slow_disconnects': self.slow_disconnects,
+            'resumed_sessions': self.resumed_sessions,
+            'marker_store': self.marker_store.stats() if self.marker_store is not None else None,
+            'position_history': self.position_history.stats() if self.position_history is not None else None,
+            'database': self.database_stats(),
+            'server_poller': self.server_poller.stats() if self.server_poller is not None else None,
+            'client_queues': clients
+        }
     
     async def handle_client(self, websocket, path):
         """Handle client connection"""
-        await self.register(websocket)
+        query = parse_qs(urlsplit(path or '').query)
+        client = await self.register(websocket, self.parse_server_id(query.get('server_id', [None])[0]),
+                                     positions=query.get('positions', ['full'])[0],
+                                     last_seq=self.parse_seq(query.get('last_seq', [None])[0]),
+                                     epoch=query.get('epoch', [None])[0])
         try:
             async for message in websocket:
-                data = json.loads(message)
+                data = wire_format.decode(message)
                 message_type = data.get('type')
+                room = client.room
+                
+                if message_type == 'subscribe':
+                    # Switch the client to another Arma server's room
+                    server_id = self.parse_server_id(data.get('server_id'))
+                    await self.join_room(client, server_id, self.parse_seq(data.get('last_seq')),
+                                         data.get('epoch'))
+                    self.send(client, {'type': 'subscribed', 'server_id': server_id})
+                
+                elif message_type == 'hello':
+                    # Protocol options; currently only the position stream format
+                    await self.set_position_format(client, data.get('positions'))
+                    self.send(client, {
+                        'type': 'welcome',
+                        'positions': self.position_format(client)
+                    })
                 
-                if message_type == 'marker_add':
-                    marker = data['marker']
-                    marker_id = f"{marker['user_id']}_{marker['timestamp']}"
-                    marker['id'] = marker_id
-                    self.markers[marker_id] = marker
-                    logger.info(f"Marker added: {marker_id} ({marker['type']})")
-                    
-                    # Broadcast to all clients
-                    await self.broadcast(json.dumps({
-                        'type': 'marker_added',
-                        'marker': marker
-                    }), exclude=websocket)
+                elif message_type == 'viewport':
+                    # Visible map area (with margin) as [x, y, width, height]; null for the whole map
+                    self.set_viewport(client, data.get('rect'))
+                
+                elif message_type == 'marker_add':
+                    marker = self.parse_marker(data.get('marker'))
+                    if marker is None:
+                        logger.warning(f"Ignoring invalid marker from {client.address}: {data.get('marker')}")
+                        continue
+                    marker['server_id'] = room.server_id
+                    self.submit({'type': 'marker_add', 'server_id': room.server_id, 'marker': marker}, client)
                 
                 elif message_type == 'marker_remove':
-                    marker_id = data['marker_id']
-                    if marker_id in self.markers:
-                        del self.markers[marker_id]
-                        logger.info(f"Marker removed: {marker_id}")
-                        
-                        # Broadcast to all clients
-                        await self.broadcast(json.dumps({
-                            'type': 'marker_removed',
-                            'marker_id': marker_id
-                        }), exclude=websocket)
+                    self.submit({'type': 'marker_remove', 'server_id': room.server_id,
+                                 'marker_id': data['marker_id']}, client)
                 
                 elif message_type == 'position_update':
-                    # Store and broadcast position updates
+                    # Store position; it goes out with the next positions_batch
                     player_data = data.get('player', {})
-                    user_id = player_data.get('user_id')
-                    if user_id:
-                        self.player_positions[user_id] = player_data
-                        await self.broadcast(json.dumps(data), exclude=websocket)
-                        logger.debug(f"Position updated for user {user_id}")
+                    if self.valid_position(player_data):
+                        self.update_positions(room.server_id, [player_data])
+                        logger.debug(f"Position updated for user {player_data['user_id']}")
+                    else:
+                        # inf/NaN or missing coordinates would break history and the delta stream
+                        logger.warning(f"Ignoring invalid position update from {client.address}")
                 
                 elif message_type == 'chat_message':
                     # Broadcast chat messages
                     logger.info(f"Chat message from {data.get('username', 'unknown')}: {data.get('message', '')[:50]}")
-                    await self.broadcast(json.dumps(data), exclude=websocket)
+                    self.submit({'type': 'chat_message', 'server_id': room.server_id, 'message': data}, client)
                 
                 elif message_type == 'ping':
                     # Respond to ping with pong
-                    await websocket.send(json.dumps({'type': 'pong', 'timestamp': data.get('timestamp')}))
+                    self.send(client, {'type': 'pong', 'timestamp': data.get('timestamp')})
                 
                 else:
                     logger.warning(f"Unknown message type: {message_type}")
         
         except websockets.exceptions.ConnectionClosed:
             logger.info("Client connection closed normally")
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON received: {e}")
+        except ValueError as e:
+            logger.error(f"Invalid message received: {e}")
         except Exception as e:
             logger.error(f"Error handling client: {e}")
         finally:
             await self.unregister(websocket)
     
-    async def start(self):
-        """Start WebSocket server"""
+    def warm_rooms(self):
+        """Load persisted markers into their rooms"""
+        markers = self.marker_store.load()
+        for server_id, room_markers in markers.items():
+            room = self.get_room(server_id)
+            for marker in room_markers:
+                room.add_marker(marker)
+        total = sum(len(room_markers) for room_markers in markers.values())
+        logger.info(f"Loaded {total} persisted markers for {len(markers)} servers")
+    
+    async def listen(self):
+        """Open the listening socket and start the tick loop"""
+        if self.marker_store is not None:
+            self.warm_rooms()
+            self.marker_store.start()
+        if self.position_history is not None:
+            self.position_history.start()
         self.server = await websockets.serve(
             self.handle_client, 
             self.host, 
             self.port,
+            subprotocols=wire_format.SUBPROTOCOLS,
+            compression=self.compression,
+            reuse_port=self.reuse_port,
             ping_interval=20,
             ping_timeout=10
         )
+        self.start_ticker()
+        if self.server_poller is not None:
+            self.server_poller.start(self)
+        return self.server
+    
+    async def stop(self):
+        """Stop accepting clients and cancel background tasks"""
+        if self.server_poller is not None:
+            await self.server_poller.stop()
+        if self.tick_task is not None:
+            self.tick_task.cancel()
+            self.tick_task = None
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        if self.marker_store is not None:
+            await self.marker_store.stop()
+        if self.position_history is not None:
+            await self.position_history.stop()
+    
+    async def start(self):
+        """Start WebSocket server"""
+        await self.listen()
         logger.info(f"WebSocket server started on ws://{self.host}:{self.port}")
+        logger.info(f"Broadcasting positions at {self.tick_rate} Hz")
+        logger.info(f"Wire encodings: {', '.join(wire_format.ENCODINGS)}")
         logger.info("Server ready to accept connections")
-        await asyncio.Future()
+        try:
+            await asyncio.Future()
+        finally:
+            # Also flushes pending marker writes on Ctrl+C
+            await self.stop()
     
     def run(self):
         """Run server in event loop"""
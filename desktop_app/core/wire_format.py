@@ -0,0 +1,87 @@
+"""Wire encodings for hub <-> client messages
+
+Messages are plain dicts. On the wire they are either JSON text frames (the
+default, understood by every client) or MessagePack binary frames. The
+encoding is negotiated per connection with a WebSocket subprotocol during the
+handshake:
+
+- ``arma-livemap.msgpack``: binary MessagePack frames
+- ``arma-livemap.json``: JSON text frames
+
+Clients that offer no subprotocol keep getting JSON. MessagePack is optional;
+without the ``msgpack`` package only JSON is offered.
+
+Outbound messages are wrapped in a Frame so each one is serialized at most
+once per encoding, no matter how many clients it is sent to.
+"""
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+SUBPROTOCOL_PREFIX = 'arma-livemap.'
+
+# Preferred first; both the hub and the desktop client offer this list
+ENCODINGS = [MSGPACK, JSON] if msgpack is not None else [JSON]
+SUBPROTOCOLS = [SUBPROTOCOL_PREFIX + encoding for encoding in ENCODINGS]
+
+
+def encoding_for_subprotocol(subprotocol):
+    """Map the negotiated subprotocol (or None) to an encoding name"""
+    if subprotocol and subprotocol.startswith(SUBPROTOCOL_PREFIX):
+        encoding = subprotocol[len(SUBPROTOCOL_PREFIX):]
+        if encoding in ENCODINGS:
+            return encoding
+    return JSON
+
+
+def encode(message, encoding=JSON):
+    """Encode a message dict as a text (JSON) or binary (MessagePack) frame"""
+    if encoding == MSGPACK:
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message, separators=(',', ':'))
+
+
+def decode(frame):
+    """Decode a received frame; binary frames are MessagePack, text frames JSON
+    
+    Raises ValueError for malformed frames.
+    """
+    if isinstance(frame, (bytes, bytearray, memoryview)):
+        if msgpack is None:
+            raise ValueError("Binary frame received but msgpack is not installed")
+        message = msgpack.unpackb(frame, raw=False, strict_map_key=False)
+    else:
+        message = json.loads(frame)
+    if not isinstance(message, dict):
+        raise ValueError(f"Expected a message object, got {type(message).__name__}")
+    return message
+
+
+class Frame:
+    """An outbound message, encoded lazily and at most once per encoding"""
+    
+    __slots__ = ('message', '_encoded')
+    
+    def __init__(self, message):
+        self.message = message
+        self._encoded = {}
+    
+    def encode(self, encoding=JSON):
+        """Encoded bytes/text for `encoding`, shared by every recipient"""
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = self._encoded[encoding] = encode(self.message, encoding)
+        return data
+
+
+def as_frame(message):
+    """Wrap a message dict in a Frame (Frames are returned unchanged)"""
+    return message if isinstance(message, Frame) else Frame(message)
@@ -5,8 +5,11 @@ from PySide6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QIcon
 from gui.styles import DARK_THEME
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
 
 class RegisterDialog(QDialog):
     def __init__(self, parent=None):
@@ -110,9 +113,9 @@ class RegisterDialog(QDialog):
 
 
 class PasswordResetDialog(QDialog):
-    def __init__(self, db, parent=None):
+    def __init__(self, auth_service, parent=None):
         super().__init__(parent)
-        self.db = db
+        self.auth_service = auth_service
         self.setWindowTitle("Password Reset")
         self.setMinimumWidth(400)
         self.setStyleSheet(DARK_THEME)
@@ -151,10 +154,10 @@ class PasswordResetDialog(QDialog):
         self.questions_widget.setVisible(False)
         layout.addWidget(self.questions_widget)
         
-        button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
-        button_box.accepted.connect(self.reset_password)
-        button_box.rejected.connect(self.reject)
-        layout.addWidget(button_box)
+        self.button_box = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        self.button_box.accepted.connect(self.reset_password)
+        self.button_box.rejected.connect(self.reject)
+        layout.addWidget(self.button_box)
         
         self.setLayout(layout)
     
@@ -164,15 +167,19 @@ class PasswordResetDialog(QDialog):
             QMessageBox.warning(self, "Error", "Please enter username")
             return
         
-        user = self.db.get_user_by_username(username)
-        if not user:
+        self.verify_button.setEnabled(False)
+        self.auth_service.get_security_questions(username, self.on_security_questions,
+                                                 error_callback=self.on_auth_error)
+    
+    def on_security_questions(self, questions):
+        if not questions:
+            self.verify_button.setEnabled(True)
             QMessageBox.warning(self, "Error", "User not found")
             return
         
-        self.q1_label.setText(user[3])
-        self.q2_label.setText(user[5])
+        self.q1_label.setText(questions[0])
+        self.q2_label.setText(questions[1])
         self.questions_widget.setVisible(True)
-        self.verify_button.setEnabled(False)
     
     def reset_password(self):
         username = self.username_input.text().strip()
@@ -181,25 +188,39 @@ class PasswordResetDialog(QDialog):
             QMessageBox.warning(self, "Error", "Please verify your identity first")
             return
         
-        if self.db.verify_security_answers(username, self.a1_input.text(), self.a2_input.text()):
-            if len(self.new_password_input.text()) < 4:
-                QMessageBox.warning(self, "Error", "Password must be at least 4 characters")
-                return
-            
-            self.db.reset_password(username, self.new_password_input.text())
+        if len(self.new_password_input.text()) < 4:
+            QMessageBox.warning(self, "Error", "Password must be at least 4 characters")
+            return
+        
+        self.button_box.setEnabled(False)
+        self.auth_service.reset_password(username, self.a1_input.text(), self.a2_input.text(),
+                                         self.new_password_input.text(), self.on_password_reset,
+                                         error_callback=self.on_auth_error)
+    
+    def on_password_reset(self, success):
+        self.button_box.setEnabled(True)
+        if success:
             QMessageBox.information(self, "Success", "Password reset successful!")
             self.accept()
         else:
             QMessageBox.warning(self, "Error", "Security answers are incorrect")
+    
+    def on_auth_error(self, error):
+        self.verify_button.setEnabled(not self.questions_widget.isVisible())
+        self.button_box.setEnabled(True)
+        QMessageBox.critical(self, "Error", f"Password reset failed: {error}")
 
 
 class LoginWindow(QMainWindow):
     login_successful = Signal(int, str, str)
     
-    def __init__(self, db, device_id):
+    def __init__(self, db, device_id, auth_service):
         super().__init__()
         self.db = db
         self.device_id = device_id
+        # Hashing and SQLite run on the service's worker threads
+        self.auth_service = auth_service
+        self.auth_service.latency_measured.connect(self.on_auth_latency)
         self.setWindowTitle("Arma Reforger - Live Map Login")
         self.setMinimumSize(500, 400)
         self.setStyleSheet(DARK_THEME)
@@ -275,34 +296,56 @@ class LoginWindow(QMainWindow):
             QMessageBox.warning(self, "Error", "Please enter username and password")
             return
         
-        user_id = self.db.verify_login(username, password)
-        if user_id:
-            keep_logged_in = self.keep_logged_in.isChecked()
-            session_token = self.db.create_session(user_id, self.device_id, keep_logged_in)
-            
-            self.login_successful.emit(user_id, username, session_token)
-            self.close()
-        else:
-            QMessageBox.warning(self, "Error", "Invalid username or password")
+        # The window stays responsive; the buttons wait for the result
+        self.set_busy(True)
+        
+        def on_login(result):
+            self.set_busy(False)
+            if result:
+                user_id, session_token = result
+                self.login_successful.emit(user_id, username, session_token)
+                self.close()
+            else:
+                QMessageBox.warning(self, "Error", "Invalid username or password")
+        
+        self.auth_service.login(username, password, self.device_id, self.keep_logged_in.isChecked(),
+                                on_login, error_callback=self.on_auth_error)
+    
+    def set_busy(self, busy):
+        """Disable the form while an account operation is running"""
+        for widget in (self.login_button, self.register_button, self.reset_link, self.password_input):
+            widget.setEnabled(not busy)
+    
+    def on_auth_latency(self, name, queued, running):
+        logger.info(f"Auth {name}: {queued * 1000:.1f} ms waiting for a worker, {running * 1000:.1f} ms running")
+    
+    def on_auth_error(self, error):
+        self.set_busy(False)
+        QMessageBox.critical(self, "Error", f"Account operation failed: {error}")
     
     def show_register(self):
         dialog = RegisterDialog(self)
         if dialog.exec():
             data = dialog.get_data()
-            user_id = self.db.create_user(
+            self.set_busy(True)
+            self.auth_service.create_user(
                 data['username'],
                 data['password'],
                 data['security_q1'],
                 data['security_a1'],
                 data['security_q2'],
-                data['security_a2']
+                data['security_a2'],
+                self.on_user_created,
+                error_callback=self.on_auth_error
             )
-            
-            if user_id:
-                QMessageBox.information(self, "Success", "Account created successfully! You can now login.")
-            else:
-                QMessageBox.warning(self, "Error", "Username already exists")
+    
+    def on_user_created(self, user_id):
+        self.set_busy(False)
+        if user_id:
+            QMessageBox.information(self, "Success", "Account created successfully! You can now login.")
+        else:
+            QMessageBox.warning(self, "Error", "Username already exists")
     
     def show_password_reset(self):
-        dialog = PasswordResetDialog(self.db, self)
+        dialog = PasswordResetDialog(self.auth_service, self)
         dialog.exec()
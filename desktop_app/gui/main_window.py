@@ -9,7 +9,8 @@ from gui.settings_window import SettingsWindow, TOTPVerifyDialog
 from gui.feedback_dialog import FeedbackDialog
 from gui.custom_server_dialog import CustomServerDialog
 from map.map_viewer import MapViewer, ARMA_MARKER_TYPES
-import json
+from core.delta_codec import DeltaDecoder
+from core import wire_format
 import asyncio
 import websockets
 
@@ -22,12 +23,17 @@ class WebSocketClient(QThread):
     connected = Signal()
     disconnected = Signal()
     
-    def __init__(self, host='localhost', port=8765):
+    def __init__(self, host='localhost', port=8765, server_id=None, epoch=None, last_seq=None):
         super().__init__()
         self.host = host
         self.port = port
+        self.server_id = server_id
+        # Last room event seen before a reconnect, so the hub only replays what was missed
+        self.epoch = epoch
+        self.last_seq = last_seq
         self.running = False
         self.websocket = None
+        self.encoding = wire_format.JSON
         self.send_queue = []
     
     def run(self):
@@ -35,10 +41,17 @@ class WebSocketClient(QThread):
         asyncio.run(self.connect())
     
     async def connect(self):
-        uri = f"ws://{self.host}:{self.port}"
+        # Ask for the compact delta position stream
+        uri = f"ws://{self.host}:{self.port}/?positions=delta"
+        if self.server_id is not None:
+            # Join the room for the selected Arma server straight away
+            uri += f"&server_id={self.server_id}"
+            if self.epoch and self.last_seq is not None:
+                uri += f"&epoch={self.epoch}&last_seq={self.last_seq}"
         try:
-            # Connect to WebSocket server
-            self.websocket = await websockets.connect(uri)
+            # Connect to WebSocket server, offering binary encodings first
+            self.websocket = await websockets.connect(uri, subprotocols=wire_format.SUBPROTOCOLS)
+            self.encoding = wire_format.encoding_for_subprotocol(self.websocket.subprotocol)
             self.connected.emit()
             
             # Listen for messages
@@ -47,11 +60,11 @@ class WebSocketClient(QThread):
                     # Send any queued messages
                     while self.send_queue and self.websocket:
                         message = self.send_queue.pop(0)
-                        await self.websocket.send(json.dumps(message))
+                        await self.websocket.send(wire_format.encode(message, self.encoding))
                     
                     # Receive messages with timeout
                     message = await asyncio.wait_for(self.websocket.recv(), timeout=0.1)
-                    data = json.loads(message)
+                    data = wire_format.decode(message)
                     self.message_received.emit(data)
                 except asyncio.TimeoutError:
                     continue
@@ -77,6 +90,11 @@ class WebSocketClient(QThread):
         else:
             print("WebSocket not running, cannot send message")
     
+    def subscribe(self, server_id):
+        """Switch to the room of another Arma server"""
+        self.server_id = server_id
+        self.send_message({'type': 'subscribe', 'server_id': server_id})
+    
     def stop(self):
         self.running = False
 
@@ -91,6 +109,11 @@ class MainWindow(QMainWindow):
         self.username = username
         self.session_token = session_token
         self.ws_client = None
+        self.player_positions = {}
+        self.position_decoder = DeltaDecoder()
+        # Room sequence position, used to resume after refresh_connection
+        self.room_epoch = None
+        self.room_seq = None
         
         self.setWindowTitle(f"Arma Reforger - Live Map v{VERSION} [{username}]")
         self.setMinimumSize(1200, 800)
@@ -196,6 +219,7 @@ class MainWindow(QMainWindow):
         self.map_viewer = MapViewer(self.user_id)
         self.map_viewer.marker_added.connect(self.on_marker_added)
         self.map_viewer.marker_removed.connect(self.on_marker_removed)
+        self.map_viewer.viewport_changed.connect(self.on_viewport_changed)
         map_layout.addWidget(self.map_viewer)
         
         # Info bar
@@ -311,7 +335,8 @@ class MainWindow(QMainWindow):
     
     def setup_websocket(self):
         """Setup WebSocket connection"""
-        self.ws_client = WebSocketClient('localhost', self.server_manager.websocket_port)
+        self.ws_client = WebSocketClient('localhost', self.server_manager.websocket_port,
+                                         self.server_combo.currentData(), self.room_epoch, self.room_seq)
         self.ws_client.message_received.connect(self.on_websocket_message)
         self.ws_client.connected.connect(self.on_websocket_connected)
         self.ws_client.disconnected.connect(self.on_websocket_disconnected)
@@ -320,6 +345,9 @@ class MainWindow(QMainWindow):
     def on_websocket_connected(self):
         self.connection_status.setText("✓ Connected")
         self.connection_status.setStyleSheet("color: #5a7a51;")
+        # The hub forgets viewports on disconnect
+        if self.map_viewer.current_viewport is not None:
+            self.on_viewport_changed(self.map_viewer.current_viewport)
     
     def on_websocket_disconnected(self):
         self.connection_status.setText("❌ Disconnected")
@@ -327,35 +355,73 @@ class MainWindow(QMainWindow):
     
     def on_websocket_message(self, data):
         """Handle incoming WebSocket messages"""
+        # Viewport clients skip out-of-view events, so only whole-map clients can resume
+        if 'seq' in data and self.map_viewer.current_viewport is None:
+            self.room_epoch = data.get('epoch', self.room_epoch)
+            self.room_seq = data['seq']
+        
         if data['type'] == 'marker_added':
-            marker_data = data['marker']
-            from map.map_viewer import MapMarker
-            marker = MapMarker(
-                marker_data['id'],
-                marker_data['type'],
-                marker_data['x'],
-                marker_data['y'],
-                marker_data['user_id'],
-                marker_data.get('description', '')
-            )
-            self.map_viewer.add_marker_visual(marker)
+            self.add_marker_from_data(data['marker'])
         
         elif data['type'] == 'marker_removed':
-            self.map_viewer.remove_marker(data['marker_id'])
+            self.map_viewer.remove_marker_visual(data['marker_id'])
         
         elif data['type'] == 'markers_sync':
-            # Sync all markers when connecting
+            # Full marker snapshot when connecting (or when a resume was too old)
+            self.map_viewer.clear_all_markers()
             for marker_data in data['markers']:
-                from map.map_viewer import MapMarker
-                marker = MapMarker(
-                    marker_data['id'],
-                    marker_data['type'],
-                    marker_data['x'],
-                    marker_data['y'],
-                    marker_data['user_id'],
-                    marker_data.get('description', '')
-                )
-                self.map_viewer.add_marker_visual(marker)
+                self.add_marker_from_data(marker_data)
+        
+        elif data['type'] == 'aoi_update':
+            # Markers/players entering or leaving the visible area
+            if data['reset']:
+                self.map_viewer.clear_all_markers()
+                self.player_positions.clear()
+            for marker_id in data['leave']['markers']:
+                self.map_viewer.remove_marker_visual(marker_id)
+            for user_id in data['leave']['players']:
+                self.player_positions.pop(user_id, None)
+            for marker_data in data['enter']['markers']:
+                self.add_marker_from_data(marker_data)
+            for player in data['enter']['players']:
+                self.player_positions[player['user_id']] = player
+            self.player_count.setText(f"Players: {len(self.player_positions)}")
+        
+        elif data['type'] == 'resumed':
+            self.status_bar.showMessage(f"Reconnected, {data['replayed']} missed events replayed", 5000)
+        
+        elif data['type'] == 'server_info':
+            # Game server status from the hub's poller
+            info = data['info']
+            self.status_bar.showMessage(f"{info.get('name')} - {info.get('map')}, "
+                                        f"{info.get('player_count')}/{info.get('max_players')} players", 5000)
+        
+        elif data['type'] in ('positions_sync', 'positions_batch'):
+            # Full snapshot on join, then one coalesced batch per server tick
+            if data['type'] == 'positions_sync':
+                self.player_positions.clear()
+            for player in data['positions']:
+                self.player_positions[player['user_id']] = player
+            self.player_count.setText(f"Players: {len(self.player_positions)}")
+        
+        elif data['type'] in ('positions_keyframe', 'positions_delta'):
+            # Delta stream; out-of-sequence deltas are skipped until the next keyframe
+            if self.position_decoder.apply(data):
+                self.player_positions = self.position_decoder.positions()
+                self.player_count.setText(f"Players: {len(self.player_positions)}")
+    
+    def add_marker_from_data(self, marker_data):
+        """Show a marker received from the server"""
+        from map.map_viewer import MapMarker
+        marker = MapMarker(
+            marker_data['id'],
+            marker_data['type'],
+            marker_data['x'],
+            marker_data['y'],
+            marker_data['user_id'],
+            marker_data.get('description', '')
+        )
+        self.map_viewer.add_marker_visual(marker)
     
     def on_marker_added(self, marker):
         """Send marker to server"""
@@ -382,10 +448,31 @@ class MainWindow(QMainWindow):
             }
             self.ws_client.send_message(message)
     
+    def on_viewport_changed(self, area):
+        """Tell the server which part of the map is visible (None = whole map)"""
+        if area is not None:
+            self.room_epoch = None
+            self.room_seq = None
+        if self.ws_client:
+            self.ws_client.send_message({'type': 'viewport', 'rect': area})
+    
     def on_server_changed(self, index):
         """Handle server selection change"""
         if index >= 0:
             self.status_bar.showMessage(f"Connected to: {self.server_combo.currentText()}")
+            
+            # Only receive markers and positions for the selected server
+            server_id = self.server_combo.itemData(index)
+            if self.ws_client and server_id is not None and server_id != self.ws_client.server_id:
+                self.map_viewer.clear_all_markers()
+                self.player_positions.clear()
+                self.position_decoder = DeltaDecoder()
+                self.player_count.setText("Players: 0")
+                self.room_epoch = None
+                self.room_seq = None
+                self.ws_client.subscribe(server_id)
+                if self.map_viewer.current_viewport is not None:
+                    self.on_viewport_changed(self.map_viewer.current_viewport)
     
     def on_marker_type_changed(self, index):
         """Handle marker type change"""
@@ -6,6 +6,7 @@ from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QPixmap
 from gui.styles import DARK_THEME
 from core.auth import AuthManager
+from core.a2s import DEFAULT_QUERY_PORT
 
 
 class TOTPSetupDialog(QDialog):
@@ -183,6 +184,14 @@ class SettingsWindow(QDialog):
         port_input.setObjectName(f"port_{server['id']}")
         layout.addWidget(port_input)
         
+        # Port the server answers status queries (A2S) on; Reforger's default is 17777
+        query_port_input = QLineEdit(str(server.get('query_port', DEFAULT_QUERY_PORT)))
+        query_port_input.setPlaceholderText("Query Port")
+        query_port_input.setToolTip("Steam query (A2S) port, 17777 unless the server config changes it")
+        query_port_input.setMaximumWidth(100)
+        query_port_input.setObjectName(f"query_port_{server['id']}")
+        layout.addWidget(query_port_input)
+        
         widget.setLayout(layout)
         return widget
     
@@ -192,19 +201,25 @@ class SettingsWindow(QDialog):
             name_input = self.findChild(QLineEdit, f"name_{i}")
             ip_input = self.findChild(QLineEdit, f"ip_{i}")
             port_input = self.findChild(QLineEdit, f"port_{i}")
+            query_port_input = self.findChild(QLineEdit, f"query_port_{i}")
             
             if enabled_check and name_input and ip_input and port_input:
                 try:
                     port = int(port_input.text()) if port_input.text() else 0
                 except ValueError:
                     port = 0
+                try:
+                    query_port = int(query_port_input.text()) if query_port_input else DEFAULT_QUERY_PORT
+                except ValueError:
+                    query_port = DEFAULT_QUERY_PORT
                 
                 self.server_manager.update_server(
                     i,
                     name_input.text(),
                     ip_input.text(),
                     port,
-                    enabled_check.isChecked()
+                    enabled_check.isChecked(),
+                    query_port
                 )
         
         QMessageBox.information(self, "Success", "Server configuration saved!")
@@ -232,20 +247,11 @@ class SettingsWindow(QDialog):
                                     QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
             # Use database method for proper connection management
-            conn = None
-            try:
-                import sqlite3
-                conn = sqlite3.connect(self.db.db_path, timeout=10.0)
-                cursor = conn.cursor()
-                cursor.execute('UPDATE users SET totp_enabled = 0 WHERE id = ?', (self.user_id,))
-                conn.commit()
-                
-                QMessageBox.information(self, "Success", "QR Code authentication disabled")
-                self.accept()
-                # Reopen settings
-                new_settings = SettingsWindow(self.db, self.auth_manager, self.user_id,
-                                             self.username, self.server_manager, self.parent())
-                new_settings.exec()
-            finally:
-                if conn:
-                    conn.close()
+            self.db.disable_totp(self.user_id)
+            
+            QMessageBox.information(self, "Success", "QR Code authentication disabled")
+            self.accept()
+            # Reopen settings
+            new_settings = SettingsWindow(self.db, self.auth_manager, self.user_id,
+                                         self.username, self.server_manager, self.parent())
+            new_settings.exec()
@@ -8,8 +8,14 @@ from gui.login_window import LoginWindow
 from gui.main_window import MainWindow
 from core.database import Database
 from core.auth import AuthManager
+from core.auth_service import AuthService
 from core.server_manager import ServerManager
 from core.websocket_server import WebSocketServer
+from core.marker_store import MarkerStore
+from core.position_history import PositionHistory
+from core.async_database import AsyncDatabase
+from core.server_poller import ServerPoller
+from core.db_maintenance import DatabaseMaintenance
 
 # Version information
 VERSION = "0.099.021"
@@ -33,11 +39,23 @@ class ArmaMapApplication:
         config_path = os.path.join(self.app_path, 'config', 'servers.json')
         self.server_manager = ServerManager(config_path)
         
+        # Purges expired sessions, applies history retention and compacts the file
+        # in the background
+        self.db_maintenance = DatabaseMaintenance(self.db,
+                                                  history_retention=self.server_manager.get_history_retention)
+        self.db_maintenance.start()
+        
         # Get or create device ID
         self.device_id = self.get_or_create_device_id()
         
         # Start WebSocket server in background thread
-        self.ws_server = WebSocketServer('localhost', self.server_manager.websocket_port)
+        # Markers and position history share one database thread; the enabled
+        # game servers are polled on the hub's loop
+        hub_db = AsyncDatabase(self.db)
+        self.ws_server = WebSocketServer('localhost', self.server_manager.websocket_port,
+                                         marker_store=MarkerStore(hub_db),
+                                         position_history=PositionHistory(hub_db),
+                                         server_poller=ServerPoller(self.server_manager))
         self.ws_thread = threading.Thread(target=self.ws_server.run, daemon=True)
         self.ws_thread.start()
         
@@ -46,10 +64,13 @@ class ArmaMapApplication:
         self.app.setApplicationName(f"Arma Reforger Live Map v{VERSION}")
         self.app.setApplicationVersion(VERSION)
         
+        # Password hashing and account database work, off the GUI thread
+        self.auth_service = AuthService(self.db)
+        
         # Check for existing session
         self.main_window = None
         self.login_window = None
-        
+    
     def get_or_create_device_id(self):
         """Get or create unique device ID"""
         device_id_file = os.path.join(self.app_path, 'data', '.device_id')
@@ -74,16 +95,9 @@ class ArmaMapApplication:
                 
                 user_id = self.db.verify_session(session_token, self.device_id)
                 if user_id:
-                    # Get username
-                    import sqlite3
-                    conn = sqlite3.connect(self.db.db_path)
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,))
-                    result = cursor.fetchone()
-                    conn.close()
-                    
-                    if result:
-                        return user_id, result[0], session_token
+                    username = self.db.get_username(user_id)
+                    if username:
+                        return user_id, username, session_token
             except Exception as e:
                 print(f"Session check error: {e}")
         
@@ -122,7 +136,7 @@ class ArmaMapApplication:
             self.show_main_window(user_id, username, session_token)
         else:
             # Show login window
-            self.login_window = LoginWindow(self.db, self.device_id)
+            self.login_window = LoginWindow(self.db, self.device_id, self.auth_service)
             self.login_window.login_successful.connect(self.on_login_successful)
             self.login_window.show()
         
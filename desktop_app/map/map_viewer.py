@@ -1,5 +1,5 @@
 from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, QGraphicsTextItem, QGraphicsPolygonItem
-from PySide6.QtCore import Qt, QPointF, Signal
+from PySide6.QtCore import Qt, QPointF, Signal, QTimer
 from PySide6.QtGui import QColor, QPen, QBrush, QPixmap, QPainter, QPolygonF, QWheelEvent
 from datetime import datetime
 
@@ -33,9 +33,16 @@ ARMA_MARKER_TYPES = {
 }
 
 
+# Extra area around the visible rect included in the viewport sent to the hub
+# (fraction of the visible width/height on each side)
+VIEWPORT_MARGIN = 0.25
+
+
 class MapViewer(QGraphicsView):
     marker_added = Signal(object)
     marker_removed = Signal(str)
+    # [x, y, width, height] of the visible scene area plus margin, None when the whole map is visible
+    viewport_changed = Signal(object)
     
     def __init__(self, user_id, parent=None):
         super().__init__(parent)
@@ -46,6 +53,13 @@ class MapViewer(QGraphicsView):
         self.marker_mode = "enemy"
         self.zoom_level = 1.0
         self.marker_filters = {marker_type: True for marker_type in ARMA_MARKER_TYPES.keys()}
+        self.current_viewport = None
+        
+        # Coalesce scroll/zoom/resize bursts into one viewport update
+        self.viewport_timer = QTimer(self)
+        self.viewport_timer.setSingleShot(True)
+        self.viewport_timer.setInterval(200)
+        self.viewport_timer.timeout.connect(self.update_viewport)
         
         self.setRenderHint(QPainter.Antialiasing)
         self.setRenderHint(QPainter.SmoothPixmapTransform)
@@ -121,6 +135,7 @@ class MapViewer(QGraphicsView):
             self.zoom_level = 5.0
             factor = 1.0
         self.scale(factor, factor)
+        self.viewport_timer.start()
     
     def zoom_out(self):
         """Zoom out on the map"""
@@ -130,11 +145,38 @@ class MapViewer(QGraphicsView):
             self.zoom_level = 0.25
             factor = 1.0
         self.scale(factor, factor)
+        self.viewport_timer.start()
     
     def reset_zoom(self):
         """Reset zoom to 100%"""
         self.resetTransform()
         self.zoom_level = 1.0
+        self.viewport_timer.start()
+    
+    def visible_area(self):
+        """Visible scene rect plus margin as [x, y, width, height], or None if the whole map is in view"""
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        if visible.contains(self.sceneRect()):
+            return None
+        margin_x = visible.width() * VIEWPORT_MARGIN
+        margin_y = visible.height() * VIEWPORT_MARGIN
+        return [round(visible.x() - margin_x), round(visible.y() - margin_y),
+                round(visible.width() + 2 * margin_x), round(visible.height() + 2 * margin_y)]
+    
+    def update_viewport(self):
+        """Emit viewport_changed if the visible area changed"""
+        area = self.visible_area()
+        if area != self.current_viewport:
+            self.current_viewport = area
+            self.viewport_changed.emit(area)
+    
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        self.viewport_timer.start()
+    
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.viewport_timer.start()
     
     def wheelEvent(self, event: QWheelEvent):
         """Handle mouse wheel for zooming when Ctrl is pressed"""
@@ -288,11 +330,17 @@ class MapViewer(QGraphicsView):
     
     def remove_marker(self, marker_id):
         """Remove marker from map"""
-        if marker_id in self.markers:
-            self.scene.removeItem(self.markers[marker_id]['item'])
-            del self.markers[marker_id]
+        if self.remove_marker_visual(marker_id):
             self.marker_removed.emit(marker_id)
     
+    def remove_marker_visual(self, marker_id):
+        """Remove a marker's visual without notifying the server"""
+        if marker_id not in self.markers:
+            return False
+        self.scene.removeItem(self.markers[marker_id]['item'])
+        del self.markers[marker_id]
+        return True
+    
     def clear_all_markers(self):
         """Clear all markers"""
         for marker_data in list(self.markers.values()):
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Rotate the encryption key protecting security answers and TOTP secrets
+
+Safe to run while the app or hub is running: existing values stay readable
+during the rotation, and running processes pick up the new keyring from
+data/.key on their next encrypt/decrypt.
+
+Usage:
+  python rotate_key.py [--batch-size 100]
+"""
+
+import sys
+import os
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.database import Database
+from core.key_rotation import KeyRotation, DEFAULT_ROTATION_BATCH_SIZE
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rotate the Arma Reforger Live Map encryption key')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_ROTATION_BATCH_SIZE,
+                        help=f'Users re-encrypted per transaction (default: {DEFAULT_ROTATION_BATCH_SIZE})')
+    args = parser.parse_args()
+    
+    if args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    db = Database(os.path.dirname(os.path.abspath(__file__)))
+    stats = KeyRotation(db, batch_size=args.batch_size).run()
+    
+    print("=" * 60)
+    print(f"Re-encrypted {stats['rows_rotated']} users in {stats['batches']} batches ({stats['seconds']:.2f}s)")
+    if stats['unreadable']:
+        print(f"Left {stats['unreadable']} users that no key could decrypt unchanged")
+    print("Old keys retired" if stats['retired_old_keys'] else "Old keys kept: some rows are still under them")
+    print("=" * 60)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,7 +10,19 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from core.websocket_server import WebSocketServer
+from core.websocket_server import WebSocketServer, DEFAULT_TICK_RATE
+from core.delta_codec import DEFAULT_KEYFRAME_INTERVAL
+from core.hub_workers import run_workers, WORKERS_SUPPORTED
+from core.database import Database
+from core.marker_store import MarkerStore
+from core.position_history import PositionHistory
+from core.async_database import AsyncDatabase
+from core.db_maintenance import DatabaseMaintenance
+from core.server_manager import ServerManager
+from core.server_poller import ServerPoller
+from core.arma_server_connector import ArmaServerConnector
+from core import player_simulation
+from core.player_simulation import PlayerSimulation, MODES, RANDOM_WALK
 import argparse
 
 
@@ -18,18 +30,83 @@ def main():
     parser = argparse.ArgumentParser(description='Arma Reforger Live Map WebSocket Server')
     parser.add_argument('--host', default='0.0.0.0', help='Server host (default: 0.0.0.0)')
     parser.add_argument('--port', type=int, default=8765, help='Server port (default: 8765)')
+    parser.add_argument('--tick-rate', type=float, default=DEFAULT_TICK_RATE,
+                        help=f'Position broadcasts per second (default: {DEFAULT_TICK_RATE})')
+    parser.add_argument('--keyframe-interval', type=int, default=DEFAULT_KEYFRAME_INTERVAL,
+                        help=f'Ticks between delta-stream keyframes (default: {DEFAULT_KEYFRAME_INTERVAL})')
+    parser.add_argument('--no-compression', action='store_true',
+                        help='Disable permessage-deflate so broadcast frames are shared byte-for-byte')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Hub processes sharing the port via SO_REUSEPORT (default: 1, Linux only above 1)')
+    parser.add_argument('--no-persist', action='store_true',
+                        help='Keep markers in memory only and record no position history')
+    parser.add_argument('--no-poll', action='store_true',
+                        help='Do not poll the game servers in config/servers.json')
+    parser.add_argument('--simulate-players', type=int, default=0,
+                        help='Load test: simulate this many players on every enabled server (needs NumPy)')
+    parser.add_argument('--simulation-mode', choices=MODES, default=RANDOM_WALK,
+                        help=f'How simulated players move (default: {RANDOM_WALK})')
     args = parser.parse_args()
     
+    if args.tick_rate <= 0:
+        parser.error('--tick-rate must be greater than 0')
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.workers > 1 and not WORKERS_SUPPORTED:
+        parser.error('--workers above 1 needs SO_REUSEPORT (Linux)')
+    if args.simulate_players and (args.no_poll or args.workers > 1):
+        parser.error('--simulate-players needs polling in a single process (no --no-poll or --workers)')
+    if args.simulate_players and player_simulation.np is None:
+        parser.error('--simulate-players needs NumPy (pip install -r requirements-dev.txt)')
+    
     print("=" * 60)
     print("Arma Reforger Live Map - WebSocket Server")
     print("=" * 60)
     print(f"Starting server on {args.host}:{args.port}")
+    print(f"Position tick rate: {args.tick_rate} Hz")
+    if args.workers > 1:
+        print(f"Worker processes: {args.workers}")
+    if args.simulate_players:
+        print(f"Simulating {args.simulate_players} players per server ({args.simulation_mode})")
     print("Press Ctrl+C to stop the server")
     print("=" * 60)
     
+    options = {
+        'host': args.host,
+        'port': args.port,
+        'tick_rate': args.tick_rate,
+        'keyframe_interval': args.keyframe_interval,
+        'compression': None if args.no_compression else 'deflate'
+    }
+    
+    # Markers and position history persist to data/arma_map.db next to this script
+    script_path = os.path.dirname(os.path.abspath(__file__))
+    app_path = None if args.no_persist else script_path
+    config_path = os.path.join(script_path, 'config', 'servers.json')
+    server_manager = ServerManager(config_path)
+    if app_path:
+        # Session purge and history retention, as in the desktop app
+        DatabaseMaintenance(Database(app_path), history_retention=server_manager.get_history_retention).start()
+    
     try:
-        server = WebSocketServer(host=args.host, port=args.port)
-        server.run()
+        if args.workers > 1:
+            run_workers(args.workers, app_path=app_path, config_path=None if args.no_poll else config_path,
+                        **options)
+        else:
+            if app_path:
+                hub_db = AsyncDatabase(Database(app_path))
+                options['marker_store'] = MarkerStore(hub_db)
+                options['position_history'] = PositionHistory(hub_db)
+            if args.simulate_players:
+                def simulated_connector(ip, port):
+                    simulation = PlayerSimulation(args.simulate_players, mode=args.simulation_mode,
+                                                  first_id=port * 100000)
+                    return ArmaServerConnector(ip, port, simulation=simulation)
+                options['server_poller'] = ServerPoller(server_manager, connector_factory=simulated_connector)
+            elif not args.no_poll:
+                options['server_poller'] = ServerPoller(server_manager)
+            server = WebSocketServer(**options)
+            server.run()
     except KeyboardInterrupt:
         print("\n\nServer stopped by user")
     except Exception as e:
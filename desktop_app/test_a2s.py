@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Test the A2S server query client against the local mock responder
+"""
+
+import sys
+import time
+import asyncio
+
+print("Testing A2S server queries...")
+print("-" * 60)
+
+
+async def test_queries():
+    from core.a2s import A2SClient
+    from core.a2s_mock import MockA2SServer
+    
+    client = await A2SClient(timeout=0.5).open()
+    
+    # Challenge first, then the reply
+    server = MockA2SServer(name='Test Server', map_name='Arland', players=['Alpha', 'Bravo'])
+    host, port = await server.start()
+    info = await client.info(host, port)
+    assert info['name'] == 'Test Server' and info['map'] == 'Arland', info
+    assert info['player_count'] == 2 and info['max_players'] == 64 and info['port'] == 2001, info
+    assert client.challenges == 1 and server.requests == 2
+    print(f"✓ A2S_INFO answered after a challenge: {info['name']} on {info['map']}")
+    
+    players = await client.players(host, port)
+    assert [player['name'] for player in players] == ['Alpha', 'Bravo'], players
+    print("✓ A2S_PLAYER returned the player list")
+    
+    # A player list too big for one datagram arrives in fragments
+    server.players = [f"Player with a long name {i:03d}" for i in range(200)]
+    server.max_packet_size = 600
+    players = await client.players(host, port)
+    assert len(players) == 200 and players[199]['name'] == 'Player with a long name 199'
+    assert client.split_replies == 1
+    print(f"✓ Split reply of {len(server.player_reply())} bytes reassembled")
+    
+    # Many servers queried at once from the one socket
+    servers = [MockA2SServer(name=f'Server {i}', delay=0.1) for i in range(50)]
+    addresses = [await s.start() for s in servers]
+    start = time.perf_counter()
+    results = await client.query_many(addresses)
+    elapsed = time.perf_counter() - start
+    assert [result['name'] for result in results] == [f'Server {i}' for i in range(50)], results
+    # Two round trips each (challenge + reply) at 100 ms, overlapping
+    assert elapsed < 1.0, elapsed
+    print(f"✓ 50 servers with 100 ms replies queried concurrently in {elapsed * 1000:.0f} ms")
+    
+    # A silent server times out without holding up the others
+    silent = MockA2SServer()
+    silent_address = await silent.start()
+    silent.transport.pause_reading()
+    results = await client.query_many([silent_address, addresses[0]])
+    assert isinstance(results[0], asyncio.TimeoutError) and results[1]['name'] == 'Server 0', results
+    print("✓ Unanswered query timed out on its own")
+    
+    for s in servers + [server, silent]:
+        s.close()
+    client.close()
+
+
+async def test_connector():
+    from core.a2s import A2SClient
+    from core.a2s_mock import MockA2SServer
+    from core.arma_server_connector import ArmaServerConnector
+    
+    server = MockA2SServer(name='Reforger Test', players=['Alpha'])
+    host, port = await server.start()
+    connector = ArmaServerConnector(host, port)
+    assert await connector.connect() and connector.connected
+    info = await connector.get_server_info()
+    assert info['name'] == 'Reforger Test' and info['players'] == ['Alpha'], info
+    # A2S has no positions
+    assert await connector.get_player_positions() == []
+    print("✓ ArmaServerConnector reads server status over A2S")
+    
+    # Nothing listening: connect fails instead of pretending
+    server.close()
+    client = await A2SClient(timeout=0.2).open()
+    connector = ArmaServerConnector(host, port, client=client)
+    assert not await connector.connect()
+    client.close()
+    print("✓ Connecting to a server that does not answer fails")
+
+
+def test_query_server_info():
+    import os
+    import tempfile
+    import threading
+    from core.a2s_mock import MockA2SServer
+    from core.server_manager import ServerManager
+    
+    # Responder on its own loop, since query_server_info runs its own
+    loop = asyncio.new_event_loop()
+    server = MockA2SServer(name='Sync Test', players=['A', 'B', 'C'])
+    host, port = loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            manager = ServerManager(os.path.join(tmp, 'servers.json'))
+            info = manager.query_server_info(host, port)
+            assert info == {'status': 'online', 'name': 'Sync Test', 'map': 'Everon', 'players': 3,
+                            'max_players': 64}, info
+        print("✓ ServerManager.query_server_info queries the server")
+    finally:
+        loop.call_soon_threadsafe(server.close)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+try:
+    asyncio.run(test_queries())
+    asyncio.run(test_connector())
+    test_query_server_info()
+    
+    print("\n" + "=" * 60)
+    print("✓ ALL A2S TESTS PASSED!")
+    print("=" * 60)
+
+except Exception as e:
+    print(f"\n✗ Error: {e}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)
@@ -28,6 +28,18 @@ try:
     print(f"✓ Encrypted: {encrypted[:30]}...")
     print(f"✓ Decrypted: {decrypted}")
     
+    # Compact format; values in the first (double base64) format still decrypt
+    import base64
+    from core.encryption import CIPHERTEXT_PREFIX, upgrade_ciphertext
+    legacy = base64.b64encode(enc.cipher.encrypt(test_data.encode())).decode()
+    assert encrypted.startswith(CIPHERTEXT_PREFIX) and len(encrypted) < len(legacy) * 0.8
+    assert enc.decrypt(legacy) == test_data
+    assert enc.decrypt(upgrade_ciphertext(legacy)) == test_data
+    assert upgrade_ciphertext(encrypted) == encrypted and upgrade_ciphertext(None) is None
+    batch = enc.encrypt_many(["blue", "fluffy", ""])
+    assert enc.decrypt_many(batch + ["garbage"]) == ["blue", "fluffy", "", None]
+    print(f"✓ Compact ciphertext: {len(encrypted)} chars instead of {len(legacy)}")
+    
     # Test password hashing
     password = "TestPass123"
     hashed = enc.hash_password(password)
@@ -67,6 +79,106 @@ try:
     session_user_id = db.verify_session(session_token, device_id)
     print(f"✓ Session verified: {session_user_id == user_id}")
     
+    # Pooled connections: concurrent readers and a writer, no "database is locked"
+    import threading
+    journal_mode = db._connection().execute('PRAGMA journal_mode').fetchone()[0]
+    assert journal_mode == 'wal', f"Expected WAL journal, got {journal_mode}"
+    errors = []
+    
+    def hammer(write):
+        try:
+            for _ in range(200):
+                if write:
+                    db.create_session(user_id, "concurrent_device")
+                else:
+                    assert db.verify_session(session_token, device_id) == user_id
+        except Exception as e:
+            errors.append(e)
+    
+    threads = [threading.Thread(target=hammer, args=(i == 0,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+    assert db.get_username(user_id) == "test_user"
+    print(f"✓ WAL database shared by {len(threads)} threads without lock errors")
+    
+    # Session cache: repeat checks skip SQLite, revocation and expiry are honoured
+    from datetime import datetime, timedelta
+    from core.session_cache import SessionCache
+    hits = db.session_cache.stats()['hits']
+    assert db.verify_session(session_token, device_id) == user_id
+    assert db.verify_session(session_token, device_id) == user_id
+    assert db.session_cache.stats()['hits'] >= hits + 2
+    assert db.verify_session(session_token, "other_device") is None
+    revoked_token = db.create_session(user_id, device_id)
+    assert db.verify_session(revoked_token, device_id) == user_id
+    db.revoke_session(revoked_token)
+    assert db.verify_session(revoked_token, device_id) is None, "Revoked session still cached"
+    cache = SessionCache(ttl=60.0, max_size=2)
+    cache.put('expired', device_id, user_id, datetime.now() - timedelta(seconds=1))
+    assert cache.get('expired', device_id) is None, "Expired session served from cache"
+    for token in ('a', 'b', 'c'):
+        cache.put(token, device_id, user_id, datetime.now() + timedelta(days=1))
+    assert cache.get('a', device_id) is None and cache.get('c', device_id) == user_id
+    assert cache.stats()['evictions'] == 1
+    print(f"✓ Session cache: {db.session_cache.stats()}")
+    
+    # Maintenance purges expired sessions in batches and compacts the file
+    from core.db_maintenance import DatabaseMaintenance
+    expired_at = (datetime.now() - timedelta(hours=1)).isoformat()
+    with db._transaction() as cursor:
+        cursor.executemany('INSERT INTO sessions (user_id, device_id, token, expires_at) VALUES (?, ?, ?, ?)',
+                           [(user_id, "old_device", f"expired-{i}", expired_at) for i in range(1200)])
+    maintenance = DatabaseMaintenance(db, batch_size=500)
+    report = maintenance.run_once()
+    assert report['sessions_purged'] == 1200, report
+    assert db.auto_vacuum_mode() == 2, "Database not created with incremental auto_vacuum"
+    assert db.verify_session(session_token, device_id) == user_id, "Live session purged"
+    assert maintenance.run_once()['sessions_purged'] == 0
+    print(f"✓ Maintenance purged {report['sessions_purged']} expired sessions in {report['seconds']:.3f}s")
+    
+    # Schema migrations upgrade an existing (pre-migration) database in place
+    import sqlite3
+    import tempfile
+    from core.database import SCHEMA_VERSION
+    with tempfile.TemporaryDirectory() as legacy_path:
+        os.makedirs(os.path.join(legacy_path, 'data'))
+        conn = sqlite3.connect(os.path.join(legacy_path, 'data', 'arma_map.db'))
+        conn.execute('CREATE TABLE sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, '
+                     'device_id TEXT NOT NULL, token TEXT NOT NULL, expires_at TEXT NOT NULL)')
+        conn.execute('CREATE TABLE markers (id INTEGER PRIMARY KEY AUTOINCREMENT, server_id INTEGER NOT NULL, '
+                     'user_id INTEGER NOT NULL, marker_type TEXT NOT NULL, x REAL NOT NULL, y REAL NOT NULL, '
+                     'description TEXT, created_at TEXT NOT NULL)')
+        conn.execute("INSERT INTO sessions (user_id, device_id, token, expires_at) VALUES (7, 'dev', 'tok', '2999-01-01')")
+        conn.execute('CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, '
+                     'password_hash TEXT NOT NULL, security_q1 TEXT NOT NULL, security_a1 TEXT NOT NULL, '
+                     'security_q2 TEXT NOT NULL, security_a2 TEXT NOT NULL, totp_secret TEXT, '
+                     'totp_enabled INTEGER DEFAULT 0, created_at TEXT NOT NULL)')
+        legacy_enc = EncryptionManager(legacy_path)
+        legacy_a1, legacy_a2 = (base64.b64encode(legacy_enc.cipher.encrypt(answer)).decode()
+                                for answer in (b'blue', b'fluffy'))
+        conn.execute("INSERT INTO users (username, password_hash, security_q1, security_a1, security_q2, "
+                     "security_a2, created_at) VALUES ('old', 'x', 'q1', ?, 'q2', ?, '2024-01-01')",
+                     (legacy_a1, legacy_a2))
+        conn.commit()
+        conn.close()
+        
+        legacy_db = Database(legacy_path)
+        assert legacy_db.schema_version() == SCHEMA_VERSION
+        assert legacy_db.verify_session('tok', 'dev') == 7, "Existing rows survive migration"
+        assert legacy_db.auto_vacuum_mode() == 2, "Legacy database not switched to incremental auto_vacuum"
+        stored = legacy_db._connection().execute("SELECT security_a1 FROM users WHERE username = 'old'").fetchone()
+        assert stored[0].startswith(CIPHERTEXT_PREFIX), "Encrypted fields not converted"
+        assert legacy_db.verify_security_answers('old', 'Blue', 'fluffy')
+        plan = legacy_db._connection().execute('EXPLAIN QUERY PLAN SELECT user_id, expires_at FROM sessions '
+                                               'WHERE token = ? AND device_id = ?', ('tok', 'dev')).fetchall()
+        assert 'COVERING INDEX idx_sessions_token_device' in plan[0][3], plan
+        legacy_db.close()
+        assert Database(legacy_path).schema_version() == SCHEMA_VERSION
+        print(f"✓ Legacy database migrated in place to schema version {SCHEMA_VERSION}")
+    
     # Test TOTP (without QR generation)
     print("\nTesting TOTP...")
     import pyotp
@@ -85,6 +197,70 @@ try:
     print(f"✓ TOTP token verified: {verified}")
     print(f"✓ Current token: {current_token}")
     
+    # Key rotation runs online: logins and security answers keep working throughout.
+    # It rewrites the key file, so it runs on a scratch app directory
+    from core.key_rotation import KeyRotation
+    with tempfile.TemporaryDirectory() as rotation_path:
+        rotation_db = Database(rotation_path)
+        rotation_user_id = rotation_db.create_user("test_user", "test_password", "q1", "blue", "q2", "fluffy")
+        rotation_db.enable_totp(rotation_user_id, totp_secret)
+        for i in range(250):
+            rotation_db.create_user(f"rotation_user_{i}", "pw", "q1", f"answer-{i}", "q2", "second")
+        other_process = EncryptionManager(rotation_path)
+        old_key = rotation_db.encryption.key
+        stored_before = rotation_db._connection().execute(
+            "SELECT security_a1 FROM users WHERE username = 'rotation_user_7'").fetchone()[0]
+        rotation_errors = []
+        rotation = KeyRotation(rotation_db, batch_size=100)
+        rotation.start()
+        while rotation.thread.is_alive():
+            try:
+                assert rotation_db.verify_login("rotation_user_7", "pw")
+                assert rotation_db.verify_security_answers("rotation_user_7", "answer-7", "second")
+                assert rotation_db.get_totp_secret(rotation_user_id) == totp_secret
+            except AssertionError as e:
+                rotation_errors.append(e)
+        rotation.thread.join()
+        assert not rotation_errors, rotation_errors
+        rotation_stats = rotation.stats()
+        assert rotation_stats['retired_old_keys'] and rotation_stats['rows_rotated'] >= 251, rotation_stats
+        assert rotation_db.encryption.keys == [rotation_db.encryption.key] and rotation_db.encryption.key != old_key
+        assert other_process.decrypt(stored_before) is None, "Retired key still decrypts"
+        stored_after = rotation_db._connection().execute(
+            "SELECT security_a1 FROM users WHERE username = 'rotation_user_7'").fetchone()[0]
+        assert other_process.decrypt(stored_after) == "answer-7", "Other processes did not reload the keyring"
+        assert rotation_db.verify_security_answers("test_user", "blue", "fluffy")
+        rotation_db.close()
+    print(f"✓ Key rotated online: {rotation_stats}")
+    
+    # Auth service: hashing and SQLite on the pool, callbacks back on this thread
+    import time
+    from PySide6.QtCore import QCoreApplication
+    from core.auth_service import AuthService
+    qt_app = QCoreApplication.instance() or QCoreApplication([])
+    auth_service = AuthService(db)
+    results = {}
+    
+    def on_login(result):
+        results['login'] = result
+        results['thread'] = threading.current_thread()
+    
+    started = time.perf_counter()
+    auth_service.submit('slow', time.sleep, 0.2)
+    auth_service.login("test_user", "test_password", device_id, False, on_login)
+    auth_service.login("test_user", "wrong", device_id, False, lambda result: results.setdefault('bad', result))
+    assert time.perf_counter() - started < 0.1, "Submitting blocked the calling thread"
+    deadline = time.time() + 5
+    while len(results) < 3 and time.time() < deadline:
+        qt_app.processEvents()
+        time.sleep(0.01)
+    assert results['login'][0] == user_id and db.verify_session(results['login'][1], device_id) == user_id
+    assert results['bad'] is None
+    assert results['thread'] is threading.main_thread(), "Callback ran on a worker thread"
+    auth_stats = auth_service.stats()
+    assert auth_stats['login']['count'] == 2
+    print(f"✓ Auth service login latency: {auth_stats['login']}")
+    
     # Test server manager
     print("\nTesting Server Manager...")
     config_path = os.path.join(app_path, 'config', 'servers.json')
@@ -118,7 +294,7 @@ try:
     print("  Windows: build.bat")
     print("  Linux/Mac: ./build.sh")
     print("  Manual: pyinstaller --name ArmaReforgerMap --windowed main.py")
-    
+
 except Exception as e:
     print(f"\n✗ Error: {e}")
     import traceback
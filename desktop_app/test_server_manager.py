@@ -5,6 +5,7 @@ Test the new server manager features
 
 import sys
 import os
+import asyncio
 
 print("Testing Server Manager - Custom Server Feature...")
 print("-" * 60)
@@ -37,20 +38,45 @@ try:
     for server in enabled:
         print(f"  - {server['name']} ({server['ip']}:{server['port']})")
     
+    # Every server gets position history retention tiers; the default is not copied into the config
+    from core.history_retention import parse_retention
+    retention = server_mgr.get_history_retention(server_id1)
+    assert retention.raw_hours > 0 and retention.tiers, retention
+    assert 'history_retention' not in server_mgr.get_server_by_id(server_id1)
+    assert retention == parse_retention(None)
+    print(f"✓ History retention: raw {retention.raw_hours:g}h, tiers {retention.tiers}")
+    
+    # Status queries go to the A2S query port, not the game port
+    assert server_mgr.get_server_by_id(server_id1)['query_port'] == 17777
+    server_mgr.update_server(server_id2, "Custom Server 2", "198.51.100.22", 2303, True, query_port=27016)
+    assert server_mgr.get_server_by_id(server_id2)['query_port'] == 27016
+    print("✓ Servers get a query port (17777 unless set)")
+    
     # Test remove_server
     print(f"\nTesting remove_server({server_id1})...")
     removed = server_mgr.remove_server(server_id1)
     print(f"✓ Server removed: {removed}")
     print(f"  Total servers now: {len(server_mgr.servers)}")
     
-    # Test query_server_info (placeholder functionality)
-    print("\nTesting query_server_info()...")
-    info = server_mgr.query_server_info("198.51.100.22", 2303)
-    if info:
-        print(f"✓ Server query result:")
-        print(f"  Status: {info['status']}")
-        print(f"  Map: {info['map']}")
-        print(f"  Players: {info['players']}/{info['max_players']}")
+    # Test query_server_info_async against the local mock responder, on the caller's loop
+    print("\nTesting query_server_info_async()...")
+    from core.a2s_mock import MockA2SServer
+    
+    async def query_mock():
+        mock = MockA2SServer(name='Mock Server', players=['Alpha', 'Bravo'])
+        host, port = await mock.start()
+        try:
+            return await server_mgr.query_server_info_async(host, port)
+        finally:
+            mock.close()
+    
+    info = asyncio.run(query_mock())
+    assert info == {'status': 'online', 'name': 'Mock Server', 'map': 'Everon', 'players': 2,
+                    'max_players': 64}, info
+    print(f"✓ Server query result:")
+    print(f"  Status: {info['status']}")
+    print(f"  Map: {info['map']}")
+    print(f"  Players: {info['players']}/{info['max_players']}")
     
     # Clean up test file
     if os.path.exists(config_path):
@@ -60,7 +86,7 @@ try:
     print("\n" + "=" * 60)
     print("✓ ALL SERVER MANAGER TESTS PASSED!")
     print("=" * 60)
-    
+
 except Exception as e:
     print(f"\n✗ Error: {e}")
     import traceback
@@ -0,0 +1,1098 @@
+#!/usr/bin/env python3
+"""
+Test the WebSocket hub over real loopback connections
+"""
+
+import sys
+import json
+import time
+import asyncio
+import contextlib
+
+print("Testing WebSocket hub...")
+print("-" * 60)
+
+
+@contextlib.asynccontextmanager
+async def running_hub(hub):
+    server = await hub.listen()
+    try:
+        yield server.sockets[0].getsockname()[1]
+    finally:
+        await hub.stop()
+
+
+async def recv_json(ws, timeout=2.0):
+    return json.loads(await asyncio.wait_for(ws.recv(), timeout=timeout))
+
+
+async def expect_silence(ws, timeout=0.3):
+    try:
+        message = await asyncio.wait_for(ws.recv(), timeout=timeout)
+    except asyncio.TimeoutError:
+        return True
+    raise AssertionError(f"Unexpected message: {message}")
+
+
+def make_marker(user_id, timestamp, marker_type='enemy'):
+    return {
+        'type': marker_type,
+        'x': 100.0,
+        'y': 200.0,
+        'user_id': user_id,
+        'description': '',
+        'timestamp': timestamp
+    }
+
+
+async def test_rooms():
+    import websockets
+    from core.websocket_server import WebSocketServer
+    
+    hub = WebSocketServer('localhost', 0)
+    async with running_hub(hub) as port:
+        
+        # Two clients watching server 1, one watching server 2
+        a = await websockets.connect(f"ws://localhost:{port}/?server_id=1")
+        b = await websockets.connect(f"ws://localhost:{port}/?server_id=1")
+        c = await websockets.connect(f"ws://localhost:{port}/?server_id=2")
+        await asyncio.sleep(0.1)
+        assert len(hub.rooms[1].clients) == 2
+        assert len(hub.rooms[2].clients) == 1
+        print("✓ Clients joined rooms from the connection URI")
+        
+        await a.send(json.dumps({'type': 'marker_add', 'marker': make_marker(1, 't1')}))
+        added = await recv_json(b)
+        assert added['type'] == 'marker_added'
+        assert added['marker']['server_id'] == 1
+        await expect_silence(c)
+        assert '1_t1' in hub.rooms[1].markers and not hub.rooms[2].markers
+        print("✓ Marker only fanned out to its own room")
+        
+        # Switching rooms delivers the new room's snapshot
+        await c.send(json.dumps({'type': 'subscribe', 'server_id': 1}))
+        sync = await recv_json(c)
+        assert sync['type'] == 'markers_sync' and sync['markers'][0]['id'] == '1_t1'
+        assert (await recv_json(c))['type'] == 'subscribed'
+        assert 2 not in hub.rooms, "Idle room should be dropped"
+        print("✓ Subscribe moves client and sends room snapshot")
+        
+        # Clients without a server_id share the default room
+        d = await websockets.connect(f"ws://localhost:{port}")
+        await asyncio.sleep(0.1)
+        assert len(hub.rooms[0].clients) == 1
+        print("✓ Unaware clients land in the default room")
+        
+        for ws in (a, b, c, d):
+            await ws.close()
+        await asyncio.sleep(0.1)
+        assert not hub.clients
+        print("✓ Clients unregistered on disconnect")
+
+
+async def test_tick_batching():
+    import websockets
+    from core.websocket_server import WebSocketServer
+    
+    hub = WebSocketServer('localhost', 0, tick_rate=5)
+    async with running_hub(hub) as port:
+        
+        sender = await websockets.connect(f"ws://localhost:{port}/?server_id=1")
+        watcher = await websockets.connect(f"ws://localhost:{port}/?server_id=1")
+        other = await websockets.connect(f"ws://localhost:{port}/?server_id=2")
+        
+        # Many updates inside one tick collapse to the last one per user
+        for i in range(20):
+            for user_id in (1, 2):
+                await sender.send(json.dumps({
+                    'type': 'position_update',
+                    'player': {'user_id': user_id, 'username': f'P{user_id}', 'x': i, 'y': i, 'team': 'blue'}
+                }))
+        
+        latest = {}
+        batches = 0
+        while len(latest) < 2 or latest[1]['x'] != 19 or latest[2]['x'] != 19:
+            batch = await recv_json(watcher)
+            assert batch['type'] == 'positions_batch' and batch['server_id'] == 1
+            batches += 1
+            for player in batch['positions']:
+                latest[player['user_id']] = player
+        assert batches <= 3, f"Expected coalesced batches, got {batches}"
+        print(f"✓ 40 position updates delivered in {batches} positions_batch frame(s)")
+        
+        await expect_silence(other)
+        print("✓ Position batches stay inside their room")
+        
+        for ws in (sender, watcher, other):
+            await ws.close()
+
+
+def test_delta_codec():
+    import random
+    from core.delta_codec import DeltaEncoder, DeltaDecoder
+    
+    encoder = DeltaEncoder(keyframe_interval=25)
+    decoder = DeltaDecoder()
+    decoder.apply(encoder.keyframe(1))
+    
+    players = {
+        i: {'user_id': i, 'username': f'Player{i:03d}', 'team': 'blue' if i % 2 else 'red',
+            'x': random.uniform(0, 4000), 'y': random.uniform(0, 4000),
+            'timestamp': '2026-01-01T12:00:00.000000'}
+        for i in range(256)
+    }
+    full_bytes = delta_bytes = 0
+    for _ in range(60):
+        for player in players.values():
+            player['x'] += random.uniform(-3, 3)
+            player['y'] += random.uniform(-3, 3)
+        positions = list(players.values())
+        full_bytes += len(json.dumps({'type': 'positions_batch', 'server_id': 1, 'positions': positions}))
+        frame = json.dumps(encoder.encode(1, positions), separators=(',', ':'))
+        delta_bytes += len(frame)
+        assert decoder.apply(json.loads(frame))
+    
+    decoded = decoder.positions()
+    error = max(max(abs(decoded[i]['x'] - p['x']), abs(decoded[i]['y'] - p['y'])) for i, p in players.items())
+    assert error <= 0.05 + 1e-9, f"Quantization error too large: {error}"
+    print(f"✓ Delta stream reconstructs positions (max error {error:.3f})")
+    
+    ratio = full_bytes / delta_bytes
+    assert ratio >= 8, f"Delta stream only {ratio:.1f}x smaller"
+    print(f"✓ Delta stream is {ratio:.1f}x smaller than positions_batch for 256 players")
+    
+    # A gap in the tick sequence is detected and waits for a keyframe
+    for _ in range(2):
+        for player in positions:
+            player['x'] += 1
+        frame = encoder.encode(1, positions)
+    assert frame['type'] == 'positions_delta' and not decoder.apply(frame)
+    decoder.apply(encoder.keyframe(1))
+    assert decoder.tick == encoder.tick
+    print("✓ Out-of-sequence delta rejected until the next keyframe")
+    
+    # Coordinates that are not finite numbers quantize to 0 instead of raising
+    from core.delta_codec import quantize
+    assert quantize(float('inf')) == quantize(float('nan')) == quantize(None) == 0
+    frame = encoder.encode(1, [{'user_id': 999, 'username': 'Bad', 'x': float('inf'), 'y': float('-inf')}])
+    assert frame is not None
+    print("✓ Non-finite coordinates do not break the delta encoder")
+    
+    # An idle tick sends nothing and leaves the tick sequence unbroken
+    encoder = DeltaEncoder(keyframe_interval=25)
+    decoder = DeltaDecoder()
+    positions = [{'user_id': 1, 'username': 'Alpha', 'team': 'blue', 'x': 100.0, 'y': 100.0}]
+    encoder.encode(1, positions)
+    decoder.apply(encoder.keyframe(1))
+    assert encoder.encode(1, positions) is None
+    for step in (1, 2):
+        positions[0]['x'] += 5
+        frame = encoder.encode(1, positions)
+        assert frame['type'] == 'positions_delta' and decoder.apply(frame), f"Move {step} rejected"
+    assert decoder.positions()[1]['x'] == 110.0
+    print("✓ Deltas after an idle tick still apply")
+
+
+async def test_delta_clients():
+    import websockets
+    from core.websocket_server import WebSocketServer
+    from core.delta_codec import DeltaDecoder
+    
+    hub = WebSocketServer('localhost', 0, tick_rate=20, keyframe_interval=1000)
+    async with running_hub(hub) as port:
+        
+        sender = await websockets.connect(f"ws://localhost:{port}/?server_id=3")
+        for user_id in range(1, 4):
+            await sender.send(json.dumps({
+                'type': 'position_update',
+                'player': {'user_id': user_id, 'username': f'P{user_id}', 'x': 10.0 * user_id, 'y': 5.0, 'team': 'blue'}
+            }))
+        await asyncio.sleep(0.2)
+        
+        # Joining delta client gets a keyframe with everyone already in the room
+        watcher = await websockets.connect(f"ws://localhost:{port}/?server_id=3&positions=delta")
+        decoder = DeltaDecoder()
+        keyframe = await recv_json(watcher)
+        assert keyframe['type'] == 'positions_keyframe' and len(keyframe['players']) == 3
+        decoder.apply(keyframe)
+        print("✓ Delta client receives keyframe on join")
+        
+        await sender.send(json.dumps({
+            'type': 'position_update',
+            'player': {'user_id': 2, 'username': 'P2', 'x': 21.5, 'y': 6.3, 'team': 'blue'}
+        }))
+        delta = await recv_json(watcher)
+        assert delta['type'] == 'positions_delta' and delta['d'] == [1, 15, 13]
+        assert decoder.apply(delta)
+        assert decoder.positions()[2]['x'] == 21.5
+        print("✓ Only the moved player is sent as a quantized delta")
+        
+        for ws in (sender, watcher):
+            await ws.close()
+
+
+async def test_binary_encoding():
+    import websockets
+    from core.websocket_server import WebSocketServer
+    from core import wire_format
+    
+    if wire_format.msgpack is None:
+        print("- msgpack not installed, skipping binary encoding test")
+        return
+    
+    hub = WebSocketServer('localhost', 0)
+    async with running_hub(hub) as port:
+        binary = await websockets.connect(f"ws://localhost:{port}/?server_id=4",
+                                          subprotocols=wire_format.SUBPROTOCOLS)
+        legacy = await websockets.connect(f"ws://localhost:{port}/?server_id=4")
+        assert binary.subprotocol == 'arma-livemap.msgpack'
+        assert legacy.subprotocol is None
+        print("✓ msgpack negotiated via subprotocol, unaware client stays on JSON")
+        
+        await legacy.send(json.dumps({'type': 'marker_add', 'marker': make_marker(7, 't7')}))
+        frame = await asyncio.wait_for(binary.recv(), timeout=2.0)
+        assert isinstance(frame, bytes)
+        assert wire_format.decode(frame)['marker']['id'] == '7_t7'
+        
+        await binary.send(wire_format.encode({'type': 'marker_remove', 'marker_id': '7_t7'}, wire_format.MSGPACK))
+        frame = await asyncio.wait_for(legacy.recv(), timeout=2.0)
+        assert isinstance(frame, str) and json.loads(frame)['type'] == 'marker_removed'
+        print("✓ Binary and JSON clients interoperate in the same room")
+        
+        for ws in (binary, legacy):
+            await ws.close()
+
+
+class FakeSocket:
+    """Stand-in websocket whose send() can be stalled"""
+    
+    def __init__(self):
+        self.sent = []
+        self.released = asyncio.Event()
+        self.released.set()
+        self.close_code = None
+        self.subprotocol = None
+    
+    async def send(self, frame):
+        await self.released.wait()
+        self.sent.append(frame)
+    
+    async def close(self, code=1000, reason=''):
+        self.close_code = code
+
+
+async def test_backpressure():
+    from core.client_connection import ClientConnection
+    from core.websocket_server import WebSocketServer
+    
+    stalled = FakeSocket()
+    stalled.released.clear()
+    client = ClientConnection(stalled, high_water=5, max_queue=50, lag_timeout=0.1)
+    client.start()
+    await asyncio.sleep(0)
+    
+    for i in range(4):
+        client.enqueue(f"event{i}")
+    client.enqueue_positions("tick1")
+    client.enqueue_positions("tick2")
+    assert client.needs_resync and client.frames_dropped == 1
+    client.enqueue_positions("tick3")
+    client.enqueue_positions("snapshot", snapshot=True)
+    assert not client.needs_resync
+    print(f"✓ Stale position frames dropped on a lagging client (queue depth {client.queue_depth})")
+    
+    stalled.released.set()
+    await asyncio.sleep(0.05)
+    assert stalled.sent[0] == "event0", "The blocked send completes first"
+    assert stalled.sent[1:] == ["event1", "event2", "event3", "snapshot"], stalled.sent
+    print("✓ Marker events kept in order, lagging client resynced with a snapshot")
+    
+    stalled.released.clear()
+    for i in range(8):
+        client.enqueue(f"burst{i}")
+    assert not client.closed
+    client.check_backlog(now=client.over_high_water_since + 0.2)
+    await asyncio.sleep(0)
+    assert client.closed and stalled.close_code == 1013
+    print("✓ Client above the high-water mark for too long is disconnected")
+    
+    # One stalled client must not hold up the rest of its room
+    hub = WebSocketServer('localhost', 0)
+    slow, fast = FakeSocket(), FakeSocket()
+    slow.released.clear()
+    slow_client = await hub.register(slow, server_id=5)
+    await hub.register(fast, server_id=5)
+    for i in range(10):
+        hub.broadcast(hub.rooms[5], {'type': 'marker_removed', 'marker_id': str(i)})
+    await asyncio.sleep(0.05)
+    assert len(fast.sent) == 10
+    metrics = hub.get_metrics()
+    assert metrics['max_queue_depth'] == slow_client.queue_depth == 9
+    print(f"✓ Fast client unaffected by stalled peer; metrics report queue depth {metrics['max_queue_depth']}")
+    for ws in (slow, fast):
+        await hub.unregister(ws)
+
+
+async def test_snapshot_cache():
+    from core import wire_format
+    from core.websocket_server import WebSocketServer
+    
+    hub = WebSocketServer('localhost', 0)
+    room = hub.get_room(3)
+    for i in range(20):
+        room.add_marker({**make_marker(i, f"t{i}"), 'id': f"{i}_t{i}"})
+        room.update_position(i, {'user_id': i, 'username': f'P{i}', 'x': i, 'y': i, 'team': 'blue'})
+    
+    calls = []
+    original = wire_format.encode
+    wire_format.encode = lambda message, encoding=wire_format.JSON: (calls.append(message['type']),
+                                                                      original(message, encoding))[1]
+    try:
+        sockets = [FakeSocket() for _ in range(50)]
+        for ws in sockets:
+            await hub.register(ws, server_id=3)
+        await asyncio.sleep(0.05)
+    finally:
+        wire_format.encode = original
+    assert calls.count('markers_sync') == 1, calls.count('markers_sync')
+    assert calls.count('positions_sync') == 1, calls.count('positions_sync')
+    assert all(ws.sent[0] is sockets[0].sent[0] for ws in sockets), "Joiners share one encoded frame"
+    print(f"✓ {len(sockets)} joiners served from one cached markers_sync and positions_sync encode")
+    
+    room.remove_marker("0_t0")
+    extra = FakeSocket()
+    await hub.register(extra, server_id=3)
+    await asyncio.sleep(0.05)
+    assert len(wire_format.decode(extra.sent[0])['markers']) == 19
+    print("✓ Marker change invalidates the cached snapshot")
+    for ws in sockets + [extra]:
+        await hub.unregister(ws)
+
+
+async def check_shared_room(hub1, port1, hub2, port2):
+    import websockets
+    
+    a = await websockets.connect(f"ws://localhost:{port1}/?server_id=4")
+    b = await websockets.connect(f"ws://localhost:{port2}/?server_id=4")
+    await asyncio.sleep(0.1)
+    assert len(hub1.rooms[4].clients) == 1 and len(hub2.rooms[4].clients) == 1
+    
+    await a.send(json.dumps({'type': 'marker_add', 'marker': make_marker(7, 't1')}))
+    message = await recv_json(b)
+    assert message['type'] == 'marker_added' and message['marker']['id'] == '7_t1'
+    await expect_silence(a)
+    assert '7_t1' in hub1.rooms[4].markers and '7_t1' in hub2.rooms[4].markers
+    
+    await b.send(json.dumps({'type': 'position_update',
+                             'player': {'user_id': 9, 'username': 'B', 'x': 1.0, 'y': 2.0, 'team': 'red'}}))
+    message = await recv_json(a)
+    assert message['type'] == 'positions_batch' and message['positions'][0]['user_id'] == 9
+    assert hub1.rooms[4].player_positions == hub2.rooms[4].player_positions
+    
+    # A late joiner sees the same room no matter which worker it lands on
+    c = await websockets.connect(f"ws://localhost:{port1}/?server_id=4")
+    message = await recv_json(c)
+    assert message['type'] == 'markers_sync' and len(message['markers']) == 1
+    for ws in (a, b, c):
+        await ws.close()
+
+
+async def test_shared_bus():
+    from core.hub_bus import InProcessBus
+    from core.websocket_server import WebSocketServer
+    
+    bus = InProcessBus()
+    hub1 = WebSocketServer('localhost', 0, bus=bus)
+    hub2 = WebSocketServer('localhost', 0, bus=bus)
+    async with running_hub(hub1) as port1, running_hub(hub2) as port2:
+        await check_shared_room(hub1, port1, hub2, port2)
+    print("✓ Two hubs on an in-process bus share markers and positions")
+
+
+async def test_unix_socket_bus():
+    import os
+    import tempfile
+    from core.hub_bus import BusBroker, UnixSocketBus
+    from core.hub_workers import WORKERS_SUPPORTED
+    from core.websocket_server import WebSocketServer
+    
+    if not WORKERS_SUPPORTED:
+        print("- Skipping Unix socket bus test (needs SO_REUSEPORT)")
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        broker = BusBroker(os.path.join(tmp, 'bus.sock'))
+        await broker.start()
+        buses = [UnixSocketBus(broker.path), UnixSocketBus(broker.path)]
+        for bus in buses:
+            await bus.connect()
+        hub1 = WebSocketServer('localhost', 0, bus=buses[0], reuse_port=True)
+        hub2 = WebSocketServer('localhost', 0, bus=buses[1], reuse_port=True)
+        async with running_hub(hub1) as port1, running_hub(hub2) as port2:
+            await check_shared_room(hub1, port1, hub2, port2)
+            assert broker.frames_relayed >= 2
+            print(f"✓ Two hubs on a Unix socket broker share room state ({broker.frames_relayed} frames relayed)")
+            
+            # A third worker can bind the first one's port
+            hub3 = WebSocketServer('localhost', port1, bus=buses[0], reuse_port=True)
+            async with running_hub(hub3) as port3:
+                assert port3 == port1
+            print("✓ SO_REUSEPORT lets several workers listen on one port")
+        for bus in buses:
+            await bus.close()
+        await broker.stop()
+
+
+async def test_resume():
+    import websockets
+    from core.websocket_server import WebSocketServer
+    
+    hub = WebSocketServer('localhost', 0, history_size=4)
+    async with running_hub(hub) as port:
+        writer = await websockets.connect(f"ws://localhost:{port}/?server_id=6")
+        reader = await websockets.connect(f"ws://localhost:{port}/?server_id=6")
+        await writer.send(json.dumps({'type': 'marker_add', 'marker': make_marker(1, 't1')}))
+        first = await recv_json(reader)
+        assert first['seq'] == 1 and first['epoch'] == hub.epoch
+        await reader.close()
+        
+        # Two events happen while the reader is away
+        await writer.send(json.dumps({'type': 'marker_add', 'marker': make_marker(1, 't2')}))
+        await writer.send(json.dumps({'type': 'chat_message', 'username': 'w', 'message': 'hi'}))
+        await asyncio.sleep(0.1)
+        
+        reader = await websockets.connect(
+            f"ws://localhost:{port}/?server_id=6&epoch={hub.epoch}&last_seq={first['seq']}")
+        resumed = await recv_json(reader)
+        assert resumed['type'] == 'resumed' and resumed['replayed'] == 2 and resumed['seq'] == 3
+        replay = [await recv_json(reader), await recv_json(reader)]
+        assert [m['seq'] for m in replay] == [2, 3]
+        assert replay[0]['type'] == 'marker_added' and replay[1]['type'] == 'chat_message'
+        await expect_silence(reader)
+        print("✓ Reconnecting client gets only the events it missed, no markers_sync")
+        await reader.close()
+        
+        # Gap larger than the ring buffer falls back to a full snapshot
+        for i in range(5):
+            await writer.send(json.dumps({'type': 'chat_message', 'username': 'w', 'message': str(i)}))
+        await asyncio.sleep(0.1)
+        reader = await websockets.connect(
+            f"ws://localhost:{port}/?server_id=6&epoch={hub.epoch}&last_seq=3")
+        sync = await recv_json(reader)
+        assert sync['type'] == 'markers_sync' and len(sync['markers']) == 2 and sync['seq'] == 8
+        print("✓ Gap beyond the ring buffer falls back to markers_sync")
+        
+        # A seq from another hub run is never trusted
+        stale = await websockets.connect(f"ws://localhost:{port}/?server_id=6&epoch=old&last_seq=8")
+        assert (await recv_json(stale))['type'] == 'markers_sync'
+        print("✓ Sequence numbers from another epoch get a full snapshot")
+        assert hub.get_metrics()['resumed_sessions'] == 1
+        for ws in (writer, reader, stale):
+            await ws.close()
+
+
+def test_spatial_grid():
+    from core.spatial_grid import SpatialGrid
+    
+    grid = SpatialGrid(100)
+    assert grid.cell_of(250, 99) == (2, 0)
+    cells = grid.cells_in_rect(0, 0, 150, 150)
+    assert cells == {(0, 0), (0, 1), (1, 0), (1, 1)}
+    assert grid.move('a', 10, 10) == (None, (0, 0))
+    assert grid.move('a', 20, 20) == ((0, 0), (0, 0))
+    grid.move('b', 550, 550)
+    assert grid.query(cells) == ['a']
+    assert grid.move('a', 120, 10) == ((0, 0), (1, 0))
+    assert grid.remove('a') == (1, 0) and not grid.query(cells)
+    assert grid.cells_in_rect(0, 0, 1e6, 1e6) is None, "Huge viewports mean the whole map"
+    print("✓ Spatial grid files, moves and queries entities by cell")
+
+
+async def test_viewport():
+    import websockets
+    from core.websocket_server import WebSocketServer
+    
+    def player(user_id, x, y):
+        return {'type': 'position_update',
+                'player': {'user_id': user_id, 'username': f'P{user_id}', 'x': x, 'y': y, 'team': 'blue'}}
+    
+    hub = WebSocketServer('localhost', 0, tick_rate=20, cell_size=100)
+    async with running_hub(hub) as port:
+        sender = await websockets.connect(f"ws://localhost:{port}/?server_id=8")
+        zoomed = await websockets.connect(f"ws://localhost:{port}/?server_id=8")
+        await sender.send(json.dumps({'type': 'marker_add', 'marker': {**make_marker(1, 'near'), 'x': 50, 'y': 50}}))
+        await sender.send(json.dumps({'type': 'marker_add', 'marker': {**make_marker(1, 'far'), 'x': 900, 'y': 900}}))
+        await sender.send(json.dumps(player(1, 20, 20)))
+        await sender.send(json.dumps(player(2, 800, 800)))
+        for _ in range(2):
+            assert (await recv_json(zoomed))['type'] == 'marker_added'
+        assert len((await recv_json(zoomed))['positions']) == 2
+        
+        await zoomed.send(json.dumps({'type': 'viewport', 'rect': [0, 0, 150, 150]}))
+        reset = await recv_json(zoomed)
+        assert reset['type'] == 'aoi_update' and reset['reset']
+        assert [m['id'] for m in reset['enter']['markers']] == ['1_near']
+        assert [p['user_id'] for p in reset['enter']['players']] == [1]
+        print("✓ Viewport resets the client to the markers and players in view")
+        
+        # Movement outside the view is not sent; movement inside is
+        await sender.send(json.dumps(player(2, 810, 810)))
+        await expect_silence(zoomed)
+        await sender.send(json.dumps(player(1, 30, 30)))
+        batch = await recv_json(zoomed)
+        assert batch['type'] == 'positions_batch' and [p['user_id'] for p in batch['positions']] == [1]
+        await sender.send(json.dumps({'type': 'marker_add', 'marker': {**make_marker(1, 'far2'), 'x': 950, 'y': 50}}))
+        await expect_silence(zoomed)
+        print("✓ Out-of-view moves and markers are filtered")
+        
+        # Crossing the boundary produces leave/enter events
+        await sender.send(json.dumps(player(1, 500, 500)))
+        left = await recv_json(zoomed)
+        assert left['type'] == 'aoi_update' and left['leave']['players'] == [1]
+        await sender.send(json.dumps(player(2, 120, 120)))
+        entered = await recv_json(zoomed)
+        assert entered['type'] == 'aoi_update' and entered['enter']['players'][0]['user_id'] == 2
+        print("✓ Players crossing the viewport edge produce leave/enter events")
+        
+        # Panning sends only the difference
+        await zoomed.send(json.dumps({'type': 'viewport', 'rect': [850, 850, 100, 100]}))
+        pan = await recv_json(zoomed)
+        assert not pan['reset'] and pan['enter']['markers'][0]['id'] == '1_far'
+        assert pan['leave']['markers'] == ['1_near'] and pan['leave']['players'] == [2]
+        print("✓ Panning sends enter/leave for the cells that changed")
+        
+        await zoomed.send(json.dumps({'type': 'viewport', 'rect': None}))
+        sync = await recv_json(zoomed)
+        assert sync['type'] == 'markers_sync' and len(sync['markers']) == 3
+        assert (await recv_json(zoomed))['type'] == 'positions_sync'
+        print("✓ Clearing the viewport restores the whole-map snapshot")
+        for ws in (sender, zoomed):
+            await ws.close()
+
+
+async def test_marker_persistence():
+    import tempfile
+    import websockets
+    from core.database import Database
+    from core.marker_store import MarkerStore
+    from core.websocket_server import WebSocketServer
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(tmp)
+        store = MarkerStore(db, flush_interval=0.05)
+        hub = WebSocketServer('localhost', 0, marker_store=store)
+        async with running_hub(hub) as port:
+            ws = await websockets.connect(f"ws://localhost:{port}/?server_id=3")
+            for i in range(5):
+                await ws.send(json.dumps({'type': 'marker_add', 'marker': make_marker(1, f"t{i}")}))
+            await ws.send(json.dumps({'type': 'marker_remove', 'marker_id': '1_t0'}))
+            await asyncio.sleep(0.2)
+            assert store.flushes >= 1 and not store.pending
+            assert len(db.load_markers()[3]) == 4
+            print(f"✓ Marker changes written behind in {store.flushes} transaction(s)")
+            
+            # A marker without coordinates is refused before it reaches the room or the store
+            bad = make_marker(1, 'bad')
+            bad['x'] = None
+            await ws.send(json.dumps({'type': 'marker_add', 'marker': bad}))
+            await ws.send(json.dumps({'type': 'marker_add', 'marker': make_marker(1, 't5')}))
+            await asyncio.sleep(0.2)
+            assert '1_bad' not in hub.rooms[3].markers and len(db.load_markers()[3]) == 5
+            await ws.send(json.dumps({'type': 'marker_remove', 'marker_id': '1_t5'}))
+            
+            # A bad row that does get queued is dropped without holding up the others
+            store.marker_added({'id': '2_bad', 'server_id': 3, 'user_id': 2, 'type': 'enemy', 'x': None, 'y': 1.0})
+            store.marker_added({'id': '2_good', 'server_id': 3, 'user_id': 2, 'type': 'enemy', 'x': 1.0, 'y': 1.0})
+            await asyncio.sleep(0.2)
+            assert store.dropped_changes == 1 and not store.pending
+            ids = [m['id'] for m in db.load_markers()[3]]
+            assert '2_good' in ids and '2_bad' not in ids
+            store.marker_removed('2_good')
+            await asyncio.sleep(0.2)
+            print("✓ Invalid markers rejected; a bad queued row is dropped alone")
+            
+            # Changes still pending at shutdown are flushed by stop()
+            store.flush_task.cancel()
+            store.flush_task = None
+            await ws.send(json.dumps({'type': 'marker_remove', 'marker_id': '1_t1'}))
+            await asyncio.sleep(0.1)
+            assert store.pending
+            await ws.close()
+        assert [m['id'] for m in db.load_markers()[3]] == ['1_t2', '1_t3', '1_t4']
+        print("✓ Pending marker changes flushed on shutdown")
+        
+        # A fresh hub warms its rooms from the table
+        hub = WebSocketServer('localhost', 0, marker_store=MarkerStore(Database(tmp)))
+        async with running_hub(hub) as port:
+            ws = await websockets.connect(f"ws://localhost:{port}/?server_id=3")
+            sync = await recv_json(ws)
+            assert sync['type'] == 'markers_sync' and len(sync['markers']) == 3
+            assert sync['markers'][0]['server_id'] == 3 and sync['markers'][0]['type'] == 'enemy'
+            await ws.close()
+        print("✓ Restarted hub serves persisted markers")
+
+
+async def test_async_database():
+    import tempfile
+    from core.database import Database
+    from core.async_database import AsyncDatabase
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(tmp)
+        user_id = db.create_user('async_user', 'pw', 'q1', 'a1', 'q2', 'a2')
+        adb = AsyncDatabase(db)
+        
+        # Concurrent writes are grouped into a few transactions
+        tokens = await asyncio.gather(*[adb.create_session(user_id, f"device-{i}") for i in range(100)])
+        assert len(set(tokens)) == 100
+        stats = adb.stats()
+        assert stats['writes'] == 100 and stats['write_batches'] < 100, stats
+        assert await adb.verify_session(tokens[0], 'device-0') == user_id
+        assert await adb.verify_session(tokens[0], 'device-1') is None
+        print(f"✓ 100 concurrent session writes committed in {stats['write_batches']} transaction(s)")
+        
+        # A failing write is reported to its caller without undoing the rest of its batch
+        def failing_write():
+            with db._transaction() as cursor:
+                cursor.execute("INSERT INTO sessions (user_id, device_id, token, expires_at) "
+                               "VALUES (?, 'doomed', 'doomed', '2999-01-01')", (user_id,))
+                raise ValueError("boom")
+        results = await asyncio.gather(adb.create_session(user_id, 'before'), adb.run(failing_write, write=True),
+                                       adb.create_session(user_id, 'after'), return_exceptions=True)
+        assert isinstance(results[1], ValueError)
+        assert db.verify_session(results[0], 'before') == user_id
+        assert db.verify_session(results[2], 'after') == user_id
+        assert db.verify_session('doomed', 'doomed') is None
+        print("✓ Failed write rolled back alone, its batch committed")
+        
+        # The event loop keeps running while the database thread is busy
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+        
+        tick_task = asyncio.create_task(ticker())
+        await adb.run(time.sleep, 0.2)
+        tick_task.cancel()
+        assert ticks >= 10, ticks
+        print(f"✓ Event loop ticked {ticks} times during a 200ms database call")
+        await adb.aclose()
+        db.close()
+
+
+async def test_position_history():
+    import tempfile
+    import websockets
+    from core.database import Database
+    from core.position_history import PositionHistory
+    from core.websocket_server import WebSocketServer
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(tmp)
+        history = PositionHistory(db, segment_seconds=10)
+        players = [{'user_id': i, 'x': 100.04 + i, 'y': 2000.26} for i in range(64)]
+        # 10 Hz for 3 seconds straddling a segment boundary (t=1000..1003)
+        for tick in range(30):
+            history.record(2, players, t=998.5 + tick / 10)
+        await history.flush()
+        assert db.history_segments() == [990, 1000]
+        rows = db.load_position_history(2, 998.5, 1001.5, user_id=5)
+        assert len(rows) == 30 and rows[0]['t'] == 998.5
+        assert rows[0]['x'] == 105.0 and rows[0]['y'] == 2000.3, rows[0]
+        assert len(db.load_position_history(2, 1000, 1001)) == 640
+        assert db.load_position_history(3, 0, 2000) == []
+        print(f"✓ {history.rows_written} history rows recorded into {len(db.history_segments())} segments")
+        await history.stop()
+        
+        # Retention: raw rows roll up into 1 s then 10 s averages, then expire
+        from core.history_retention import parse_retention, compact_history
+        policy = parse_retention({'raw_hours': 1, 'tiers': [{'interval': 1, 'hours': 2}, {'interval': 10, 'hours': 3}]})
+        stats = compact_history(db, lambda server_id: policy, now=1010 + 3600, segment_seconds=10)
+        assert stats['raw_rows_removed'] == 64 * 30 and stats['segments_dropped'] == 2, stats
+        assert db.history_segments() == [] and db.rollup_intervals() == [1]
+        rows = db.load_position_history(2, 0, 2000, user_id=5, interval=1)
+        assert [row['t'] for row in rows] == [998, 999, 1000, 1001] and rows[0]['x'] == 105.0
+        stats = compact_history(db, lambda server_id: policy, now=1020 + 2 * 3600, segment_seconds=10)
+        assert stats['rollup_rows_removed'] == 64 * 4 and stats['rollup_rows_written'] == 64 * 2, stats
+        assert [row['t'] for row in db.load_position_history(2, 0, 2000, user_id=5, interval=10)] == [990, 1000]
+        compact_history(db, lambda server_id: policy, now=1020 + 3 * 3600, segment_seconds=10)
+        assert db.load_position_history(2, 0, 2000, interval=10) == []
+        try:
+            parse_retention({'raw_hours': 24, 'tiers': [{'interval': 7, 'hours': 48}]})
+            assert False, "Interval that does not divide an hour accepted"
+        except ValueError:
+            pass
+        print("✓ History rolled up through its retention tiers and expired")
+        
+        # The hub records every tick's positions batch
+        history = PositionHistory(db, flush_interval=0.05)
+        hub = WebSocketServer('localhost', 0, tick_rate=50, position_history=history)
+        async with running_hub(hub) as port:
+            ws = await websockets.connect(f"ws://localhost:{port}/?server_id=4")
+            # JSON parses 1e999 as inf; it must not reach history (or end the tick)
+            await ws.send('{"type": "position_update", "player": {"user_id": 8, "x": 1e999, "y": 5}}')
+            for step in range(3):
+                await ws.send(json.dumps({'type': 'position_update',
+                                          'player': {'user_id': 9, 'x': 10 * step, 'y': 5}}))
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+            await ws.close()
+        recorded = db.load_position_history(4, 0, time.time() + 1, user_id=9)
+        assert [row['x'] for row in recorded] == [0, 10, 20], recorded
+        assert db.load_position_history(4, 0, time.time() + 1, user_id=8) == []
+        history.record(4, [{'user_id': 8, 'x': float('inf'), 'y': 5}])
+        assert not history.pending_rows
+        print("✓ Hub position batches recorded as history; non-finite coordinates skipped")
+        db.close()
+
+
+async def test_server_poller():
+    import websockets
+    from core.server_poller import ServerPoller
+    from core.websocket_server import WebSocketServer
+    
+    class FakeServerManager:
+        def __init__(self, servers):
+            self.servers = servers
+        
+        def get_enabled_servers(self):
+            return [s for s in self.servers if s.get('enabled', False)]
+    
+    class FakeConnector:
+        # Port 9999 never answers a position poll in time
+        def __init__(self, ip, port):
+            self.port = port
+            self.connected = False
+        
+        async def connect(self):
+            self.connected = True
+            return True
+        
+        async def disconnect(self):
+            self.connected = False
+        
+        async def get_player_positions(self):
+            if self.port == 9999:
+                await asyncio.sleep(10)
+            return [{'user_id': self.port, 'username': f'P{self.port}', 'x': 1.0, 'y': 2.0, 'team': 'blue'}]
+        
+        async def get_server_info(self):
+            return {'name': f'Server {self.port}', 'map': 'Everon', 'player_count': 1, 'max_players': 64}
+    
+    # Connectors get the query port (17777 unless set), so the fakes are told apart by it
+    servers = [{'id': server_id, 'name': f'S{server_id}', 'ip': '127.0.0.1', 'port': 2302,
+                'query_port': 2300 + server_id, 'enabled': True, 'poll_interval': 0.02} for server_id in range(1, 31)]
+    servers.append({'id': 99, 'name': 'Slow', 'ip': '127.0.0.1', 'port': 2302, 'query_port': 9999, 'enabled': True})
+    servers.append({'id': 100, 'name': 'Off', 'ip': '127.0.0.1', 'port': 2302, 'query_port': 2400, 'enabled': False})
+    manager = FakeServerManager(servers)
+    # Constant rates and no budget limit: only concurrency is under test here
+    poller = ServerPoller(manager, connector_factory=FakeConnector, timeout=0.2, refresh_interval=3600,
+                          idle_interval=0.02, unwatched_interval=0.02, budget=10000)
+    hub = WebSocketServer('localhost', 0, tick_rate=50, server_poller=poller)
+    async with running_hub(hub) as port:
+        ws = await websockets.connect(f"ws://localhost:{port}/?server_id=7")
+        await asyncio.sleep(0.5)
+        stats = poller.stats()['servers']
+        assert set(stats) == set(range(1, 31)) | {99}, sorted(stats)
+        assert all(stats[server_id]['polls'] >= 10 for server_id in range(1, 31)), stats
+        assert stats[99]['polls'] == 0 and stats[99]['timeouts'] >= 1, stats[99]
+        print(f"✓ 30 servers polled concurrently ({min(s['polls'] for s in stats.values() if s['polls'])}+ polls each) "
+              f"while one timed out")
+        
+        assert hub.rooms[7].player_positions[2307]['username'] == 'P2307'
+        assert hub.rooms[12].server_info['name'] == 'Server 2312'
+        assert hub.get_metrics()['server_poller']['servers'][7]['connected']
+        seen = set()
+        while not {'server_info', 'positions_batch'} <= seen:
+            seen.add((await recv_json(ws))['type'])
+        print("✓ Polled positions and server info delivered to the room's clients")
+        
+        # Config changes are picked up without restarting the hub
+        servers[0]['enabled'] = False
+        servers[1]['query_port'] = 2500
+        poller.refresh()
+        await asyncio.sleep(0.2)
+        assert 1 not in poller.servers and poller.servers[2].connector.port == 2500
+        print("✓ Disabled and edited servers picked up on refresh")
+        await ws.close()
+    assert not poller.servers
+
+
+async def test_adaptive_polling():
+    import websockets
+    from core.server_poller import ServerPoller
+    from core.websocket_server import WebSocketServer
+    
+    class FakeServerManager:
+        poll_budget = 1000
+        
+        def __init__(self, servers):
+            self.servers = servers
+        
+        def get_enabled_servers(self):
+            return self.servers
+    
+    # Server 1: players moving; 2: players standing still; 3: moving but
+    # unwatched; 4: empty
+    class FakeConnector:
+        def __init__(self, ip, port):
+            self.port = port
+            self.connected = False
+            self.x = 0.0
+        
+        async def connect(self):
+            self.connected = True
+            return True
+        
+        async def disconnect(self):
+            self.connected = False
+        
+        async def get_player_positions(self):
+            if self.port == 4:
+                return []
+            if self.port in (1, 3):
+                self.x += 5
+            return [{'user_id': 1, 'username': 'P1', 'x': self.x, 'y': 0.0, 'team': 'blue'}]
+        
+        async def get_server_info(self):
+            return {'name': f'Server {self.port}'}
+    
+    servers = [{'id': server_id, 'name': f'S{server_id}', 'ip': '127.0.0.1', 'port': 2302, 'query_port': server_id,
+                'enabled': True, 'poll_interval': 0.02} for server_id in range(1, 5)]
+    poller = ServerPoller(FakeServerManager(servers), connector_factory=FakeConnector, refresh_interval=3600,
+                          idle_interval=0.2, unwatched_interval=0.5)
+    hub = WebSocketServer('localhost', 0, tick_rate=50, server_poller=poller)
+    async with running_hub(hub) as port:
+        watchers = [await websockets.connect(f"ws://localhost:{port}/?server_id={server_id}")
+                    for server_id in (1, 2, 4)]
+        await asyncio.sleep(1.0)
+        stats = poller.stats()
+        servers_stats = stats['servers']
+        assert [servers_stats[server_id]['interval_ms'] for server_id in range(1, 5)] == [20, 200, 500, 200], stats
+        assert servers_stats[1]['polls'] > 3 * servers_stats[2]['polls'], stats
+        assert stats['throttle'] == 1 and stats['rate_hz'] == 50 + 5 + 2 + 5, stats
+        print(f"✓ Poll rates adapted: active {servers_stats[1]['rate_hz']} Hz, idle {servers_stats[2]['rate_hz']} Hz, "
+              f"unwatched {servers_stats[3]['rate_hz']} Hz")
+        
+        # A new watcher brings the server back to the fast rate without waiting
+        polls = servers_stats[3]['polls']
+        watchers.append(await websockets.connect(f"ws://localhost:{port}/?server_id=3"))
+        await asyncio.sleep(0.2)
+        assert poller.stats()['servers'][3]['interval_ms'] == 20
+        assert poller.stats()['servers'][3]['polls'] >= polls + 3
+        print("✓ Subscribing woke the server's poller")
+        
+        # Over budget, every interval is stretched by the same factor
+        poller.budget = 25
+        stats = poller.stats()
+        assert abs(stats['rate_hz'] - 25) < 0.01 and stats['throttle'] > 1, stats
+        assert stats['servers'][1]['interval_ms'] == round(20 * stats['throttle'], 1)
+        print(f"✓ Demand of {stats['demand_hz']} polls/s held to a budget of {stats['budget_hz']}")
+        for ws in watchers:
+            await ws.close()
+
+
+async def test_poll_interval_limits():
+    from core.server_poller import ServerPoller, MIN_POLL_INTERVAL
+    
+    class FakeServerManager:
+        poll_budget = 1000
+        
+        def __init__(self, servers):
+            self.servers = servers
+        
+        def get_enabled_servers(self):
+            return self.servers
+    
+    class FakeHub:
+        def update_positions(self, server_id, positions):
+            pass
+        
+        def update_server_info(self, server_id, info):
+            pass
+        
+        def is_watched(self, server_id):
+            return True
+    
+    class FakeConnector:
+        def __init__(self, ip, port):
+            self.connected = False
+            self.x = 0.0
+        
+        async def connect(self):
+            self.connected = True
+            return True
+        
+        async def disconnect(self):
+            self.connected = False
+        
+        async def get_player_positions(self):
+            self.x += 5
+            return [{'user_id': 1, 'username': 'P1', 'x': self.x, 'y': 0.0, 'team': 'blue'}]
+        
+        async def get_server_info(self):
+            return {'name': 'Server'}
+    
+    # Zero and negative intervals in the config are raised to the minimum
+    servers = [{'id': server_id, 'name': f'S{server_id}', 'ip': '127.0.0.1', 'port': 2302, 'enabled': True,
+                'poll_interval': interval} for server_id, interval in ((1, 0), (2, -1))]
+    poller = ServerPoller(FakeServerManager(servers), connector_factory=FakeConnector, refresh_interval=3600,
+                          idle_interval=0, unwatched_interval=0)
+    poller.start(FakeHub())
+    await asyncio.sleep(0.3)
+    stats = poller.stats()
+    for server_id in (1, 2):
+        assert stats['servers'][server_id]['interval_ms'] == MIN_POLL_INTERVAL * 1000, stats
+        assert not poller.servers[server_id].task.done()
+    await poller.stop()
+    print(f"✓ Zero and negative poll intervals clamped to {MIN_POLL_INTERVAL}s")
+
+
+async def test_player_simulation():
+    from core import player_simulation
+    from core.player_simulation import PlayerSimulation, WAYPOINTS
+    from core.arma_server_connector import ArmaServerConnector
+    from core.server_poller import ServerPoller
+    from core.websocket_server import WebSocketServer
+    
+    if player_simulation.np is None:
+        print("- numpy not installed, skipping player simulation test")
+        return
+    
+    # Random walk: everyone moves, nobody leaves the map
+    simulation = PlayerSimulation(10000, seed=7)
+    start_x = simulation.x.copy()
+    for _ in range(50):
+        simulation.step()
+    assert (simulation.x != start_x).all()
+    assert simulation.x.min() >= 0 and simulation.x.max() <= simulation.map_size
+    positions = simulation.positions()
+    assert len(positions) == 10000 and len({p['timestamp'] for p in positions}) == 1
+    assert positions[0]['username'] == 'Sim 1' and positions[0]['team'] in player_simulation.TEAMS
+    print("✓ 10000 simulated players advanced by random walk")
+    
+    # Waypoints: players walk at `speed` towards their targets
+    walkers = PlayerSimulation(100, mode=WAYPOINTS, speed=10, seed=7)
+    before = walkers.x.copy(), walkers.y.copy()
+    walkers.step(1.0)
+    moved = ((walkers.x - before[0]) ** 2 + (walkers.y - before[1]) ** 2) ** 0.5
+    assert abs(moved.max() - 10) < 1e-6, moved.max()
+    medic = walkers.add_player('Medic', team='blue')
+    walkers.remove_players(walkers.ids[:50])
+    assert walkers.count == 51 and walkers.positions()[-1]['username'] == 'Medic'
+    assert walkers.positions()[-1]['user_id'] == medic
+    print("✓ Waypoint movement and adding/removing players")
+    
+    class SimulatedServers:
+        poll_budget = 1000
+        servers = [{'id': 1, 'name': 'Sim', 'ip': '127.0.0.1', 'port': 1, 'query_port': 1, 'enabled': True,
+                    'poll_interval': 0.05}]
+        
+        def get_enabled_servers(self):
+            return self.servers
+    
+    def simulated_connector(ip, port):
+        return ArmaServerConnector(ip, port, simulation=PlayerSimulation(5000, seed=port))
+    
+    poller = ServerPoller(SimulatedServers(), connector_factory=simulated_connector, refresh_interval=3600)
+    hub = WebSocketServer('localhost', 0, tick_rate=20, server_poller=poller)
+    async with running_hub(hub):
+        await asyncio.sleep(0.8)
+        assert len(hub.rooms[1].player_positions) == 5000
+        assert poller.stats()['servers'][1]['players'] == 5000
+    print("✓ 5000 simulated players polled into the hub")
+
+
+async def test_position_batches():
+    import websockets
+    from array import array
+    from core.position_batch import PositionBatch
+    from core.websocket_server import WebSocketServer
+    from core import wire_format
+    
+    if wire_format.msgpack is None:
+        print("- msgpack not installed, skipping position batch test")
+        return
+    
+    # Columns are views of the producer's buffers, not copies
+    ids = array('q', [1, 2, 3])
+    xs = array('d', [10.0, 20.0, 30.0])
+    ys = array('d', [5.0, 6.0, 7.0])
+    teams = array('B', [0, 1, 3])
+    batch = PositionBatch(ids, xs, ys, teams, 1700000000.0, ['A', 'B', 'C'])
+    assert batch.x.obj is xs and len(batch) == 3
+    assert batch.players()[1]['username'] == 'B' and batch.players()[1]['team'] == 'red'
+    message = wire_format.decode(wire_format.encode(batch.columns_message(9), wire_format.MSGPACK))
+    assert message['count'] == 3 and len(message['ids']) == 24
+    assert PositionBatch.from_message(message).players() == batch.players()
+    print("✓ PositionBatch wraps buffers and round-trips through MessagePack")
+    
+    hub = WebSocketServer('localhost', 0, tick_rate=50)
+    async with running_hub(hub) as port:
+        columns = await websockets.connect(f"ws://localhost:{port}/?server_id=9&positions=columns",
+                                           subprotocols=wire_format.SUBPROTOCOLS)
+        hub.update_positions(9, PositionBatch(ids, xs, ys, teams, usernames=['A', 'B', 'C']))
+        message = wire_format.decode(await asyncio.wait_for(columns.recv(), timeout=2.0))
+        assert message['type'] == 'positions_columns' and message['names'] == ['A', 'B', 'C'], message
+        assert [p['x'] for p in PositionBatch.from_message(message).players()] == [10.0, 20.0, 30.0]
+        room = hub.rooms[9]
+        assert not room._player_positions and room._unmerged_batch._players is None
+        print("✓ Column clients get positions_columns frames; no per-player dicts were built")
+        
+        # Same roster: the names are left out
+        hub.update_positions(9, PositionBatch(ids, array('d', [11.0, 21.0, 31.0]), ys, teams,
+                                              usernames=['A', 'B', 'C']))
+        message = wire_format.decode(await asyncio.wait_for(columns.recv(), timeout=2.0))
+        assert 'names' not in message and array('d', message['x']).tolist() == [11.0, 21.0, 31.0]
+        
+        # JSON cannot carry the columns; a joining JSON client gets dicts of the latest batch
+        legacy = await websockets.connect(f"ws://localhost:{port}/?server_id=9&positions=columns")
+        sync = await recv_json(legacy)
+        assert sync['type'] == 'positions_sync' and [p['x'] for p in sync['positions']] == [11.0, 21.0, 31.0]
+        await legacy.send(json.dumps({'type': 'hello', 'positions': 'columns'}))
+        assert (await recv_json(legacy))['positions'] == 'full'
+        hub.update_positions(9, PositionBatch(ids, xs, ys, teams, usernames=['A', 'B', 'C']))
+        frame = await recv_json(legacy)
+        assert frame['type'] == 'positions_batch' and [p['username'] for p in frame['positions']] == ['A', 'B', 'C']
+        message = wire_format.decode(await asyncio.wait_for(columns.recv(), timeout=2.0))
+        assert message['type'] == 'positions_columns' and message['count'] == 3
+        print("✓ JSON clients in the same room get the batch as positions_batch")
+        
+        for ws in (columns, legacy):
+            await ws.close()
+
+
+try:
+    asyncio.run(test_rooms())
+    asyncio.run(test_tick_batching())
+    test_delta_codec()
+    asyncio.run(test_delta_clients())
+    asyncio.run(test_binary_encoding())
+    asyncio.run(test_backpressure())
+    asyncio.run(test_snapshot_cache())
+    asyncio.run(test_shared_bus())
+    asyncio.run(test_unix_socket_bus())
+    asyncio.run(test_resume())
+    test_spatial_grid()
+    asyncio.run(test_viewport())
+    asyncio.run(test_marker_persistence())
+    asyncio.run(test_async_database())
+    asyncio.run(test_position_history())
+    asyncio.run(test_server_poller())
+    asyncio.run(test_adaptive_polling())
+    asyncio.run(test_poll_interval_limits())
+    asyncio.run(test_player_simulation())
+    asyncio.run(test_position_batches())
+    
+    print("\n" + "=" * 60)
+    print("✓ ALL WEBSOCKET HUB TESTS PASSED!")
+    print("=" * 60)
+
+except Exception as e:
+    print(f"\n✗ Error: {e}")
+    import traceback
+    traceback.print_exc()
+    sys.exit(1)